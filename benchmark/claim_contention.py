@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+import logging
+import time
+import uuid
+from asyncio import AbstractEventLoop
+
+import aiomysql
+from aiomysql import Pool
+
+from jasyncq.repository.model.task import TaskRowIn
+from jasyncq.repository.schema import side_table_names
+from jasyncq.repository.tasks import TaskRepository, ClaimMode
+
+
+async def _produce(repository: TaskRepository, queue_name: str, total: int, batch_size: int):
+    for _ in range(0, total, batch_size):
+        await repository.insert_tasks([
+            TaskRowIn(task={'payload': 'x' * 64}, queue_name=queue_name)
+            for _ in range(batch_size)
+        ])
+
+
+async def _consume(
+    repository: TaskRepository,
+    queue_name: str,
+    batch_size: int,
+    deadline: float,
+) -> int:
+    consumed = 0
+    while time.time() < deadline:
+        tasks = await repository.fetch_scheduled_tasks(
+            0, batch_size, queue_name, ignore_dependency=True)
+        if not tasks:
+            await asyncio.sleep(0.01)
+            continue
+        consumed += len(tasks)
+        await repository.delete_tasks([task.uuid for task in tasks])
+    return consumed
+
+
+async def measure(pool: Pool, claim_mode: ClaimMode, args: argparse.Namespace) -> float:
+    repository = TaskRepository(
+        pool=pool,
+        topic_name=f'bench_{uuid.uuid4().hex[:10]}',
+        claim_mode=claim_mode,
+    )
+    await repository.initialize()
+    queue_name = 'QUEUE_BENCH'
+    await _produce(repository, queue_name, args.backlog, args.batch_size)
+
+    started_at = time.time()
+    deadline = started_at + args.seconds
+    # NOTE: Producer keeps inserting while consumers claim to measure mixed contention
+    producer = asyncio.ensure_future(
+        _produce(repository, queue_name, args.backlog, args.batch_size))
+    consumed = await asyncio.gather(*[
+        _consume(repository, queue_name, args.batch_size, deadline)
+        for _ in range(args.workers)
+    ])
+    elapsed = time.time() - started_at
+    await producer
+    await repository._execute([
+        f'DROP TABLE IF EXISTS {table_name}'
+        for table_name in [repository.table_name, *side_table_names(repository.table_name)]
+    ])
+    return sum(consumed) / elapsed
+
+
+async def run(loop: AbstractEventLoop, args: argparse.Namespace):
+    pool = await aiomysql.create_pool(
+        host=args.host,
+        port=args.port,
+        user=args.user,
+        db=args.db,
+        loop=loop,
+        autocommit=False,
+        maxsize=args.workers + 2,
+    )
+    for claim_mode in [ClaimMode.LOCK_TABLES, ClaimMode.SKIP_LOCKED]:
+        throughput = await measure(pool, claim_mode, args)
+        print(f'{claim_mode.value:>12}: {throughput:10.1f} tasks/s ({args.workers} workers)')
+    pool.close()
+    await pool.wait_closed()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare claim throughput by ClaimMode')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--db', default='test')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--backlog', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--seconds', type=int, default=10)
+
+    logging.basicConfig(level=logging.WARNING)
+    event_loop = asyncio.get_event_loop()
+    event_loop.run_until_complete(run(loop=event_loop, args=parser.parse_args()))
@@ -0,0 +1,67 @@
+import argparse
+import random
+import string
+import time
+from typing import Any, Dict, List
+
+from jasyncq.repository.codec import PayloadCodec, Serializer, Compression
+
+
+def _payload(depth: int, width: int) -> Dict[str, Any]:
+    rng = random.Random(depth * 1000 + width)
+
+    def _node(level: int) -> Dict[str, Any]:
+        node = {
+            f'key_{index}': rng.choice([
+                rng.randint(0, 1 << 30),
+                rng.random(),
+                ''.join(rng.choice(string.ascii_letters) for _ in range(24)),
+                [rng.randint(0, 100) for _ in range(8)],
+            ])
+            for index in range(width)
+        }
+        if level < depth:
+            node['children'] = [_node(level + 1) for _ in range(2)]
+        return node
+
+    return _node(0)
+
+
+def _codecs(compression_threshold: int) -> List[PayloadCodec]:
+    codecs = []
+    for serializer in Serializer:
+        for compression in Compression:
+            try:
+                codecs.append(PayloadCodec(serializer, compression, compression_threshold))
+            except ImportError as e:
+                print(f'skip {serializer.name}+{compression.name}: {e}')
+    return codecs
+
+
+def run(args: argparse.Namespace):
+    payload = _payload(args.depth, args.width)
+    for codec in _codecs(args.compression_threshold):
+        started_at = time.process_time()
+        for _ in range(args.number):
+            encoded, tag = codec.encode(payload)
+        encode_us = (time.process_time() - started_at) / args.number * 1e6
+
+        started_at = time.process_time()
+        for _ in range(args.number):
+            codec.decode(encoded, tag)
+        decode_us = (time.process_time() - started_at) / args.number * 1e6
+
+        name = f'{codec.serializer.name}+{codec.compression.name}'
+        print(
+            f'{name:>16}: encode {encode_us:9.1f} us, decode {decode_us:9.1f} us (CPU), '
+            f'{len(encoded):8d} bytes on wire'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare CPU time and size of payload codecs')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--width', type=int, default=20)
+    parser.add_argument('--number', type=int, default=200)
+    parser.add_argument('--compression-threshold', type=int, default=1024)
+    run(parser.parse_args())
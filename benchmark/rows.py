@@ -0,0 +1,163 @@
+import argparse
+import json
+import time
+from typing import Optional, List, Callable
+from uuid import UUID
+
+from pydantic import BaseModel, validator
+
+from jasyncq.dispatcher.model.task import TaskOut, TaskIn
+from jasyncq.dispatcher.tasks import _task_out, _task_row_in
+from jasyncq.repository.model.task import TaskStatus, TaskRowIn, TaskRow, effective_priority
+from jasyncq.repository.tasks import TaskRepository
+from jasyncq.util import let_if, uuid7, uuid_str_from_binary, uuid_from_binary
+
+
+# NOTE: How rows were converted before (validated pydantic models for every pass)
+class LegacyTaskRow(BaseModel):
+    uuid: str
+    status: TaskStatus
+    progressed_at: int
+    scheduled_at: int
+    is_urgent: bool
+    task: dict
+    queue_name: str
+    depend_on: Optional[str] = None
+
+    _uuid_from_binary = validator('uuid', 'depend_on', pre=True, allow_reuse=True)(
+        uuid_str_from_binary)
+
+
+class LegacyTaskOut(BaseModel):
+    uuid: UUID
+    scheduled_at: int
+    task: dict
+    queue_name: str
+    depend_on: Optional[UUID] = None
+
+    _uuid_from_binary = validator('uuid', 'depend_on', pre=True, allow_reuse=True)(
+        uuid_from_binary)
+
+
+def _legacy_task_out(task_row: LegacyTaskRow) -> LegacyTaskOut:
+    return LegacyTaskOut(
+        uuid=UUID(task_row.uuid),
+        scheduled_at=task_row.scheduled_at,
+        task=task_row.task,
+        queue_name=task_row.queue_name,
+        depend_on=let_if(task_row.depend_on, UUID),
+    )
+
+
+def fetch_legacy(repository: TaskRepository, rows: List[tuple]) -> List[LegacyTaskOut]:
+    return [
+        _legacy_task_out(LegacyTaskRow(
+            uuid=row[0],
+            status=row[1],
+            progressed_at=row[2],
+            scheduled_at=row[3],
+            is_urgent=row[4],
+            task=repository.codec.decode(row[5], row[8]),
+            queue_name=row[6],
+            depend_on=row[7],
+        ))
+        for row in rows
+    ]
+
+
+def fetch_current(repository: TaskRepository, rows: List[tuple]) -> List[TaskOut]:
+    return [_task_out(repository._task_row(row)) for row in rows]
+
+
+def apply_legacy(tasks: List[TaskIn]) -> List[LegacyTaskOut]:
+    task_rows_in = [
+        TaskRowIn(
+            scheduled_at=task.scheduled_at,
+            is_urgent=task.is_urgent,
+            task=task.task,
+            queue_name=task.queue_name,
+            depend_on=let_if(task.depend_on, str),
+        )
+        for task in tasks
+    ]
+    return [
+        _legacy_task_out(LegacyTaskRow(
+            uuid=str(uuid7()),
+            status=TaskStatus.QUEUED,
+            progressed_at=0,
+            scheduled_at=task.scheduled_at,
+            is_urgent=task.is_urgent,
+            task=task.task,
+            queue_name=task.queue_name,
+            depend_on=task.depend_on,
+        ))
+        for task in task_rows_in
+    ]
+
+
+def apply_current(tasks: List[TaskIn]) -> List[TaskOut]:
+    # NOTE: Same conversions as TasksDispatcher.apply_tasks and TaskRepository.insert_tasks
+    task_rows_in = [_task_row_in(task) for task in tasks]
+    return [
+        _task_out(TaskRow(
+            uuid=str(uuid7()),
+            status=TaskStatus.QUEUED,
+            progressed_at=0,
+            scheduled_at=task.scheduled_at,
+            priority=effective_priority(task.priority, task.is_urgent),
+            task=task.task,
+            queue_name=task.queue_name,
+            depend_on=task.depend_on,
+        ))
+        for task in task_rows_in
+    ]
+
+
+def _measure(func: Callable[[], list], repeat: int) -> float:
+    elapsed = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        func()
+        elapsed.append(time.perf_counter() - started_at)
+    return min(elapsed)
+
+
+def _report(
+    name: str,
+    before: Callable[[], list],
+    after: Callable[[], list],
+    rows: int,
+    repeat: int,
+):
+    before_us = _measure(before, repeat) / rows * 1e6
+    after_us = _measure(after, repeat) / rows * 1e6
+    print(
+        f'{name:>6} x{rows}: {before_us:7.2f} us -> {after_us:7.2f} us per task '
+        f'({before_us / after_us:.1f}x)'
+    )
+
+
+def run(args: argparse.Namespace):
+    repository = TaskRepository(pool=None, topic_name='bench')
+    task = json.dumps({'id': 1, 'payload': 'x' * 64}).encode()
+    rows = [
+        (uuid7().bytes, int(TaskStatus.QUEUED), 0, 0, 0, task, 'QUEUE', uuid7().bytes, 0)
+        for _ in range(args.rows)
+    ]
+    tasks = [TaskIn(task={'id': index}, queue_name='QUEUE') for index in range(args.rows)]
+    _report(
+        'fetch',
+        lambda: fetch_legacy(repository, rows),
+        lambda: fetch_current(repository, rows),
+        args.rows,
+        args.repeat,
+    )
+    _report(
+        'apply', lambda: apply_legacy(tasks), lambda: apply_current(tasks), args.rows, args.repeat)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare per-task cost of row conversions')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    run(parser.parse_args())
@@ -0,0 +1,123 @@
+import argparse
+import json
+import time
+import timeit
+import uuid
+from typing import Callable
+
+from pymysql.converters import escape_item
+from pypika import Query, Order, Table
+
+from jasyncq.repository.model.task import TaskStatus
+from jasyncq.repository.tasks import TaskRepository, FetchFilter
+
+CHARSET = 'utf8mb4'
+
+
+def _interpolate(statement: str, args) -> str:
+    # NOTE: Same as what driver does with parameters before sending query
+    return statement % tuple(escape_item(arg, CHARSET) for arg in args)
+
+
+def build_claim_query_per_call(repository: TaskRepository, queue_name: str) -> str:
+    # NOTE: How claim query was built for every call before statements were cached
+    task = Table(repository.table_name)
+    task_child = Table(repository.table_name).as_(f'{repository.table_name}_child')
+    fetch_filter = (task.status == int(TaskStatus.QUEUED))
+    fetch_filter &= (task.scheduled_at <= time.time())
+    fetch_filter &= (task.queue_name == queue_name)
+    fetch_filter &= task_child.uuid.isnull()
+    return Query.from_(
+        task
+    ).left_join(
+        task_child
+    ).on(
+        task.depend_on == task_child.uuid
+    ).select(
+        *[task.field(column.name) for column in repository.task__columns]
+    ).where(fetch_filter).orderby(
+        task.is_urgent,
+        order=Order.desc,
+    ).offset(0).limit(10).get_sql(quote_char='`')
+
+
+def build_claim_query_cached(repository: TaskRepository, queue_name: str) -> str:
+    statement = repository._claim_statement(FetchFilter.SCHEDULED, False)
+    return _interpolate(statement, (time.time(), queue_name, 10, 0))
+
+
+def build_insert_query_per_call(repository: TaskRepository, rows: int) -> str:
+    insert_tasks_query = Query.into(repository.task).columns(*repository.task__columns)
+    for _ in range(rows):
+        insert_tasks_query = insert_tasks_query.insert(
+            str(uuid.uuid4()), int(TaskStatus.QUEUED), 0, 0, False, json.dumps({'a': 1}), 'QUEUE',
+            None,
+        )
+    return insert_tasks_query.get_sql(quote_char='`')
+
+
+def build_insert_query_cached(repository: TaskRepository, rows: int) -> str:
+    statement = repository._insert_tasks_statement
+    values_start = statement.index('VALUES') + len('VALUES ')
+    placeholders = statement.count('%s')
+    values = ','.join(
+        _interpolate(statement[values_start:], (
+            uuid.uuid4().bytes, int(TaskStatus.QUEUED), 0, 0, False, json.dumps({'a': 1}).encode(),
+            'QUEUE', None,
+        ) + (0,) * (placeholders - 8))  # NOTE: task_codec, pending_parents...
+        for _ in range(rows)
+    )
+    return statement[:values_start] + values
+
+
+def build_delete_query_per_call(repository: TaskRepository, task_ids) -> str:
+    return Query.from_(repository.task).where(
+        repository.task__uuid.isin(task_ids)
+    ).delete().get_sql(quote_char='`')
+
+
+def build_delete_query_cached(repository: TaskRepository, task_ids) -> str:
+    return _interpolate(
+        repository._delete_tasks_statement,
+        ([uuid.UUID(task_id).bytes for task_id in task_ids],),
+    )
+
+
+def _report(name: str, before: Callable[[], str], after: Callable[[], str], number: int):
+    before_us = min(timeit.repeat(before, number=number, repeat=3)) / number * 1e6
+    after_us = min(timeit.repeat(after, number=number, repeat=3)) / number * 1e6
+    print(
+        f'{name:>14}: {before_us:9.1f} us -> {after_us:9.1f} us per call '
+        f'({before_us / after_us:.1f}x)'
+    )
+
+
+def run(args: argparse.Namespace):
+    repository = TaskRepository(pool=None, topic_name='bench')
+    task_ids = [str(uuid.uuid4()) for _ in range(args.batch_size)]
+    _report(
+        'claim',
+        lambda: build_claim_query_per_call(repository, 'QUEUE'),
+        lambda: build_claim_query_cached(repository, 'QUEUE'),
+        args.number,
+    )
+    _report(
+        f'insert x{args.batch_size}',
+        lambda: build_insert_query_per_call(repository, args.batch_size),
+        lambda: build_insert_query_cached(repository, args.batch_size),
+        max(args.number // args.batch_size, 1),
+    )
+    _report(
+        f'delete x{args.batch_size}',
+        lambda: build_delete_query_per_call(repository, task_ids),
+        lambda: build_delete_query_cached(repository, task_ids),
+        args.number,
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare per-call PyPika query building with cached parameterized statements')
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    run(parser.parse_args())
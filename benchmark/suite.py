@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import platform
+import time
+import uuid
+from typing import List, Dict, Any, Callable, Awaitable, Optional
+
+import aiomysql
+from aiomysql import Pool
+
+from jasyncq.repository.abstract import AbstractTaskRepository
+from jasyncq.repository.model.task import TaskRowIn
+from jasyncq.repository.schema import side_table_names
+from jasyncq.repository.sharded import ShardedTaskRepository, ShardClaim
+from jasyncq.repository.tasks import TaskRepository, ClaimMode
+
+RESULT_FORMAT_VERSION = 1
+PAYLOAD = {'payload': 'x' * 64}
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    # NOTE: Nearest-rank percentiles in milliseconds
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def _rank(percentile: float) -> float:
+        index = max(math.ceil(percentile / 100 * len(values)) - 1, 0)
+        return values[min(index, len(values) - 1)] * 1000
+
+    return {
+        'count': len(values),
+        'p50_ms': _rank(50),
+        'p90_ms': _rank(90),
+        'p99_ms': _rank(99),
+        'max_ms': values[-1] * 1000,
+    }
+
+
+class Suite:
+    def __init__(self, pool: Pool, args: argparse.Namespace):
+        self.pool = pool
+        self.args = args
+
+    async def _repository(self) -> AbstractTaskRepository:
+        topic_name = f'bench_{uuid.uuid4().hex[:10]}'
+        if self.args.shards > 1:
+            repository = ShardedTaskRepository.for_tables(
+                pool=self.pool,
+                topic_name=topic_name,
+                shard_count=self.args.shards,
+                shard_claim=ShardClaim(self.args.shard_claim),
+                claim_mode=ClaimMode(self.args.claim_mode),
+            )
+        else:
+            repository = TaskRepository(
+                pool=self.pool,
+                topic_name=topic_name,
+                claim_mode=ClaimMode(self.args.claim_mode),
+            )
+        await repository.initialize()
+        return repository
+
+    async def _drop(self, repository: AbstractTaskRepository):
+        for shard in getattr(repository, 'shards', [repository]):
+            await shard._execute([
+                f'DROP TABLE IF EXISTS {table_name}'
+                for table_name in [shard.table_name, *side_table_names(shard.table_name)]
+            ])
+
+    async def _fill(self, repository: AbstractTaskRepository, queue_name: str, count: int):
+        tasks = (TaskRowIn(task=PAYLOAD, queue_name=queue_name) for _ in range(count))
+        async for _ in repository.insert_tasks_stream(tasks, chunk_size=self.args.fill_chunk_size):
+            pass
+
+    async def _consume(
+        self,
+        repository: AbstractTaskRepository,
+        queue_name: str,
+        batch_size: int,
+        deadline: float,
+        latencies: List[float],
+        ignore_dependency: bool = False,
+    ) -> int:
+        consumed = 0
+        while time.perf_counter() < deadline:
+            started_at = time.perf_counter()
+            tasks = await repository.fetch_tasks(
+                batch_size, queue_name, check_term_seconds=3600,
+                ignore_dependency=ignore_dependency,
+            )
+            latencies.append(time.perf_counter() - started_at)
+            if not tasks:
+                await asyncio.sleep(0.001)
+                continue
+            consumed += len(tasks)
+            await repository.delete_tasks([task.uuid for task in tasks])
+        return consumed
+
+    async def producer(self) -> Dict[str, Any]:
+        results = {}
+        for batch_size in self.args.producer_batch_sizes:
+            repository = await self._repository()
+            latencies = []
+            started_at = time.perf_counter()
+            for _ in range(max(self.args.producer_tasks // batch_size, 1)):
+                inserting_at = time.perf_counter()
+                await repository.insert_tasks([
+                    TaskRowIn(task=PAYLOAD, queue_name='QUEUE') for _ in range(batch_size)
+                ])
+                latencies.append(time.perf_counter() - inserting_at)
+            elapsed = time.perf_counter() - started_at
+            await self._drop(repository)
+            results[str(batch_size)] = {
+                'tasks_per_second': len(latencies) * batch_size / elapsed,
+                'insert_latency': percentiles(latencies),
+            }
+        return results
+
+    async def consumer_scaling(self) -> Dict[str, Any]:
+        results = {}
+        for workers in self.args.workers:
+            repository = await self._repository()
+            await self._fill(repository, 'QUEUE', self.args.backlog)
+            latencies = []
+            started_at = time.perf_counter()
+            consumed = await asyncio.gather(*[
+                self._consume(
+                    repository, 'QUEUE', self.args.batch_size,
+                    started_at + self.args.seconds, latencies,
+                )
+                for _ in range(workers)
+            ])
+            elapsed = time.perf_counter() - started_at
+            await self._drop(repository)
+            results[str(workers)] = {
+                'tasks_per_second': sum(consumed) / elapsed,
+                'claim_latency': percentiles(latencies),
+            }
+        return results
+
+    async def claim_latency(self) -> Dict[str, Any]:
+        results = {}
+        for backlog in self.args.backlogs:
+            repository = await self._repository()
+            await self._fill(repository, 'QUEUE', backlog)
+            latencies = []
+            for _ in range(self.args.samples):
+                started_at = time.perf_counter()
+                tasks = await repository.fetch_tasks(
+                    self.args.batch_size, 'QUEUE', check_term_seconds=3600)
+                latencies.append(time.perf_counter() - started_at)
+                # NOTE: Claimed tasks are completed to keep backlog size, but not timed
+                await repository.delete_tasks([task.uuid for task in tasks])
+            await self._drop(repository)
+            results[str(backlog)] = percentiles(latencies)
+        return results
+
+    async def dependency(self) -> Dict[str, Any]:
+        results = {}
+        for ignore_dependency in [False, True]:
+            repository = await self._repository()
+            # NOTE: Half of backlog are parents and other half depend on them
+            parents = []
+            for _ in range(0, self.args.backlog // 2, self.args.fill_chunk_size):
+                parents.extend(await repository.insert_tasks([
+                    TaskRowIn(task=PAYLOAD, queue_name='QUEUE')
+                    for _ in range(self.args.fill_chunk_size)
+                ]))
+            for index in range(0, len(parents), self.args.fill_chunk_size):
+                await repository.insert_tasks([
+                    TaskRowIn(task=PAYLOAD, queue_name='QUEUE', depend_on=parent.uuid)
+                    for parent in parents[index:index + self.args.fill_chunk_size]
+                ])
+            latencies = []
+            started_at = time.perf_counter()
+            consumed = await asyncio.gather(*[
+                self._consume(
+                    repository, 'QUEUE', self.args.batch_size,
+                    started_at + self.args.seconds, latencies, ignore_dependency,
+                )
+                for _ in range(max(self.args.workers))
+            ])
+            elapsed = time.perf_counter() - started_at
+            await self._drop(repository)
+            results['ignore_dependency' if ignore_dependency else 'dependency'] = {
+                'tasks_per_second': sum(consumed) / elapsed,
+                'claim_latency': percentiles(latencies),
+            }
+        return results
+
+    async def mixed(self) -> Dict[str, Any]:
+        repository = await self._repository()
+        await self._fill(repository, 'QUEUE', self.args.backlog)
+        started_at = time.perf_counter()
+        deadline = started_at + self.args.seconds
+        insert_latencies = []
+
+        async def _produce() -> int:
+            produced = 0
+            while time.perf_counter() < deadline:
+                inserting_at = time.perf_counter()
+                await repository.insert_tasks([
+                    TaskRowIn(task=PAYLOAD, queue_name='QUEUE')
+                    for _ in range(self.args.batch_size)
+                ])
+                insert_latencies.append(time.perf_counter() - inserting_at)
+                produced += self.args.batch_size
+            return produced
+
+        claim_latencies = []
+        produced = asyncio.gather(*[_produce() for _ in range(self.args.producers)])
+        consumed = await asyncio.gather(*[
+            self._consume(repository, 'QUEUE', self.args.batch_size, deadline, claim_latencies)
+            for _ in range(max(self.args.workers))
+        ])
+        produced = await produced
+        elapsed = time.perf_counter() - started_at
+        await self._drop(repository)
+        return {
+            'produced_per_second': sum(produced) / elapsed,
+            'consumed_per_second': sum(consumed) / elapsed,
+            'insert_latency': percentiles(insert_latencies),
+            'claim_latency': percentiles(claim_latencies),
+        }
+
+
+SCENARIOS: Dict[str, Callable[[Suite], Awaitable[Dict[str, Any]]]] = {
+    'producer': Suite.producer,
+    'consumer_scaling': Suite.consumer_scaling,
+    'claim_latency': Suite.claim_latency,
+    'dependency': Suite.dependency,
+    'mixed': Suite.mixed,
+}
+
+
+def _version() -> Optional[str]:
+    try:
+        from importlib.metadata import version
+        return version('jasyncq')
+    except Exception:  # NOTE: Python 3.7 or not installed as package
+        return None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], path: str = ''):
+    # NOTE: Prints ratio (current / baseline) of every number found in both results
+    for key, value in results.items():
+        key_path = f'{path}.{key}' if path else key
+        base = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            compare(value, base or {}, key_path)
+        elif isinstance(value, (int, float)) and isinstance(base, (int, float)) and base:
+            print(f'{key_path:<60} {base:14.3f} -> {value:14.3f} ({value / base:6.2f}x)')
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    pool = await aiomysql.create_pool(
+        host=args.host,
+        port=args.port,
+        user=args.user,
+        db=args.db,
+        autocommit=False,
+        maxsize=max(args.workers) + args.producers + 4,
+    )
+    try:
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute('SELECT VERSION()')
+                (server_version,) = await cur.fetchone()
+        suite = Suite(pool, args)
+        results = {}
+        for name in args.scenarios:
+            logging.warning(f'Running {name}')
+            results[name] = await SCENARIOS[name](suite)
+    finally:
+        pool.close()
+        await pool.wait_closed()
+    return {
+        'format_version': RESULT_FORMAT_VERSION,
+        'jasyncq_version': _version(),
+        'server_version': server_version,
+        'python_version': platform.python_version(),
+        'started_at': int(time.time()),
+        'args': {key: value for key, value in vars(args).items() if key != 'baseline'},
+        'results': results,
+    }
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Throughput and latency benchmark suite (writes results as JSON)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--db', default='test')
+    parser.add_argument(
+        '--claim-mode', default=ClaimMode.AUTO.value, choices=[mode.value for mode in ClaimMode])
+    # NOTE: Topic is sharded over tables of same server if more than 1
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument(
+        '--shard-claim', default=ShardClaim.ROTATION.value,
+        choices=[shard_claim.value for shard_claim in ShardClaim])
+    parser.add_argument(
+        '--scenarios', type=lambda value: value.split(','), default=list(SCENARIOS))
+    parser.add_argument('--producer-tasks', type=int, default=10000)
+    parser.add_argument('--producer-batch-sizes', type=_int_list, default=[1, 10, 100, 1000])
+    parser.add_argument('--workers', type=_int_list, default=[1, 2, 4, 8, 16])
+    parser.add_argument('--producers', type=int, default=2)
+    parser.add_argument('--backlog', type=int, default=20000)
+    # NOTE: Add 1000000,10000000 for large table runs (filling takes a while)
+    parser.add_argument('--backlogs', type=_int_list, default=[1000, 10000, 100000])
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--fill-chunk-size', type=int, default=1000)
+    parser.add_argument('--output', default=None, help='Path of JSON results (stdout if not set)')
+    parser.add_argument('--baseline', default=None, help='Path of JSON results to compare with')
+    parsed_args = parser.parse_args()
+    unknown_scenarios = set(parsed_args.scenarios) - set(SCENARIOS)
+    if unknown_scenarios:
+        parser.error(f'Unknown scenarios: {unknown_scenarios}')
+
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.get_event_loop().run_until_complete(run(parsed_args))
+    if parsed_args.output:
+        with open(parsed_args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if parsed_args.baseline:
+        with open(parsed_args.baseline) as baseline_file:
+            compare(report['results'], json.load(baseline_file)['results'])
@@ -4,10 +4,17 @@ from asyncio import AbstractEventLoop
 
 import aiomysql
 
+from jasyncq.dispatcher.model.task import TaskOut
 from jasyncq.dispatcher.tasks import TasksDispatcher
+from jasyncq.dispatcher.worker import Worker
 from jasyncq.repository.tasks import TaskRepository
 
 
+async def handle(task: TaskOut):
+    # ...RUN JOB WITH task
+    logging.info(task)
+
+
 async def run(loop: AbstractEventLoop):
     pool = await aiomysql.create_pool(
         host='127.0.0.1',
@@ -21,25 +28,14 @@ async def run(loop: AbstractEventLoop):
     await repository.initialize()
     dispatcher = TasksDispatcher(repository=repository)
 
-    while True:
-        scheduled_tasks = await dispatcher.fetch_scheduled_tasks(queue_name='QUEUE_TEST', limit=10)
-        pending_tasks = await dispatcher.fetch_pending_tasks(
-            queue_name='QUEUE_TEST',
-            limit=10,
-            check_term_seconds=60,
-        )
-
-        tasks = [*pending_tasks, *scheduled_tasks]
-        if not tasks:
-            # NOTE(pjongy): Relax wasting
-            await asyncio.sleep(1)
-
-        # ...RUN JOBS WITH tasks
-        for task in tasks:
-            logging.info(task)
-
-        task_ids = [str(task.uuid) for task in tasks]
-        await dispatcher.complete_tasks(task_ids=task_ids)
+    worker = Worker(
+        dispatcher=dispatcher,
+        handlers={'QUEUE_TEST': handle},
+        concurrency=10,
+        check_term_seconds=60,
+    )
+    # NOTE: Runs until SIGINT or SIGTERM, then waits running tasks to be completed
+    await worker.run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from typing import List, Set, Optional, Dict, Any, Callable
+
+from jasyncq.dispatcher.tasks import TasksDispatcher, RESULT_TTL_SECONDS
+
+_NO_RESULT = object()
+
+
+class AckBuffer:
+    def __init__(
+        self,
+        dispatcher: TasksDispatcher,
+        max_size: int = 100,
+        max_delay_seconds: float = 0.1,
+        result_ttl_seconds: int = RESULT_TTL_SECONDS,
+        max_retry_delay_seconds: float = 5.0,
+        on_flushed: Optional[Callable[[List[str]], None]] = None,
+    ):
+        # NOTE: Coalesces completions of separately finished tasks into one complete_tasks call,
+        #  flushed when max_size ids are buffered or max_delay_seconds passed since first one
+        self.dispatcher = dispatcher
+        self.max_size = max_size
+        self.max_delay_seconds = max_delay_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        # NOTE: Failed flush is retried by timer, backing off exponentially up to max retry delay
+        self.max_retry_delay_seconds = max_retry_delay_seconds
+        self._failures = 0
+        # NOTE: Called with ids of each successful flush, i.e. once they are actually completed
+        self.on_flushed = on_flushed
+        self._task_ids: List[str] = []
+        self._results: Dict[str, Any] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: Set[asyncio.Future] = set()
+
+    def __len__(self) -> int:
+        return len(self._task_ids)
+
+    async def add(self, task_id: str, result: Any = _NO_RESULT):
+        # NOTE: Should be called after handler of task returned
+        self._task_ids.append(task_id)
+        if result is not _NO_RESULT:
+            self._results[task_id] = result
+        if len(self._task_ids) >= self.max_size:
+            await self.flush()
+        elif self._timer is None:
+            self._arm(self.max_delay_seconds)
+
+    def _arm(self, delay_seconds: float):
+        self._timer = asyncio.get_event_loop().call_later(delay_seconds, self._flush_later)
+
+    def _flush_later(self):
+        self._timer = None
+        flushing = asyncio.ensure_future(self.flush())
+        self._flushing.add(flushing)
+        flushing.add_done_callback(self._flushing.discard)
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        task_ids, self._task_ids = self._task_ids, []
+        results, self._results = self._results, {}
+        if not task_ids:
+            return
+        try:
+            if results:
+                await self.dispatcher.complete_tasks(
+                    task_ids=task_ids,
+                    results=results,
+                    result_ttl_seconds=self.result_ttl_seconds,
+                )
+            else:
+                await self.dispatcher.complete_tasks(task_ids=task_ids)
+        except Exception:
+            # NOTE: Completing is idempotent, so retried with next flush
+            logging.exception(f'Failed to complete {len(task_ids)} tasks')
+            self._task_ids = task_ids + self._task_ids
+            self._results = {**results, **self._results}
+            self._failures += 1
+            if self._timer is None:
+                self._arm(min(
+                    self.max_delay_seconds * 2 ** self._failures,
+                    self.max_retry_delay_seconds,
+                ))
+        else:
+            self._failures = 0
+            if self.on_flushed is not None:
+                self.on_flushed(task_ids)
+
+    async def close(self):
+        if self._flushing:
+            await asyncio.wait(self._flushing)
+        await self.flush()
+        # NOTE: Nothing is retried after close, failed ids are left in buffer
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
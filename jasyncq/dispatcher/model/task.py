@@ -1,7 +1,9 @@
-from typing import Optional
+from typing import Optional, List
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, constr, validator
+
+from jasyncq.util import uuid_from_binary
 
 
 class TaskOut(BaseModel):
@@ -10,11 +12,25 @@ class TaskOut(BaseModel):
     task: dict
     queue_name: str
     depend_on: Optional[UUID] = None
+    priority: int = 0
+    attempts: int = 0  # NOTE: Claims before (so 0 on first run)
+    max_attempts: int = 0
+    dedup_key: Optional[str] = None
+
+    _uuid_from_binary = validator('uuid', 'depend_on', pre=True, allow_reuse=True)(
+        uuid_from_binary)
 
 
 class TaskIn(BaseModel):
     scheduled_at: int = 0  # epoch timestamp
-    is_urgent: bool = False
+    is_urgent: bool = False  # NOTE: Same as priority of 1 (if priority is lower)
+    priority: int = 0  # NOTE: Higher is claimed first, and same priority is claimed in FIFO
     task: dict
     queue_name: str = 'DEFAULT_QUEUE'
     depend_on: Optional[UUID] = None
+    dependencies: List[UUID] = []  # NOTE: Task runs after all of depend_on and dependencies
+    max_attempts: int = 0  # NOTE: Dead-lettered after this many claims (unlimited if 0)
+    # NOTE: Task of same dedup_key in same queue is applied once while it is not completed
+    #  (and for dedup_seconds after completed). Applying duplicate returns existing task
+    dedup_key: Optional[constr(max_length=255)] = None
+    dedup_seconds: int = 0
@@ -1,14 +1,85 @@
-from typing import List
+import asyncio
+import warnings
+from typing import (
+    List, Dict, Tuple, Union, Iterable, AsyncIterable, AsyncIterator, Optional, Any,
+    AsyncContextManager,
+)
 from uuid import UUID
 
+from jasyncq import wakeup, results as task_results, stats as queue_stats
 from jasyncq.dispatcher.model.task import TaskOut, TaskIn
-from jasyncq.repository.tasks import TaskRepository
-from jasyncq.repository.model.task import TaskRowIn
+from jasyncq.repository.abstract import (
+    AbstractTaskRepository, INSERT_CHUNK_SIZE, INSERT_CHUNK_BYTES, INSERT_CONCURRENCY,
+    BULK_CHUNK_SIZE,
+)
+from jasyncq.repository.model.stats import QueueStats, StatsMode
+from jasyncq.repository.model.task import TaskRowIn, TaskRow, TaskFilter
 from jasyncq.util import let_if
 
+# NOTE: (versions of queues in database, version of queues in current process)
+QueueSnapshot = Tuple[Dict[str, int], int]
+RESULT_TTL_SECONDS = 3600
+CHECK_TERM_SECONDS = 30
+
+
+def _check_term_seconds(check_term_seconds: Optional[int], lease_seconds: int) -> int:
+    # NOTE: With lease, task is pending as soon as its lease expired (heartbeat stopped), so
+    #  check term (term from claim of tasks claimed without lease) is ignored
+    if lease_seconds:
+        if check_term_seconds:
+            warnings.warn(
+                'check_term_seconds is ignored with lease_seconds',
+                DeprecationWarning,
+                stacklevel=3,
+            )
+        return 0
+    return CHECK_TERM_SECONDS if check_term_seconds is None else check_term_seconds
+
+
+# NOTE: Rows come from own table, so TaskOut is constructed without validation
+def _task_out(task_row: TaskRow) -> TaskOut:
+    return TaskOut.construct(
+        uuid=UUID(task_row.uuid),
+        scheduled_at=task_row.scheduled_at,
+        task=task_row.task,
+        queue_name=task_row.queue_name,
+        depend_on=let_if(task_row.depend_on, UUID),
+        priority=task_row.priority,
+        attempts=task_row.attempts,
+        max_attempts=task_row.max_attempts,
+        dedup_key=task_row.dedup_key,
+    )
+
+
+# NOTE: TaskIn is already validated, so TaskRowIn is constructed without validation
+def _task_row_in(task: TaskIn) -> TaskRowIn:
+    return TaskRowIn.construct(
+        scheduled_at=task.scheduled_at,
+        is_urgent=task.is_urgent,
+        priority=task.priority,
+        task=task.task,
+        queue_name=task.queue_name,
+        depend_on=let_if(task.depend_on, str),
+        dependencies=[str(dependency) for dependency in task.dependencies],
+        max_attempts=task.max_attempts,
+        dedup_key=task.dedup_key,
+        dedup_seconds=task.dedup_seconds,
+    )
+
+
+async def _task_rows_in(
+    tasks: Union[Iterable[TaskIn], AsyncIterable[TaskIn]],
+) -> AsyncIterator[TaskRowIn]:
+    if isinstance(tasks, AsyncIterable):
+        async for task in tasks:
+            yield _task_row_in(task)
+    else:
+        for task in tasks:
+            yield _task_row_in(task)
+
 
 class TasksDispatcher:
-    def __init__(self, repository: TaskRepository):
+    def __init__(self, repository: AbstractTaskRepository):
         self.repository = repository
 
     async def fetch_scheduled_tasks(
@@ -17,72 +88,245 @@ class TasksDispatcher:
         limit: int,
         offset: int = 0,
         ignore_dependency: bool = False,
+        lease_seconds: int = 0,
     ) -> List[TaskOut]:
         task_rows = await self.repository.fetch_scheduled_tasks(
             offset=offset,
             limit=limit,
             queue_name=queue_name,
             ignore_dependency=ignore_dependency,
+            lease_seconds=lease_seconds,
         )
-        return [
-            TaskOut(
-                uuid=UUID(task_row.uuid),
-                scheduled_at=task_row.scheduled_at,
-                task=task_row.task,
-                queue_name=task_row.queue_name,
-                depend_on=let_if(task_row.depend_on, UUID),
-            )
-            for task_row in task_rows
-        ]
+        return [_task_out(task_row) for task_row in task_rows]
 
     async def fetch_pending_tasks(
         self,
         queue_name: str,
         limit: int,
         offset: int = 0,
-        check_term_seconds: int = 30,
+        check_term_seconds: Optional[int] = None,
         ignore_dependency: bool = False,
+        lease_seconds: int = 0,
     ) -> List[TaskOut]:
         task_rows = await self.repository.fetch_pending_tasks(
             offset=offset,
             limit=limit,
             queue_name=queue_name,
-            check_term_seconds=check_term_seconds,
+            check_term_seconds=_check_term_seconds(check_term_seconds, lease_seconds),
             ignore_dependency=ignore_dependency,
+            lease_seconds=lease_seconds,
         )
-        return [
-            TaskOut(
-                uuid=UUID(task_row.uuid),
-                scheduled_at=task_row.scheduled_at,
-                task=task_row.task,
-                queue_name=task_row.queue_name,
-                depend_on=let_if(task_row.depend_on, UUID),
-            )
-            for task_row in task_rows
-        ]
+        return [_task_out(task_row) for task_row in task_rows]
+
+    async def fetch_tasks(
+        self,
+        queue_name: str,
+        limit: int,
+        check_term_seconds: Optional[int] = None,
+        ignore_dependency: bool = False,
+        pending_first: bool = True,
+        lease_seconds: int = 0,
+    ) -> List[TaskOut]:
+        task_rows = await self.repository.fetch_tasks(
+            limit=limit,
+            queue_name=queue_name,
+            check_term_seconds=_check_term_seconds(check_term_seconds, lease_seconds),
+            ignore_dependency=ignore_dependency,
+            pending_first=pending_first,
+            lease_seconds=lease_seconds,
+        )
+        return [_task_out(task_row) for task_row in task_rows]
+
+    async def fetch_tasks_from_queues(
+        self,
+        queue_weights: Dict[str, int],
+        limit: int,
+        check_term_seconds: Optional[int] = None,
+        ignore_dependency: bool = False,
+        pending_first: bool = True,
+        lease_seconds: int = 0,
+    ) -> List[TaskOut]:
+        task_rows = await self.repository.fetch_tasks_from_queues(
+            queue_weights=queue_weights,
+            limit=limit,
+            check_term_seconds=_check_term_seconds(check_term_seconds, lease_seconds),
+            ignore_dependency=ignore_dependency,
+            pending_first=pending_first,
+            lease_seconds=lease_seconds,
+        )
+        return [_task_out(task_row) for task_row in task_rows]
 
     async def apply_tasks(self, tasks: List[TaskIn]) -> List[TaskOut]:
-        task_rows = await self.repository.insert_tasks(tasks=[
-            TaskRowIn(
-                scheduled_at=task.scheduled_at,
-                is_urgent=task.is_urgent,
-                task=task.task,
-                queue_name=task.queue_name,
-                depend_on=let_if(task.depend_on, str),
-            )
-            for task in tasks
-        ])
-        return [
-            TaskOut(
-                uuid=UUID(task_row.uuid),
-                scheduled_at=task_row.scheduled_at,
-                task=task_row.task,
-                queue_name=task_row.queue_name,
-                depend_on=let_if(task_row.depend_on, UUID),
-            )
-            for task_row in task_rows
-        ]
+        task_rows = await self.repository.insert_tasks(
+            tasks=[_task_row_in(task) for task in tasks])
+        return [_task_out(task_row) for task_row in task_rows]
+
+    async def apply_tasks_stream(
+        self,
+        tasks: Union[Iterable[TaskIn], AsyncIterable[TaskIn]],
+        chunk_size: int = INSERT_CHUNK_SIZE,
+        chunk_bytes: int = INSERT_CHUNK_BYTES,
+        concurrency: int = INSERT_CONCURRENCY,
+    ) -> AsyncIterator[List[UUID]]:
+        async for task_ids in self.repository.insert_tasks_stream(
+            tasks=_task_rows_in(tasks),
+            chunk_size=chunk_size,
+            chunk_bytes=chunk_bytes,
+            concurrency=concurrency,
+        ):
+            yield [UUID(task_id) for task_id in task_ids]
 
-    async def complete_tasks(self, task_ids: List[str]):
+    async def complete_tasks(
+        self,
+        task_ids: List[str],
+        results: Optional[Dict[str, Any]] = None,
+        result_ttl_seconds: int = RESULT_TTL_SECONDS,
+    ):
+        # NOTE: Results (by task id) are stored before tasks are deleted, so task is never seen
+        #  completed without its result
+        if results:
+            await self.repository.insert_results(results=results, ttl_seconds=result_ttl_seconds)
         if task_ids:
             await self.repository.delete_tasks(task_ids=task_ids)
+        if results:
+            task_results.notify(self.repository.table_name, {
+                str(UUID(task_id)): result for task_id, result in results.items()
+            })
+
+    async def await_results(
+        self,
+        task_ids: List[UUID],
+        timeout: float,
+        poll_interval_seconds: float = 0.5,
+    ) -> Dict[UUID, Any]:
+        # NOTE: Returns results of tasks completed within timeout. Results awaited by all callers
+        #  in process are polled together with one query per interval
+        results = await task_results.wait(
+            table_name=self.repository.table_name,
+            task_ids=[str(task_id) for task_id in task_ids],
+            fetch_results=self.repository.fetch_results,
+            timeout=timeout,
+            interval_seconds=poll_interval_seconds,
+        )
+        return {UUID(task_id): result for task_id, result in results.items()}
+
+    async def heartbeat_tasks(self, task_ids: List[str], lease_seconds: int):
+        # NOTE: Extends leases of in-flight tasks to `lease_seconds` from now
+        if task_ids:
+            await self.repository.extend_leases(task_ids=task_ids, lease_seconds=lease_seconds)
+
+    async def fail_tasks(
+        self,
+        task_ids: List[str],
+        base_delay_seconds: int = 1,
+        max_delay_seconds: int = 3600,
+    ):
+        # NOTE: Reschedules in-flight tasks after exponential backoff of their attempts,
+        #  or moves them to dead letter once attempts reached their max_attempts
+        if task_ids:
+            await self.repository.fail_tasks(
+                task_ids=task_ids,
+                base_delay_seconds=base_delay_seconds,
+                max_delay_seconds=max_delay_seconds,
+            )
+
+    async def fetch_dead_letter_tasks(
+        self,
+        queue_name: str,
+        limit: int,
+        offset: int = 0,
+    ) -> List[TaskOut]:
+        task_rows = await self.repository.fetch_dead_letter_tasks(
+            offset=offset,
+            limit=limit,
+            queue_name=queue_name,
+        )
+        return [_task_out(task_row) for task_row in task_rows]
+
+    async def cancel_tasks(
+        self,
+        task_filter: TaskFilter,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        # NOTE: Deletes matched tasks by chunks (each chunk in own transaction) and releases
+        #  their dependents. Returns count of cancelled tasks
+        return await self.repository.delete_tasks_by_filter(
+            task_filter=task_filter, chunk_size=chunk_size)
+
+    async def reschedule_tasks(
+        self,
+        task_filter: TaskFilter,
+        scheduled_at: int,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        return await self.repository.reschedule_tasks_by_filter(
+            task_filter=task_filter, scheduled_at=scheduled_at, chunk_size=chunk_size)
+
+    async def reprioritize_tasks(
+        self,
+        task_filter: TaskFilter,
+        priority: int,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        return await self.repository.reprioritize_tasks_by_filter(
+            task_filter=task_filter, priority=priority, chunk_size=chunk_size)
+
+    async def fetch_queue_stats(
+        self,
+        queue_names: List[str],
+        mode: StatsMode = StatsMode.EXACT,
+        max_age_seconds: float = 5,
+    ) -> Dict[str, QueueStats]:
+        # NOTE: Stats are cached in process for max_age_seconds, so frequent readers (e.g.
+        #  autoscaler) cost one query per interval
+        async def fetch_stats(queue_names_: List[str]) -> Dict[str, QueueStats]:
+            return await self.repository.fetch_queue_stats(queue_names=queue_names_, mode=mode)
+
+        return await queue_stats.fetch(
+            table_name=self.repository.table_name,
+            queue_names=queue_names,
+            mode=mode,
+            fetch_stats=fetch_stats,
+            max_age_seconds=max_age_seconds,
+        )
+
+    def pin_claim_connection(self) -> AsyncContextManager[None]:
+        # NOTE: Claims within context use one dedicated connection (e.g. claim loop of worker)
+        return self.repository.pin_claim_connection()
+
+    async def snapshot_queues(self, queue_names: List[str]) -> QueueSnapshot:
+        return (
+            await self.repository.fetch_queue_versions(queue_names=queue_names),
+            wakeup.version(self.repository.table_name, queue_names),
+        )
+
+    async def wait_for_tasks(
+        self,
+        queue_names: List[str],
+        snapshot: QueueSnapshot,
+        timeout: float,
+        check_interval_seconds: float = 0.5,
+    ) -> bool:
+        # NOTE: Returns True as soon as tasks were applied to queues after snapshot was taken
+        #  (immediately if applied in same process), or False if timed out. Versions are not
+        #  checked at timeout, since caller claims (or snapshots again) right after it
+        remote_versions, local_version = snapshot
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            notified = await wakeup.wait(
+                table_name=self.repository.table_name,
+                queue_names=queue_names,
+                since=local_version,
+                timeout=min(check_interval_seconds, remaining),
+            )
+            if notified:
+                return True
+            if loop.time() >= deadline:
+                return False
+            versions = await self.repository.fetch_queue_versions(queue_names=queue_names)
+            if versions != remote_versions:
+                return True
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import signal
+from typing import Dict, Callable, Awaitable, Any, List, Set, Optional
+
+from jasyncq.dispatcher.ack import AckBuffer
+from jasyncq.dispatcher.model.task import TaskOut
+from jasyncq.dispatcher.tasks import (
+    TasksDispatcher, QueueSnapshot, RESULT_TTL_SECONDS, _check_term_seconds,
+)
+
+TaskHandler = Callable[[TaskOut], Awaitable[Any]]
+
+
+class Worker:
+    def __init__(
+        self,
+        dispatcher: TasksDispatcher,
+        handlers: Dict[str, TaskHandler],
+        concurrency: int = 10,
+        batch_size: Optional[int] = None,
+        check_term_seconds: Optional[int] = None,
+        min_idle_seconds: float = 0.1,
+        max_idle_seconds: float = 10,
+        wakeup_check_seconds: float = 0.5,
+        ignore_dependency: bool = False,
+        ack_batch_size: int = 100,
+        ack_delay_seconds: float = 0.1,
+        queue_weights: Optional[Dict[str, int]] = None,
+        lease_seconds: Optional[int] = None,
+        heartbeat_seconds: Optional[float] = None,
+        retry_base_seconds: int = 1,
+        retry_max_seconds: int = 3600,
+        store_results: bool = False,
+        result_ttl_seconds: int = RESULT_TTL_SECONDS,
+        pin_claim_connection: bool = False,
+    ):
+        self.dispatcher = dispatcher
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.batch_size = batch_size or concurrency
+        # NOTE: Without lease, claimed task is abandoned after check term from claim.
+        #  With lease, it is abandoned as soon as lease is not extended by heartbeat
+        self.lease_seconds = lease_seconds or 0
+        self.heartbeat_seconds = heartbeat_seconds or self.lease_seconds / 3
+        self.check_term_seconds = _check_term_seconds(check_term_seconds, self.lease_seconds)
+        self.min_idle_seconds = min_idle_seconds
+        self.max_idle_seconds = max_idle_seconds
+        self.wakeup_check_seconds = wakeup_check_seconds
+        self.ignore_dependency = ignore_dependency
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        # NOTE: Return value of handler is stored as result of task (see await_results)
+        self.store_results = store_results
+        # NOTE: Claim loop holds one connection (of claim pool) while running instead of
+        #  acquiring from pool for every claim
+        self.pin_claim_connection = pin_claim_connection
+        self.queue_weights = {
+            queue_name: (queue_weights or {}).get(queue_name, 1) for queue_name in handlers
+        }
+
+        # NOTE: Claimed tasks are leased (and extended by heartbeat) until they are failed or
+        #  their completions are flushed
+        self._leased: Set[str] = set()
+        self._acks = AckBuffer(
+            dispatcher=dispatcher,
+            max_size=ack_batch_size,
+            max_delay_seconds=ack_delay_seconds,
+            result_ttl_seconds=result_ttl_seconds,
+            on_flushed=self._leased.difference_update,
+        )
+        # NOTE: Slot is held from start of handler until its completion is buffered
+        self._slots = asyncio.Semaphore(concurrency)
+        self._running: Set[asyncio.Future] = set()
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        logging.info('Stopping worker')
+        self._stopping.set()
+
+    def install_signal_handlers(self, signals=(signal.SIGINT, signal.SIGTERM)):
+        loop = asyncio.get_event_loop()
+        for signal_number in signals:
+            try:
+                loop.add_signal_handler(signal_number, self.stop)
+            except NotImplementedError:  # NOTE: Not supported by event loop (e.g. Windows)
+                signal.signal(signal_number, lambda *_: loop.call_soon_threadsafe(self.stop))
+
+    async def run(self, handle_signals: bool = True):
+        if handle_signals:
+            self.install_signal_handlers()
+        heartbeat = asyncio.ensure_future(self._heartbeat()) if self.lease_seconds else None
+        try:
+            if self.pin_claim_connection:
+                async with self.dispatcher.pin_claim_connection():
+                    await self._claim_loop()
+            else:
+                await self._claim_loop()
+        finally:
+            if self._running:
+                await asyncio.wait(self._running)
+            if heartbeat is not None:
+                heartbeat.cancel()
+            await self._acks.close()
+
+    async def _claim_loop(self):
+        # NOTE: Polling backs off exponentially while queues are empty and resets once tasks are
+        #  claimed. Idle worker is woken up as soon as tasks are applied to its queues (in same
+        #  process, or by version check of queues backing off with idle time). Snapshot is kept
+        #  over idle periods not woken up, so fully idle worker makes one claim and one version
+        #  check per max_idle_seconds
+        idle_seconds = self.min_idle_seconds
+        snapshot: Optional[QueueSnapshot] = None
+        while not self._stopping.is_set():
+            try:
+                if snapshot is None and idle_seconds > self.min_idle_seconds:
+                    # NOTE: Taken before claiming not to miss tasks applied in between
+                    snapshot = await self.dispatcher.snapshot_queues(list(self.handlers))
+                tasks = await self._claim()
+                if not tasks and snapshot is None:
+                    snapshot = await self.dispatcher.snapshot_queues(list(self.handlers))
+            except Exception:
+                logging.exception('Failed to claim tasks')
+                tasks = []
+            if not tasks:
+                if await self._idle(snapshot, idle_seconds):
+                    snapshot = None
+                else:
+                    # NOTE: Taken before last claim, so it still does not miss tasks
+                    idle_seconds = min(idle_seconds * 2, self.max_idle_seconds)
+                continue
+            idle_seconds = self.min_idle_seconds
+            snapshot = None
+            # NOTE: Next claim is issued as soon as this batch is handed to slots, so one
+            #  database round-trip is in flight while handlers of current batch are running
+            await self._dispatch(tasks)
+
+    async def _claim(self) -> List[TaskOut]:
+        # NOTE: Claimed tasks wait for slots while their check term goes by,
+        #  so claim at most batch_size tasks at once (shared by queues by their weights)
+        return await self.dispatcher.fetch_tasks_from_queues(
+            queue_weights=self.queue_weights,
+            limit=self.batch_size,
+            check_term_seconds=self.check_term_seconds,
+            ignore_dependency=self.ignore_dependency,
+            lease_seconds=self.lease_seconds,
+        )
+
+    async def _heartbeat(self):
+        # NOTE: Leases of all in-flight tasks (including ones waiting for slots) are extended
+        #  with one statement per interval
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            if not self._leased:
+                continue
+            try:
+                await self.dispatcher.heartbeat_tasks(list(self._leased), self.lease_seconds)
+            except Exception:
+                logging.exception('Failed to extend leases of tasks')
+
+    async def _idle(self, snapshot: Optional[QueueSnapshot], idle_seconds: float) -> bool:
+        # NOTE: Returns True if woken up by applied tasks
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        if snapshot is None:
+            waiting = asyncio.ensure_future(asyncio.sleep(idle_seconds, result=False))
+        else:
+            waiting = asyncio.ensure_future(self.dispatcher.wait_for_tasks(
+                queue_names=list(self.handlers),
+                snapshot=snapshot,
+                timeout=idle_seconds,
+                # NOTE: Checked once in the middle of idle period (claim follows at its end)
+                check_interval_seconds=max(self.wakeup_check_seconds, idle_seconds / 2),
+            ))
+        done, _ = await asyncio.wait([stopping, waiting], return_when=asyncio.FIRST_COMPLETED)
+        stopping.cancel()
+        if waiting not in done:
+            waiting.cancel()
+            return False
+        if waiting.exception() is not None:
+            logging.error(f'Failed to wait for tasks: {waiting.exception()!r}')
+            return False
+        return waiting.result()
+
+    async def _dispatch(self, tasks: List[TaskOut]):
+        # NOTE: Claimed tasks are run even while stopping since they are already WIP-ed
+        self._leased.update(str(task.uuid) for task in tasks)
+        for task in tasks:
+            await self._slots.acquire()
+            running = asyncio.ensure_future(self._handle(task))
+            self._running.add(running)
+            running.add_done_callback(self._running.discard)
+
+    async def _fail(self, task: TaskOut):
+        # NOTE: Failed task is retried after backoff (or dead-lettered) at once. If it could not
+        #  be failed, it would be restored by fetch_pending_tasks after its lease and check term
+        try:
+            await self.dispatcher.fail_tasks(
+                [str(task.uuid)], self.retry_base_seconds, self.retry_max_seconds)
+        except Exception:
+            logging.exception(f'Failed to fail task {task.uuid}')
+
+    async def _handle(self, task: TaskOut):
+        try:
+            result = await self.handlers[task.queue_name](task)
+        except Exception:
+            logging.exception(f'Failed to run task {task.uuid}')
+            await self._fail(task)
+            self._leased.discard(str(task.uuid))
+        else:
+            if self.store_results:
+                await self._acks.add(str(task.uuid), result)
+            else:
+                await self._acks.add(str(task.uuid))
+        finally:
+            self._slots.release()
@@ -0,0 +1,154 @@
+import asyncio
+import enum
+import logging
+import os
+import tempfile
+import threading
+from bisect import bisect_left
+from typing import Dict, Tuple, List, Optional
+
+_SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+_LAG_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600, 14400, 86400)
+
+
+class Metric(enum.Enum):
+    # (name, help, buckets)
+    POOL_ACQUIRE_SECONDS = (
+        'jasyncq_pool_acquire_seconds', 'Time waited for connection from pool', _SECONDS_BUCKETS)
+    LOCK_WAIT_SECONDS = (
+        'jasyncq_lock_wait_seconds', 'Time waited for LOCK TABLES', _SECONDS_BUCKETS)
+    LOCK_HOLD_SECONDS = (
+        'jasyncq_lock_hold_seconds', 'Time LOCK TABLES was held', _SECONDS_BUCKETS)
+    CLAIM_SECONDS = (
+        'jasyncq_claim_seconds', 'Latency of claim transaction', _SECONDS_BUCKETS)
+    CLAIMED_ROWS = (
+        'jasyncq_claimed_rows', 'Tasks claimed per claim', _SIZE_BUCKETS)
+    INSERT_SECONDS = (
+        'jasyncq_insert_seconds', 'Latency of insert transaction', _SECONDS_BUCKETS)
+    INSERT_BATCH_SIZE = (
+        'jasyncq_insert_batch_size', 'Tasks inserted per insert', _SIZE_BUCKETS)
+    DELETE_SECONDS = (
+        'jasyncq_delete_seconds', 'Latency of delete (complete) transaction', _SECONDS_BUCKETS)
+    DELETE_BATCH_SIZE = (
+        'jasyncq_delete_batch_size', 'Tasks deleted per delete', _SIZE_BUCKETS)
+    TASK_LAG_SECONDS = (
+        'jasyncq_task_lag_seconds', 'Time from scheduled_at to first claim', _LAG_BUCKETS)
+
+    @property
+    def metric_name(self) -> str:
+        return self.value[0]
+
+    @property
+    def help(self) -> str:
+        return self.value[1]
+
+    @property
+    def buckets(self) -> Tuple[float, ...]:
+        return self.value[2]
+
+
+class Instrumentation:
+    # NOTE: Hot paths check `enabled` before taking timestamps, so disabled instrumentation
+    #  costs one attribute lookup per operation. Override observe to forward to other
+    #  metrics or tracing systems
+    enabled = False
+
+    def observe(self, metric: Metric, value: float, topic: str):
+        pass
+
+
+NOOP_INSTRUMENTATION = Instrumentation()
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # NOTE: Last one is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class PrometheusInstrumentation(Instrumentation):
+    enabled = True
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[Metric, str], _Histogram] = {}
+        # NOTE: render could be called from other thread (e.g. exporter of other framework)
+        self._lock = threading.Lock()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def observe(self, metric: Metric, value: float, topic: str):
+        key = (metric, topic)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(metric.buckets)
+            histogram.observe(value)
+
+    def render(self) -> str:
+        # NOTE: Prometheus text exposition format (version 0.0.4)
+        lines: List[str] = []
+        with self._lock:
+            histograms = sorted(
+                self._histograms.items(), key=lambda item: (item[0][0].metric_name, item[0][1]))
+            rendered = set()
+            for (metric, topic), histogram in histograms:
+                name = metric.metric_name
+                if metric not in rendered:
+                    rendered.add(metric)
+                    lines.append(f'# HELP {name} {metric.help}')
+                    lines.append(f'# TYPE {name} histogram')
+                cumulative = 0
+                for bucket, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{topic="{topic}",le="{bucket}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{topic="{topic}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{topic="{topic}"}} {histogram.total}')
+                lines.append(f'{name}_count{{topic="{topic}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_to_file(self, path: str):
+        # NOTE: Replaced atomically, so file could be read by node_exporter textfile collector
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as file:
+            file.write(self.render())
+        os.replace(file.name, path)
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 9464):
+        self._server = await asyncio.start_server(self._handle_request, host, port)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():  # NOTE: Headers are ignored
+                pass
+            method, path, *_ = request_line.decode('latin-1').split(' ')
+            if method == 'GET' and path.split('?')[0] in ('/', '/metrics'):
+                status, body = '200 OK', self.render().encode()
+            else:
+                status, body = '404 Not Found', b''
+            writer.write(
+                f'HTTP/1.1 {status}\r\n'
+                'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                'Connection: close\r\n\r\n'.encode() + body
+            )
+            await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            logging.debug(f'Failed to serve metrics: {e!r}')
+        finally:
+            writer.close()
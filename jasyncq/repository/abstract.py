@@ -1,29 +1,445 @@
-from typing import List, Any
+import abc
+import asyncio
+import enum
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import (
+    List, Any, Union, Tuple, Sequence, Optional, AsyncIterator, Dict, Set, Iterator, Iterable,
+    AsyncIterable, Callable,
+)
+from uuid import UUID
 
 from aiomysql import Pool, Connection, Cursor
 
+from jasyncq.metrics import Instrumentation, Metric, NOOP_INSTRUMENTATION
+from jasyncq.repository.codec import PayloadCodec
+from jasyncq.repository.model.stats import QueueStats, StatsMode
+from jasyncq.repository.model.task import TaskRow, TaskRowIn, TaskFilter
+from jasyncq.util import uuid7_epoch
+
+# NOTE: Query could be plain SQL or (SQL with driver placeholders, arguments)
+Statement = Union[str, Tuple[str, Sequence[Any]]]
+
+
+def _unpack(statement: Statement) -> Tuple[str, Optional[Sequence[Any]]]:
+    if isinstance(statement, str):
+        return statement, None
+    return statement
+
+
+INSERT_CHUNK_SIZE = 1000  # rows
+INSERT_CHUNK_BYTES = 1024 * 1024  # encoded payload bytes, should be under max_allowed_packet
+INSERT_CONCURRENCY = 4  # connections
+# NOTE: Rows changed by one transaction of bulk operation, so locks are not held long
+BULK_CHUNK_SIZE = 1000
+MAX_BACKOFF_SHIFT = 32  # NOTE: Doubling of retry delay stops here (not to overflow BIGINT)
+
+
+def _retry_delay(attempts: int, base_delay_seconds: int, max_delay_seconds: int) -> int:
+    # NOTE: Delay is doubled by every attempt (attempts is already incremented by claim)
+    return min(
+        base_delay_seconds << min(max(attempts - 1, 0), MAX_BACKOFF_SHIFT), max_delay_seconds)
+
+
+def _is_exhausted(attempts: int, max_attempts: int) -> bool:
+    return 0 < max_attempts <= attempts
+
+
+def _lag_seconds(scheduled_at: int, task_id: bytes, current_epoch: float) -> float:
+    # NOTE: scheduled_at of task applied without schedule is 0, so its lag is counted from
+    #  creation time in task id (if it is UUIDv7)
+    ready_at = max(scheduled_at, uuid7_epoch(task_id) or 0)
+    if not ready_at:
+        return 0
+    return max(current_epoch - ready_at, 0)
+
+
+async def _chunk_tasks(
+    tasks: Union[Iterable[TaskRowIn], AsyncIterable[TaskRowIn]],
+    codec: PayloadCodec,
+    chunk_size: int,
+    chunk_bytes: int,
+) -> AsyncIterator[Tuple[List[TaskRowIn], List[Tuple[bytes, int]]]]:
+    chunk: List[TaskRowIn] = []
+    encoded_chunk: List[Tuple[bytes, int]] = []
+    size = 0
+    async for task in _aiter(tasks):
+        encoded_task = codec.encode(task.task)
+        if chunk and (len(chunk) >= chunk_size or size + len(encoded_task[0]) > chunk_bytes):
+            yield chunk, encoded_chunk
+            chunk, encoded_chunk, size = [], [], 0
+        chunk.append(task)
+        encoded_chunk.append(encoded_task)
+        size += len(encoded_task[0])
+    if chunk:
+        yield chunk, encoded_chunk
+
+
+def _weighted_limits(queue_weights: Dict[str, int], limit: int, rotation: int) -> Dict[str, int]:
+    # NOTE: Largest remainder method, and ties are broken by rotating queues on every call
+    #  so queues with small weights are not starved even if limit is smaller than count of queues
+    if any(weight <= 0 for weight in queue_weights.values()):
+        raise ValueError(f'Weights of queues should be positive: {queue_weights}')
+    queue_names = list(queue_weights)
+    if not queue_names:
+        return {}
+    rotation %= len(queue_names)
+    queue_names = queue_names[rotation:] + queue_names[:rotation]
+    total_weight = sum(queue_weights.values())
+    quotas = {
+        queue_name: limit * queue_weights[queue_name] / total_weight
+        for queue_name in queue_names
+    }
+    limits = {queue_name: int(quota) for queue_name, quota in quotas.items()}
+    remaining = limit - sum(limits.values())
+    for queue_name in sorted(
+        queue_names,
+        key=lambda queue_name: quotas[queue_name] - limits[queue_name],
+        reverse=True,
+    )[:remaining]:
+        limits[queue_name] += 1
+    return limits
+
+
+def _inserted_task_ids(done: Set[asyncio.Future]) -> Iterator[List[str]]:
+    # NOTE: Ids of committed chunks are yielded before error of failed chunk is raised
+    for future in sorted(done, key=lambda future: future.exception() is not None):
+        yield [task_row.uuid for task_row in future.result()]
+
+
+async def _aiter(iterable: Union[Iterable[Any], AsyncIterable[Any]]) -> AsyncIterator[Any]:
+    if isinstance(iterable, AsyncIterable):
+        async for item in iterable:
+            yield item
+    else:
+        for item in iterable:
+            yield item
+
+
+class AbstractTaskRepository(abc.ABC):
+    # NOTE: Interface of task storage backend used by TasksDispatcher (MySQL, SQLite, in-memory).
+    #  Claim sets lease of task to `lease_seconds` after claim, and WIP-ed task is claimed again
+    #  as pending when its lease has expired over `check_term_seconds`
+    table_name: str  # NOTE: Key of in-process wakeup (see wakeup.py)
+    task_id_factory: Callable[[], UUID]
+    _claim_rotation = 0
+
+    @abc.abstractmethod
+    async def initialize(self):
+        pass
+
+    @asynccontextmanager
+    async def pin_claim_connection(self) -> AsyncIterator[None]:
+        # NOTE: Claims within context use one connection held until exit (see AbstractRepository).
+        #  Backends without connection pool have nothing to pin
+        yield
+
+    @abc.abstractmethod
+    async def fetch_scheduled_tasks(
+        self,
+        offset: int,
+        limit: int,
+        queue_name: str,
+        ignore_dependency: bool = False,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        pass
+
+    @abc.abstractmethod
+    async def fetch_pending_tasks(
+        self,
+        offset: int,
+        limit: int,
+        check_term_seconds: int,
+        queue_name: str,
+        ignore_dependency: bool = False,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        pass
+
+    @abc.abstractmethod
+    async def fetch_tasks(
+        self,
+        limit: int,
+        queue_name: str,
+        check_term_seconds: int,
+        ignore_dependency: bool = False,
+        pending_first: bool = True,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        pass
+
+    async def fetch_tasks_from_queues(
+        self,
+        queue_weights: Dict[str, int],
+        limit: int,
+        check_term_seconds: int,
+        ignore_dependency: bool = False,
+        pending_first: bool = True,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        # NOTE: Claims queues one by one. Backend which could claim several queues at once
+        #  (e.g. with one statement) overrides this
+        queue_limits = _weighted_limits(queue_weights, limit, self._claim_rotation)
+        self._claim_rotation += 1
+        task_rows = []
+        for queue_name, queue_limit in queue_limits.items():
+            if queue_limit > 0:
+                task_rows.extend(await self.fetch_tasks(
+                    limit=queue_limit,
+                    queue_name=queue_name,
+                    check_term_seconds=check_term_seconds,
+                    ignore_dependency=ignore_dependency,
+                    pending_first=pending_first,
+                    lease_seconds=lease_seconds,
+                ))
+        return task_rows
+
+    @abc.abstractmethod
+    async def insert_tasks(self, tasks: List[TaskRowIn]) -> List[TaskRow]:
+        pass
+
+    async def insert_tasks_stream(
+        self,
+        tasks: Union[Iterable[TaskRowIn], AsyncIterable[TaskRowIn]],
+        chunk_size: int = INSERT_CHUNK_SIZE,
+        chunk_bytes: int = INSERT_CHUNK_BYTES,
+        concurrency: int = INSERT_CONCURRENCY,
+    ) -> AsyncIterator[List[str]]:
+        # NOTE: Each chunk is inserted in its own transaction with one of `concurrency` connections,
+        #  and ids of chunk are yielded as it commits (in commit order), so at most
+        #  `concurrency` chunks are held in memory however large the input is
+        inserting: Set[asyncio.Future] = set()
+        try:
+            async for chunk in self._chunk_tasks_for_insert(tasks, chunk_size, chunk_bytes):
+                inserting.add(asyncio.ensure_future(self._insert_chunk(chunk)))
+                if len(inserting) < concurrency:
+                    continue
+                done, inserting = await asyncio.wait(
+                    inserting, return_when=asyncio.FIRST_COMPLETED)
+                for task_ids in _inserted_task_ids(done):
+                    yield task_ids
+            while inserting:
+                done, inserting = await asyncio.wait(
+                    inserting, return_when=asyncio.FIRST_COMPLETED)
+                for task_ids in _inserted_task_ids(done):
+                    yield task_ids
+        finally:
+            # NOTE: Chunks not committed yet are rolled back if stream fails or is closed early
+            for future in inserting:
+                future.cancel()
+            if inserting:
+                await asyncio.wait(inserting)
+
+    async def _chunk_tasks_for_insert(
+        self,
+        tasks: Union[Iterable[TaskRowIn], AsyncIterable[TaskRowIn]],
+        chunk_size: int,
+        chunk_bytes: int,
+    ) -> AsyncIterator[Any]:
+        # NOTE: Chunked by rows only, backend storing encoded payload chunks by bytes too
+        chunk: List[TaskRowIn] = []
+        async for task in _aiter(tasks):
+            chunk.append(task)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    async def _insert_chunk(self, chunk: Any) -> List[TaskRow]:
+        return await self.insert_tasks(chunk)
+
+    @abc.abstractmethod
+    async def delete_tasks(self, task_ids: List[str]):
+        pass
+
+    @abc.abstractmethod
+    async def extend_leases(self, task_ids: List[str], lease_seconds: int):
+        pass
+
+    @abc.abstractmethod
+    async def fail_tasks(
+        self,
+        task_ids: List[str],
+        base_delay_seconds: int,
+        max_delay_seconds: int,
+    ):
+        pass
+
+    @abc.abstractmethod
+    async def fetch_dead_letter_tasks(
+        self,
+        offset: int,
+        limit: int,
+        queue_name: str,
+    ) -> List[TaskRow]:
+        pass
+
+    @abc.abstractmethod
+    async def delete_tasks_by_filter(self, task_filter: TaskFilter, chunk_size: int) -> int:
+        # NOTE: Cancels tasks, releasing their children same as completion. Returns count
+        pass
+
+    @abc.abstractmethod
+    async def reschedule_tasks_by_filter(
+        self,
+        task_filter: TaskFilter,
+        scheduled_at: int,
+        chunk_size: int,
+    ) -> int:
+        pass
+
+    @abc.abstractmethod
+    async def reprioritize_tasks_by_filter(
+        self,
+        task_filter: TaskFilter,
+        priority: int,
+        chunk_size: int,
+    ) -> int:
+        pass
+
+    @abc.abstractmethod
+    async def insert_results(self, results: Dict[str, Any], ttl_seconds: int):
+        # NOTE: Results are kept for ttl_seconds (overwritten if task is completed again)
+        pass
+
+    @abc.abstractmethod
+    async def fetch_results(self, task_ids: List[str]) -> Dict[str, Any]:
+        # NOTE: Tasks without (or with expired) result are omitted
+        pass
+
+    @abc.abstractmethod
+    async def fetch_queue_versions(self, queue_names: List[str]) -> Dict[str, int]:
+        pass
+
+    @abc.abstractmethod
+    async def fetch_queue_stats(
+        self,
+        queue_names: List[str],
+        mode: StatsMode,
+    ) -> Dict[str, QueueStats]:
+        pass
+
+
+class PoolRole(enum.Enum):
+    CLAIM = 'claim'  # Claims and lease heartbeats of consumers
+    WRITE = 'write'  # Inserts, completions and other changes
+    READ = 'read'  # Non-locking reads which could be served by replica (stats, inspection)
+
+
+class _PinnedConnection:
+    # NOTE: Connection is acquired on first use and replaced after failure, since its state is
+    #  unknown (e.g. lost, or left in transaction). Uses are serialized, so tasks created within
+    #  pinned context could share it. Wait for pool is observed once per acquired connection,
+    #  not on every use of it
+    def __init__(self, pool: Pool, instrumentation: Instrumentation, topic_name: str):
+        self.pool = pool
+        self.instrumentation = instrumentation
+        self.topic_name = topic_name
+        self.conn: Optional[Connection] = None
+        self.lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Connection]:
+        async with self.lock:
+            if self.conn is None:
+                started_at = time.perf_counter()
+                self.conn = await self.pool.acquire()
+                self.instrumentation.observe(
+                    Metric.POOL_ACQUIRE_SECONDS, time.perf_counter() - started_at, self.topic_name)
+            try:
+                yield self.conn
+            except BaseException:
+                self.release()
+                raise
+
+    def release(self):
+        # NOTE: Pool closes connection released in transaction
+        if self.conn is not None:
+            self.pool.release(self.conn)
+            self.conn = None
+
 
 class AbstractRepository:
-    def __init__(self, pool: Pool):
+    topic_name = ''  # NOTE: Label of instrumentation
+
+    def __init__(
+        self,
+        pool: Pool,
+        instrumentation: Optional[Instrumentation] = None,
+        claim_pool: Optional[Pool] = None,
+        read_pool: Optional[Pool] = None,
+    ):
+        # NOTE: Claims do not wait for connections behind bursts of producers with own pool,
+        #  and reads could be sent to replica. Both fall back to `pool`
         self.pool = pool
+        self.claim_pool = claim_pool or pool
+        self.read_pool = read_pool or pool
+        self.instrumentation = instrumentation or NOOP_INSTRUMENTATION
+        self._pinned: ContextVar[Optional[_PinnedConnection]] = ContextVar(
+            f'jasyncq_pinned_{id(self)}', default=None)
+
+    def _pool(self, role: PoolRole) -> Pool:
+        if role == PoolRole.CLAIM:
+            return self.claim_pool
+        if role == PoolRole.READ:
+            return self.read_pool
+        return self.pool
+
+    @asynccontextmanager
+    async def pin_claim_connection(self) -> AsyncIterator[None]:
+        # NOTE: Claims within context (in current task and tasks created in it) use one
+        #  connection of claim pool held until exit, so claim loop never waits for pool
+        pinned = _PinnedConnection(self.claim_pool, self.instrumentation, self.topic_name)
+        token = self._pinned.set(pinned)
+        try:
+            yield
+        finally:
+            self._pinned.reset(token)
+            async with pinned.lock:
+                pinned.release()
+
+    def _acquire(self, role: PoolRole = PoolRole.WRITE):
+        if role == PoolRole.CLAIM:
+            pinned = self._pinned.get()
+            if pinned is not None:
+                return pinned.acquire()
+        pool = self._pool(role)
+        if not self.instrumentation.enabled:
+            return pool.acquire()
+        return self._acquire_with_instrumentation(pool)
+
+    @asynccontextmanager
+    async def _acquire_with_instrumentation(self, pool: Pool) -> AsyncIterator[Connection]:
+        started_at = time.perf_counter()
+        async with pool.acquire() as conn:
+            self.instrumentation.observe(
+                Metric.POOL_ACQUIRE_SECONDS, time.perf_counter() - started_at, self.topic_name)
+            yield conn
 
-    async def _execute(self, queries: List[str]):
-        async with self.pool.acquire() as conn:
+    async def _execute(self, queries: List[Statement], role: PoolRole = PoolRole.WRITE):
+        async with self._acquire(role) as conn:
             conn: Connection = conn  # NOTE(pjongy): For type hinting
             async with conn.cursor() as cur:
                 cur: Cursor = cur  # NOTE(pjongy): For type hinting
                 [
-                    await cur.execute(clause)
+                    await cur.execute(*_unpack(clause))
                     for clause in queries
                 ]
                 await conn.commit()
 
-    async def _execute_and_fetch(self, queries: List[str]) -> List[List[Any]]:
-        async def _run(cur_: Cursor, clause_: str) -> List[Any]:
-            await cur_.execute(clause_)
+    async def _execute_and_fetch(
+        self,
+        queries: List[Statement],
+        role: PoolRole = PoolRole.WRITE,
+    ) -> List[List[Any]]:
+        async def _run(cur_: Cursor, clause_: Statement) -> List[Any]:
+            await cur_.execute(*_unpack(clause_))
             return await cur_.fetchall()
 
-        async with self.pool.acquire() as conn:
+        async with self._acquire(role) as conn:
             conn: Connection = conn  # NOTE(pjongy): For type hinting
             async with conn.cursor() as cur:
                 cur: Cursor = cur  # NOTE(pjongy): For type hinting
@@ -34,10 +450,10 @@ class AbstractRepository:
                 await conn.commit()
                 return result
 
-    async def _fetch(self, query: str, fetch_size: int):
-        async with self.pool.acquire() as conn:
+    async def _fetch(self, query: Statement, fetch_size: int, role: PoolRole = PoolRole.WRITE):
+        async with self._acquire(role) as conn:
             conn: Connection = conn  # NOTE(pjongy): For type hinting
             async with conn.cursor() as cur:
                 cur: Cursor = cur  # NOTE(pjongy): For type hinting
-                await cur.execute(query)
+                await cur.execute(*_unpack(query))
                 return await cur.fetchmany(size=fetch_size)
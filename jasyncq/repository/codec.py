@@ -0,0 +1,119 @@
+import enum
+import json
+import zlib
+from typing import Tuple, Optional, Any
+
+try:
+    import orjson
+except ImportError:  # NOTE: Optional dependency (pip install jasyncq[orjson])
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # NOTE: Optional dependency (pip install jasyncq[msgpack])
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # NOTE: Optional dependency (pip install jasyncq[zstd])
+    zstandard = None
+
+
+class Serializer(enum.IntEnum):
+    JSON = 0
+    ORJSON = 1
+    MSGPACK = 2
+
+
+class Compression(enum.IntEnum):
+    NONE = 0
+    ZLIB = 1
+    ZSTD = 2
+
+
+# NOTE: Keyed with enum type too, since IntEnum members of different enums compare equal by value
+_REQUIRED_MODULES = {
+    (Serializer, Serializer.ORJSON): ('orjson', lambda: orjson),
+    (Serializer, Serializer.MSGPACK): ('msgpack', lambda: msgpack),
+    (Compression, Compression.ZSTD): ('zstandard', lambda: zstandard),
+}
+
+
+def _require(option: enum.IntEnum):
+    key = (type(option), option)
+    if key in _REQUIRED_MODULES:
+        module_name, module = _REQUIRED_MODULES[key]
+        if module() is None:
+            raise ImportError(f'{module_name} is required for {option!r}')
+
+
+# NOTE: Codec tag is stored next to payload, so every row is decoded by codec it was encoded with
+#  (lower 4 bits: serializer, upper 4 bits: compression)
+def codec_tag(serializer: Serializer, compression: Compression) -> int:
+    return int(serializer) | int(compression) << 4
+
+
+def parse_codec_tag(tag: int) -> Tuple[Serializer, Compression]:
+    return Serializer(tag & 0x0F), Compression(tag >> 4)
+
+
+class PayloadCodec:
+    def __init__(
+        self,
+        serializer: Serializer = Serializer.JSON,
+        compression: Compression = Compression.NONE,
+        compression_threshold: int = 1024,  # bytes, payload smaller than this is not compressed
+        compression_level: Optional[int] = None,
+    ):
+        _require(serializer)
+        _require(compression)
+        self.serializer = serializer
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.compression_level = compression_level
+        self._zstd_compressor = None
+        self._zstd_decompressor = None
+
+    def encode(self, payload: Any) -> Tuple[bytes, int]:
+        data = self._serialize(payload)
+        compression = Compression.NONE
+        if self.compression != Compression.NONE and len(data) >= self.compression_threshold:
+            data = self._compress(data)
+            compression = self.compression
+        return data, codec_tag(self.serializer, compression)
+
+    def decode(self, data: bytes, tag: int) -> Any:
+        if tag == 0:  # NOTE: Uncompressed JSON (and every row written before codecs)
+            return json.loads(data)
+        serializer, compression = parse_codec_tag(tag)
+        if compression == Compression.ZLIB:
+            data = zlib.decompress(data)
+        elif compression == Compression.ZSTD:
+            _require(compression)
+            if self._zstd_decompressor is None:
+                self._zstd_decompressor = zstandard.ZstdDecompressor()
+            data = self._zstd_decompressor.decompress(data)
+
+        if serializer == Serializer.ORJSON:
+            _require(serializer)
+            return orjson.loads(data)
+        if serializer == Serializer.MSGPACK:
+            _require(serializer)
+            return msgpack.unpackb(data, raw=False)
+        return json.loads(data)
+
+    def _serialize(self, payload: Any) -> bytes:
+        if self.serializer == Serializer.ORJSON:
+            return orjson.dumps(payload)
+        if self.serializer == Serializer.MSGPACK:
+            return msgpack.packb(payload, use_bin_type=True)
+        return json.dumps(payload, separators=(',', ':')).encode()
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == Compression.ZLIB:
+            level = self.compression_level if self.compression_level is not None else -1
+            return zlib.compress(data, level)
+        if self._zstd_compressor is None:
+            level = self.compression_level if self.compression_level is not None else 3
+            self._zstd_compressor = zstandard.ZstdCompressor(level=level)
+        return self._zstd_compressor.compress(data)
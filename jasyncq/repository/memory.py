@@ -0,0 +1,619 @@
+import heapq
+import logging
+import time
+from typing import List, Dict, Tuple, Optional, Callable, Set, Any, Iterable, Iterator
+from uuid import UUID
+
+from jasyncq import wakeup
+from jasyncq.repository.abstract import (
+    AbstractTaskRepository, _is_exhausted, _retry_delay, _lag_seconds,
+)
+from jasyncq.repository.model.stats import QueueStats, StatsMode, STATUS_COUNTERS
+from jasyncq.repository.model.task import (
+    TaskStatus, TaskRowIn, TaskRow, TaskFilter, effective_priority,
+)
+from jasyncq.util import uuid7
+
+Heap = List[Tuple[Any, ...]]
+
+
+class _Task:
+    __slots__ = (
+        'uuid',
+        'status',
+        'progressed_at',
+        'lease_expires_at',
+        'scheduled_at',
+        'priority',
+        'task',
+        'queue_name',
+        'depend_on',
+        'pending_parents',
+        'attempts',
+        'max_attempts',
+        'dedup_key',
+        'dedup_seconds',
+        'due',
+    )
+
+    def __init__(
+        self,
+        uuid: str,
+        status: TaskStatus,
+        scheduled_at: int,
+        priority: int,
+        task: dict,
+        queue_name: str,
+        depend_on: Optional[str],
+        pending_parents: int,
+        max_attempts: int,
+        dedup_key: Optional[str],
+        dedup_seconds: int,
+    ):
+        self.uuid = uuid
+        self.status = status
+        self.progressed_at = 0
+        self.lease_expires_at = 0
+        self.scheduled_at = scheduled_at
+        self.priority = priority
+        self.task = task
+        self.queue_name = queue_name
+        self.depend_on = depend_on
+        self.pending_parents = pending_parents
+        self.attempts = 0
+        self.max_attempts = max_attempts
+        self.dedup_key = dedup_key
+        self.dedup_seconds = dedup_seconds
+        self.due = False  # NOTE: Moved out of delayed heap
+
+    def row(self) -> TaskRow:
+        return TaskRow(
+            uuid=self.uuid,
+            status=self.status,
+            progressed_at=self.progressed_at,
+            scheduled_at=self.scheduled_at,
+            priority=self.priority,
+            task=self.task,
+            queue_name=self.queue_name,
+            depend_on=self.depend_on,
+            attempts=self.attempts,
+            max_attempts=self.max_attempts,
+            dedup_key=self.dedup_key,
+        )
+
+
+class _Queue:
+    # NOTE: Heap entries are removed lazily. Entry is valid only while its task is still in the
+    #  state it was pushed with, so stale entries are dropped when popped
+    __slots__ = (
+        'tasks', 'delayed', 'ready', 'deferred', 'in_flight', 'expired', 'dead', 'dedup',
+        'version',
+    )
+
+    def __init__(self):
+        self.tasks: Set[str] = set()  # uuid of all tasks of queue (e.g. for stats)
+        self.delayed: Heap = []  # (scheduled_at, uuid) of tasks not due yet
+        self.ready: Heap = []  # (-priority, scheduled_at, uuid) of due QUEUED tasks
+        self.deferred: Heap = []  # (-priority, scheduled_at, uuid) of due DEFERRED tasks
+        self.in_flight: Heap = []  # (lease_expires_at, uuid) of WORK_IN_PROGRESS tasks
+        self.expired: Heap = []  # (-priority, lease_expires_at, uuid) of tasks expired over term
+        self.dead: Set[str] = set()  # uuid of DEAD_LETTER tasks
+        # NOTE: dedup_key: (uuid, expires_at) of task holding key (expires_at is 0 until completed)
+        self.dedup: Dict[str, Tuple[str, int]] = {}
+        self.version = 0
+
+
+class MemoryTaskRepository(AbstractTaskRepository):
+    # NOTE: Single process and non-durable backend. Operations do not await in between,
+    #  so each of them is atomic within event loop without lock
+    def __init__(
+        self,
+        topic_name: str = 'default_topic',
+        task_id_factory: Callable[[], UUID] = uuid7,
+    ):
+        self.topic_name = topic_name
+        self.task_id_factory = task_id_factory
+        self.table_name = f'jasyncq_{topic_name}'
+        self._tasks: Dict[str, _Task] = {}
+        self._queues: Dict[str, _Queue] = {}
+        self._children: Dict[str, Set[str]] = {}  # NOTE: Edges from parents not completed yet
+        self._dedup_expiry: Heap = []  # (expires_at, queue_name, dedup_key) of completed tasks
+        self._results: Dict[str, Tuple[Any, int]] = {}  # NOTE: uuid: (result, expires_at)
+        self._result_expiry: Heap = []  # (expires_at, uuid)
+
+    async def initialize(self):
+        pass
+
+    def _queue(self, queue_name: str) -> _Queue:
+        queue = self._queues.get(queue_name)
+        if queue is None:
+            queue = self._queues[queue_name] = _Queue()
+        return queue
+
+    def _push_unclaimed(self, queue: _Queue, task: _Task, current_epoch: float):
+        if not task.due and task.scheduled_at > current_epoch:
+            heapq.heappush(queue.delayed, (task.scheduled_at, task.uuid))
+            return
+        task.due = True
+        heap = queue.ready if task.status == TaskStatus.QUEUED else queue.deferred
+        heapq.heappush(heap, (-task.priority, task.scheduled_at, task.uuid))
+
+    def _move_due_tasks(self, queue: _Queue, current_epoch: float):
+        while queue.delayed and queue.delayed[0][0] <= current_epoch:
+            _, task_id = heapq.heappop(queue.delayed)
+            task = self._tasks.get(task_id)
+            if task is not None and not task.due:
+                self._push_unclaimed(queue, task, current_epoch)
+
+    def _move_expired_tasks(self, queue: _Queue, expired_epoch: int):
+        while queue.in_flight and queue.in_flight[0][0] <= expired_epoch:
+            lease_expires_at, task_id = heapq.heappop(queue.in_flight)
+            task = self._tasks.get(task_id)
+            if self._is_in_flight(task, lease_expires_at):
+                heapq.heappush(queue.expired, (-task.priority, lease_expires_at, task_id))
+
+    @staticmethod
+    def _is_in_flight(task: Optional[_Task], lease_expires_at: int) -> bool:
+        return (
+            task is not None
+            and task.status == TaskStatus.WORK_IN_PROGRESS
+            and task.lease_expires_at == lease_expires_at
+        )
+
+    def _pop(
+        self,
+        heaps: List[Tuple[Heap, Callable[[Tuple[Any, ...]], bool]]],
+        claimable: Callable[[_Task], bool],
+        offset: int,
+        limit: int,
+    ) -> List[_Task]:
+        # NOTE: Pops entries in order of keys over (heap, validator of its entry) pairs.
+        #  Invalid entries are dropped, and valid entries skipped by offset or not claimable
+        #  are pushed back
+        popped: List[_Task] = []
+        popped_ids: Set[str] = set()
+        skipped: List[Tuple[Heap, Tuple[Any, ...]]] = []
+        while len(popped) < limit:
+            candidates = [(heap, is_valid) for heap, is_valid in heaps if heap]
+            if not candidates:
+                break
+            heap, is_valid = min(candidates, key=lambda candidate: candidate[0][0])
+            entry = heapq.heappop(heap)
+            if not is_valid(entry) or entry[-1] in popped_ids:
+                continue
+            task = self._tasks[entry[-1]]
+            if not claimable(task):
+                skipped.append((heap, entry))
+                continue
+            if offset > 0:
+                offset -= 1
+                skipped.append((heap, entry))
+                continue
+            popped.append(task)
+            popped_ids.add(task.uuid)
+        for heap, entry in skipped:
+            heapq.heappush(heap, entry)
+        return popped
+
+    def _has_status(self, status: TaskStatus) -> Callable[[Tuple[Any, ...]], bool]:
+        def is_valid(entry: Tuple[Any, ...]) -> bool:
+            task = self._tasks.get(entry[-1])
+            return task is not None and task.status == status
+
+        return is_valid
+
+    def _claim(
+        self,
+        tasks: List[_Task],
+        current_epoch: float,
+        lease_seconds: int,
+    ) -> List[TaskRow]:
+        # NOTE: Rows are returned as they were before claimed, same as other backends.
+        #  Task claimed over its max attempts is dead-lettered instead
+        task_rows = []
+        for task in tasks:
+            if _is_exhausted(task.attempts, task.max_attempts):
+                self._dead_letter(task)
+                continue
+            task_rows.append(task.row())
+            task.status = TaskStatus.WORK_IN_PROGRESS
+            task.progressed_at = int(current_epoch)
+            task.attempts += 1
+            self._lease(task, task.progressed_at + lease_seconds)
+        return task_rows
+
+    def _dead_letter(self, task: _Task):
+        task.status = TaskStatus.DEAD_LETTER
+        self._queue(task.queue_name).dead.add(task.uuid)
+
+    def _lease(self, task: _Task, lease_expires_at: int):
+        # NOTE: Entry of previous lease becomes stale (or duplicated if lease is same,
+        #  which is skipped by _pop)
+        task.lease_expires_at = lease_expires_at
+        heapq.heappush(self._queue(task.queue_name).in_flight, (lease_expires_at, task.uuid))
+
+    def _select_scheduled(
+        self,
+        offset: int,
+        limit: int,
+        queue_name: str,
+        ignore_dependency: bool,
+        current_epoch: float,
+    ) -> List[_Task]:
+        queue = self._queue(queue_name)
+        self._move_due_tasks(queue, current_epoch)
+        heaps = [(queue.ready, self._has_status(TaskStatus.QUEUED))]
+        if ignore_dependency:
+            heaps.append((queue.deferred, self._has_status(TaskStatus.DEFERRED)))
+        return self._pop(heaps, lambda task: True, offset, limit)
+
+    def _select_pending(
+        self,
+        offset: int,
+        limit: int,
+        check_term_seconds: int,
+        queue_name: str,
+        ignore_dependency: bool,
+        current_epoch: float,
+    ) -> List[_Task]:
+        queue = self._queue(queue_name)
+        expired_epoch = int(current_epoch) - check_term_seconds
+        self._move_expired_tasks(queue, expired_epoch)
+        return self._pop(
+            [(
+                queue.expired,
+                lambda entry: self._is_in_flight(self._tasks.get(entry[2]), entry[1]),
+            )],
+            # NOTE: Expired heap could have tasks moved by other claim with shorter check term.
+            #  Task with pending parents was claimed with ignoring dependency
+            lambda task: (
+                task.lease_expires_at <= expired_epoch
+                and (ignore_dependency or task.pending_parents == 0)
+            ),
+            offset,
+            limit,
+        )
+
+    async def fetch_scheduled_tasks(
+        self,
+        offset: int,
+        limit: int,
+        queue_name: str,
+        ignore_dependency: bool = False,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        current_epoch = time.time()
+        return self._claim(
+            self._select_scheduled(offset, limit, queue_name, ignore_dependency, current_epoch),
+            current_epoch,
+            lease_seconds,
+        )
+
+    async def fetch_pending_tasks(
+        self,
+        offset: int,
+        limit: int,
+        check_term_seconds: int,
+        queue_name: str,
+        ignore_dependency: bool = False,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        current_epoch = time.time()
+        return self._claim(
+            self._select_pending(
+                offset, limit, check_term_seconds, queue_name, ignore_dependency, current_epoch),
+            current_epoch,
+            lease_seconds,
+        )
+
+    async def fetch_tasks(
+        self,
+        limit: int,
+        queue_name: str,
+        check_term_seconds: int,
+        ignore_dependency: bool = False,
+        pending_first: bool = True,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        current_epoch = time.time()
+
+        selects = [
+            lambda limit_: self._select_pending(
+                0, limit_, check_term_seconds, queue_name, ignore_dependency, current_epoch),
+            lambda limit_: self._select_scheduled(
+                0, limit_, queue_name, ignore_dependency, current_epoch),
+        ]
+        if not pending_first:
+            selects.reverse()
+        # NOTE: Claimed at once after both selects, so task selected as scheduled is not
+        #  selected again as pending
+        tasks = []
+        for select in selects:
+            if len(tasks) < limit:
+                tasks.extend(select(limit - len(tasks)))
+        return self._claim(tasks, current_epoch, lease_seconds)
+
+    async def insert_tasks(self, tasks: List[TaskRowIn]) -> List[TaskRow]:
+        logging.debug(tasks)
+        current_epoch = time.time()
+        inserted_tasks = []
+        queue_names = set()
+        for task in tasks:
+            queue = self._queue(task.queue_name)
+            holder = self._dedup_holder(queue, task, current_epoch)
+            if holder is not None:
+                inserted_tasks.append(holder)
+                continue
+            task_id = str(self.task_id_factory())
+            pending_parents = {
+                str(UUID(parent))
+                for parent in [*task.dependencies, *filter(None, [task.depend_on])]
+                if str(UUID(parent)) in self._tasks
+            }
+            for parent in pending_parents:
+                self._children.setdefault(parent, set()).add(task_id)
+            task_ = self._tasks[task_id] = _Task(
+                uuid=task_id,
+                status=TaskStatus.DEFERRED if pending_parents else TaskStatus.QUEUED,
+                scheduled_at=task.scheduled_at,
+                priority=effective_priority(task.priority, task.is_urgent),
+                task=task.task,
+                queue_name=task.queue_name,
+                depend_on=task.depend_on,
+                pending_parents=len(pending_parents),
+                max_attempts=task.max_attempts,
+                dedup_key=task.dedup_key,
+                dedup_seconds=task.dedup_seconds,
+            )
+            queue.tasks.add(task_id)
+            if task.dedup_key is not None:
+                queue.dedup[task.dedup_key] = (task_id, 0)
+            self._push_unclaimed(queue, task_, current_epoch)
+            queue_names.add(task.queue_name)
+            inserted_tasks.append(task_.row())
+        for queue_name in queue_names:
+            self._queue(queue_name).version += 1
+        wakeup.notify(self.table_name, queue_names)
+        return inserted_tasks
+
+    def _dedup_holder(
+        self,
+        queue: _Queue,
+        task: TaskRowIn,
+        current_epoch: float,
+    ) -> Optional[TaskRow]:
+        if task.dedup_key is None or task.dedup_key not in queue.dedup:
+            return None
+        task_id, expires_at = queue.dedup[task.dedup_key]
+        if not expires_at:
+            return self._tasks[task_id].row()
+        if expires_at <= current_epoch:
+            return None
+        # NOTE: Completed task is not kept, so it is returned as applied with its id
+        return TaskRow(
+            uuid=task_id,
+            status=TaskStatus.COMPLETED,
+            progressed_at=0,
+            scheduled_at=task.scheduled_at,
+            priority=effective_priority(task.priority, task.is_urgent),
+            task=task.task,
+            queue_name=task.queue_name,
+            depend_on=task.depend_on,
+            max_attempts=task.max_attempts,
+            dedup_key=task.dedup_key,
+        )
+
+    def _release_dedup_key(self, task: _Task, current_epoch: float, completed: bool):
+        queue = self._queue(task.queue_name)
+        if completed and task.dedup_seconds > 0:
+            expires_at = int(current_epoch) + task.dedup_seconds
+            queue.dedup[task.dedup_key] = (task.uuid, expires_at)
+            heapq.heappush(self._dedup_expiry, (expires_at, task.queue_name, task.dedup_key))
+        else:
+            del queue.dedup[task.dedup_key]
+
+    def _purge_dedup_keys(self, current_epoch: float):
+        while self._dedup_expiry and self._dedup_expiry[0][0] <= current_epoch:
+            expires_at, queue_name, dedup_key = heapq.heappop(self._dedup_expiry)
+            dedup = self._queue(queue_name).dedup
+            if dedup.get(dedup_key, (None, 0))[1] == expires_at:
+                del dedup[dedup_key]
+
+    async def delete_tasks(self, task_ids: List[str]):
+        logging.debug(task_ids)
+        self._delete_tasks(task_ids, time.time(), completed=True)
+
+    def _delete_tasks(self, task_ids: List[str], current_epoch: float, completed: bool):
+        self._purge_dedup_keys(current_epoch)
+        released_queue_names = set()
+        for task_id in task_ids:
+            task_id = str(UUID(task_id))
+            task = self._tasks.pop(task_id, None)
+            if task is not None:
+                self._queue(task.queue_name).tasks.discard(task_id)
+            if task is not None and task.status == TaskStatus.DEAD_LETTER:
+                self._queue(task.queue_name).dead.discard(task_id)
+            if task is not None and task.dedup_key is not None:
+                self._release_dedup_key(task, current_epoch, completed)
+            for child_id in self._children.pop(task_id, ()):
+                child = self._tasks.get(child_id)
+                if child is None:
+                    continue
+                child.pending_parents -= 1
+                if child.pending_parents == 0 and child.status == TaskStatus.DEFERRED:
+                    child.status = TaskStatus.QUEUED
+                    released_queue_names.add(child.queue_name)
+                    if child.due:
+                        self._push_unclaimed(self._queue(child.queue_name), child, current_epoch)
+        # NOTE: Consumers waiting on queues of released children are woken up same as insert
+        for queue_name in released_queue_names:
+            self._queue(queue_name).version += 1
+        if released_queue_names:
+            wakeup.notify(self.table_name, released_queue_names)
+
+    def _filter_tasks(self, task_filter: TaskFilter) -> List[_Task]:
+        return [
+            task for task in self._tasks.values()
+            if task.queue_name == task_filter.queue_name
+            and task_filter.matches(task.status, task.scheduled_at, task.priority)
+        ]
+
+    def _rebuild_queue(self, queue_name: str, current_epoch: float):
+        # NOTE: Heap entries are ordered by priority and times of tasks, so heaps of queue are
+        #  built again after bulk update instead of validating every entry against its task
+        queue = self._queue(queue_name)
+        queue.delayed, queue.ready, queue.deferred, queue.in_flight, queue.expired = (
+            [], [], [], [], [])
+        for task in self._tasks.values():
+            if task.queue_name != queue_name:
+                continue
+            if task.status in (TaskStatus.DEFERRED, TaskStatus.QUEUED):
+                task.due = False
+                self._push_unclaimed(queue, task, current_epoch)
+            elif task.status == TaskStatus.WORK_IN_PROGRESS:
+                heapq.heappush(queue.in_flight, (task.lease_expires_at, task.uuid))
+
+    async def delete_tasks_by_filter(self, task_filter: TaskFilter, chunk_size: int) -> int:
+        # NOTE: Atomic within event loop, so not chunked
+        logging.debug(task_filter)
+        task_ids = [task.uuid for task in self._filter_tasks(task_filter)]
+        self._delete_tasks(task_ids, time.time(), completed=False)
+        return len(task_ids)
+
+    async def reschedule_tasks_by_filter(
+        self,
+        task_filter: TaskFilter,
+        scheduled_at: int,
+        chunk_size: int,
+    ) -> int:
+        logging.debug(task_filter)
+        tasks = [
+            task for task in self._filter_tasks(task_filter) if task.scheduled_at != scheduled_at
+        ]
+        for task in tasks:
+            task.scheduled_at = scheduled_at
+        if tasks:
+            self._rebuild_queue(task_filter.queue_name, time.time())
+            self._queue(task_filter.queue_name).version += 1
+            wakeup.notify(self.table_name, [task_filter.queue_name])
+        return len(tasks)
+
+    async def reprioritize_tasks_by_filter(
+        self,
+        task_filter: TaskFilter,
+        priority: int,
+        chunk_size: int,
+    ) -> int:
+        logging.debug(task_filter)
+        tasks = [
+            task for task in self._filter_tasks(task_filter) if task.priority != priority
+        ]
+        for task in tasks:
+            task.priority = priority
+        if tasks:
+            self._rebuild_queue(task_filter.queue_name, time.time())
+        return len(tasks)
+
+    async def extend_leases(self, task_ids: List[str], lease_seconds: int):
+        lease_expires_at = int(time.time()) + lease_seconds
+        for task_id in task_ids:
+            task = self._tasks.get(str(UUID(task_id)))
+            if task is not None and task.status == TaskStatus.WORK_IN_PROGRESS:
+                self._lease(task, lease_expires_at)
+
+    async def fail_tasks(
+        self,
+        task_ids: List[str],
+        base_delay_seconds: int,
+        max_delay_seconds: int,
+    ):
+        logging.debug(task_ids)
+        current_epoch = time.time()
+        for task_id in task_ids:
+            task = self._tasks.get(str(UUID(task_id)))
+            if task is None or task.status != TaskStatus.WORK_IN_PROGRESS:
+                continue
+            if _is_exhausted(task.attempts, task.max_attempts):
+                self._dead_letter(task)
+                continue
+            # NOTE: Claimed with ignoring dependency
+            task.status = TaskStatus.DEFERRED if task.pending_parents else TaskStatus.QUEUED
+            task.scheduled_at = int(current_epoch) + _retry_delay(
+                task.attempts, base_delay_seconds, max_delay_seconds)
+            task.due = False
+            self._push_unclaimed(self._queue(task.queue_name), task, current_epoch)
+
+    async def fetch_dead_letter_tasks(
+        self,
+        offset: int,
+        limit: int,
+        queue_name: str,
+    ) -> List[TaskRow]:
+        tasks = sorted(
+            (self._tasks[task_id] for task_id in self._queue(queue_name).dead),
+            key=lambda task: (-task.priority, task.scheduled_at, task.uuid),
+        )
+        return [task.row() for task in tasks[offset:offset + limit]]
+
+    async def insert_results(self, results: Dict[str, Any], ttl_seconds: int):
+        current_epoch = time.time()
+        while self._result_expiry and self._result_expiry[0][0] <= current_epoch:
+            expires_at, task_id = heapq.heappop(self._result_expiry)
+            if self._results.get(task_id, (None, 0))[1] == expires_at:
+                del self._results[task_id]
+        expires_at = int(current_epoch) + ttl_seconds
+        for task_id, result in results.items():
+            task_id = str(UUID(task_id))
+            self._results[task_id] = (result, expires_at)
+            heapq.heappush(self._result_expiry, (expires_at, task_id))
+
+    async def fetch_results(self, task_ids: List[str]) -> Dict[str, Any]:
+        current_epoch = time.time()
+        results = {}
+        for task_id in map(str, map(UUID, task_ids)):
+            result, expires_at = self._results.get(task_id, (None, 0))
+            if expires_at > current_epoch:
+                results[task_id] = result
+        return results
+
+    def _tasks_of_queues(self, queue_names: Iterable[str]) -> Iterator[_Task]:
+        for queue_name in set(queue_names):
+            queue = self._queues.get(queue_name)
+            if queue is not None:
+                for task_id in queue.tasks:
+                    yield self._tasks[task_id]
+
+    async def fetch_queue_stats(
+        self,
+        queue_names: List[str],
+        mode: StatsMode,
+    ) -> Dict[str, QueueStats]:
+        # NOTE: Counted by scanning tasks of requested queues in both modes (not whole topic),
+        #  which is cheap enough in process
+        current_epoch = time.time()
+        stats = {queue_name: QueueStats(queue_name=queue_name) for queue_name in queue_names}
+        heads: Dict[str, _Task] = {}
+        for task in self._tasks_of_queues(queue_names):
+            queue_stats = stats[task.queue_name]
+            counter = STATUS_COUNTERS.get(task.status)
+            if counter is None:
+                continue
+            setattr(queue_stats, counter, getattr(queue_stats, counter) + 1)
+            if task.status != TaskStatus.QUEUED or task.scheduled_at > current_epoch:
+                continue
+            head = heads.get(task.queue_name)
+            if head is None or (-task.priority, task.scheduled_at, task.uuid) < (
+                -head.priority, head.scheduled_at, head.uuid,
+            ):
+                heads[task.queue_name] = task
+        for queue_name, head in heads.items():
+            stats[queue_name].lag_seconds = _lag_seconds(
+                head.scheduled_at, UUID(head.uuid).bytes, current_epoch)
+        return stats
+
+    async def fetch_queue_versions(self, queue_names: List[str]) -> Dict[str, int]:
+        versions = {}
+        for queue_name in queue_names:
+            queue = self._queues.get(queue_name)
+            versions[queue_name] = queue.version if queue is not None else 0
+        return versions
@@ -0,0 +1,32 @@
+import enum
+from typing import Dict
+
+from pydantic import BaseModel
+
+from jasyncq.repository.model.task import TaskStatus
+
+
+class StatsMode(enum.Enum):
+    EXACT = 'exact'  # Counted from index of topic table
+    APPROXIMATE = 'approximate'  # Summed from counter rows maintained by writers
+
+
+class QueueStats(BaseModel):
+    queue_name: str
+    waiting: int = 0  # DEFERRED and QUEUED (including not due yet)
+    in_progress: int = 0  # WORK_IN_PROGRESS
+    dead_letter: int = 0  # DEAD_LETTER
+    # NOTE: How long task claimed next (highest priority, earliest due) has been due, same as
+    #  task_lag_seconds metric of claim
+    lag_seconds: float = 0
+
+
+# NOTE: Counter of each status in QueueStats. DEFERRED and QUEUED share one counter, so releasing
+#  dependents does not touch counters
+STATUS_COUNTERS: Dict[TaskStatus, str] = {
+    TaskStatus.DEFERRED: 'waiting',
+    TaskStatus.QUEUED: 'waiting',
+    TaskStatus.WORK_IN_PROGRESS: 'in_progress',
+    TaskStatus.DEAD_LETTER: 'dead_letter',
+}
+QUEUE_COUNTERS = ('waiting', 'in_progress', 'dead_letter')
@@ -1,30 +1,115 @@
 import enum
-from typing import Optional
+from typing import Optional, List, Dict, Any
 
 from pydantic import BaseModel
 
 
+# NOTE: Priority of task applied with is_urgent (kept for compatibility with boolean urgency)
+URGENT_PRIORITY = 1
+
+
 class TaskStatus(enum.IntEnum):
     DEFERRED = 1
     QUEUED = 2
     WORK_IN_PROGRESS = 3
     COMPLETED = 4
+    DEAD_LETTER = 5  # NOTE: Failed over max_attempts, never claimed again
 
 
-class TaskRow(BaseModel):
-    uuid: str
-    status: TaskStatus
-    progressed_at: int  # epoch timestamp
-    scheduled_at: int  # epoch timestamp
-    is_urgent: bool
-    task: dict
-    queue_name: str
-    depend_on: Optional[str] = None
+# NOTE: Rows are read back from own table (or built from validated input), so plain slotted class
+#  is used instead of pydantic model to skip validation on hot path
+class TaskRow:
+    __slots__ = (
+        'uuid',
+        'status',
+        'progressed_at',
+        'scheduled_at',
+        'priority',
+        'task',
+        'queue_name',
+        'depend_on',
+        'attempts',
+        'max_attempts',
+        'dedup_key',
+    )
+
+    def __init__(
+        self,
+        uuid: str,
+        status: TaskStatus,
+        progressed_at: int,  # epoch timestamp
+        scheduled_at: int,  # epoch timestamp
+        priority: int,
+        task: dict,
+        queue_name: str,
+        depend_on: Optional[str] = None,
+        attempts: int = 0,  # NOTE: Claims before (so 0 on first run)
+        max_attempts: int = 0,
+        dedup_key: Optional[str] = None,
+    ):
+        self.uuid = uuid
+        self.status = status
+        self.progressed_at = progressed_at
+        self.scheduled_at = scheduled_at
+        self.priority = priority
+        self.task = task
+        self.queue_name = queue_name
+        self.depend_on = depend_on
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.dedup_key = dedup_key
+
+    @property
+    def is_urgent(self) -> bool:
+        return self.priority >= URGENT_PRIORITY
+
+    def dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, TaskRow):
+            return NotImplemented
+        return self.dict() == other.dict()
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{field}={getattr(self, field)!r}' for field in self.__slots__)
+        return f'TaskRow({fields})'
 
 
 class TaskRowIn(BaseModel):
     scheduled_at: int = 0  # epoch timestamp
-    is_urgent: bool = False
+    is_urgent: bool = False  # NOTE: Same as priority of URGENT_PRIORITY (if priority is lower)
+    priority: int = 0  # NOTE: Higher is claimed first, and same priority is claimed in FIFO
     task: dict
     queue_name: str
     depend_on: Optional[str] = None
+    dependencies: List[str] = []  # NOTE: Task runs after all of depend_on and dependencies
+    max_attempts: int = 0  # NOTE: Dead-lettered after this many claims (unlimited if 0)
+    # NOTE: Task of same dedup_key in same queue is applied once while it is not completed
+    #  (and for dedup_seconds after completed)
+    dedup_key: Optional[str] = None
+    dedup_seconds: int = 0
+
+
+class TaskFilter(BaseModel):
+    # NOTE: Selects tasks of queue for bulk operations without looking into payload.
+    #  Tasks not started yet by default
+    queue_name: str
+    statuses: List[TaskStatus] = [TaskStatus.DEFERRED, TaskStatus.QUEUED]
+    scheduled_from: Optional[int] = None  # epoch timestamp, inclusive
+    scheduled_to: Optional[int] = None  # epoch timestamp, exclusive
+    min_priority: Optional[int] = None  # inclusive
+    max_priority: Optional[int] = None  # inclusive
+
+    def matches(self, status: TaskStatus, scheduled_at: int, priority: int) -> bool:
+        return (
+            status in self.statuses
+            and (self.scheduled_from is None or scheduled_at >= self.scheduled_from)
+            and (self.scheduled_to is None or scheduled_at < self.scheduled_to)
+            and (self.min_priority is None or priority >= self.min_priority)
+            and (self.max_priority is None or priority <= self.max_priority)
+        )
+
+
+def effective_priority(priority: int, is_urgent: bool) -> int:
+    return max(priority, URGENT_PRIORITY) if is_urgent else priority
@@ -0,0 +1,329 @@
+import re
+from typing import List, Dict, Callable, Optional
+
+SCHEMA_VERSION = 12
+
+# NOTE: Schema version of topic table is kept in its table comment (e.g. 'jasyncq:2').
+#  Tables created before versioning has empty comment and treated as version 1
+_SCHEMA_COMMENT_PATTERN = re.compile(r'^jasyncq:(\d+)$')
+
+
+def schema_comment(version: int) -> str:
+    return f'jasyncq:{version}'
+
+
+def parse_schema_version(table_comment: str) -> int:
+    matched = _SCHEMA_COMMENT_PATTERN.match(table_comment or '')
+    if matched is None:
+        return 1
+    return int(matched.group(1))
+
+
+def queue_table_name(table_name: str) -> str:
+    return f'{table_name}__queues'
+
+
+def _create_queue_table_query(table_name: str) -> str:
+    # NOTE: Version of queue is bumped by every insert and summed over slots when read.
+    #  Slots are striped to not serialize concurrent producers of same queue on one row
+    return (
+        f'CREATE TABLE IF NOT EXISTS {queue_table_name(table_name)} ('
+        '  queue_name VARCHAR(255) NOT NULL,'
+        '  slot TINYINT NOT NULL,'
+        '  version BIGINT NOT NULL DEFAULT 0,'
+        'PRIMARY KEY (queue_name, slot)'
+        ');'
+    )
+
+
+def dependency_table_name(table_name: str) -> str:
+    return f'{table_name}__dependencies'
+
+
+def _create_dependency_table_query(table_name: str) -> str:
+    # NOTE: Edge from parent to child which is deleted when parent task is completed
+    return (
+        f'CREATE TABLE IF NOT EXISTS {dependency_table_name(table_name)} ('
+        '  parent BINARY(16) NOT NULL,'
+        '  child BINARY(16) NOT NULL,'
+        'PRIMARY KEY (parent, child)'
+        ');'
+    )
+
+
+def dedup_table_name(table_name: str) -> str:
+    return f'{table_name}__dedup'
+
+
+def _create_dedup_table_query(table_name: str) -> str:
+    # NOTE: Dedup key of completed task which is kept until expires_at (dedup_seconds after
+    #  completed). Key of not completed task is held by unique index of topic table
+    return (
+        f'CREATE TABLE IF NOT EXISTS {dedup_table_name(table_name)} ('
+        '  queue_name VARCHAR(255) NOT NULL,'
+        '  dedup_key VARCHAR(255) NOT NULL,'
+        '  uuid BINARY(16) NOT NULL,'
+        '  expires_at BIGINT NOT NULL,'
+        'PRIMARY KEY (queue_name, dedup_key),'
+        'INDEX idx__expires_at (expires_at)'
+        ');'
+    )
+
+
+def result_table_name(table_name: str) -> str:
+    return f'{table_name}__results'
+
+
+def _create_result_table_query(table_name: str) -> str:
+    # NOTE: Result of completed task (encoded by codec of topic) which is kept until expires_at
+    return (
+        f'CREATE TABLE IF NOT EXISTS {result_table_name(table_name)} ('
+        '  uuid BINARY(16) NOT NULL,'
+        '  result MEDIUMBLOB NOT NULL,'
+        '  result_codec TINYINT NOT NULL DEFAULT 0,'
+        '  expires_at BIGINT NOT NULL,'
+        'PRIMARY KEY (uuid),'
+        'INDEX idx__expires_at (expires_at)'
+        ');'
+    )
+
+
+def count_table_name(table_name: str) -> str:
+    return f'{table_name}__counts'
+
+
+def _create_count_table_query(table_name: str) -> str:
+    # NOTE: Number of tasks of queue by status, summed over slots when read. Rows are changed by
+    #  deltas of writers (striped same as queue versions) when counting tasks is enabled
+    return (
+        f'CREATE TABLE IF NOT EXISTS {count_table_name(table_name)} ('
+        '  queue_name VARCHAR(255) NOT NULL,'
+        '  slot TINYINT NOT NULL,'
+        '  waiting BIGINT NOT NULL DEFAULT 0,'
+        '  in_progress BIGINT NOT NULL DEFAULT 0,'
+        '  dead_letter BIGINT NOT NULL DEFAULT 0,'
+        'PRIMARY KEY (queue_name, slot)'
+        ');'
+    )
+
+
+def side_table_names(table_name: str) -> List[str]:
+    # NOTE: Every table created along with topic table (e.g. to be dropped together)
+    return [
+        queue_table_name(table_name),
+        dependency_table_name(table_name),
+        dedup_table_name(table_name),
+        result_table_name(table_name),
+        count_table_name(table_name),
+    ]
+
+
+# NOTE: Claim orders by (priority DESC, scheduled_at or lease_expires_at, uuid) after equality
+#  on (queue_name, status), so index is read in order without filesort. uuid (time-ordered by
+#  default) keeps tasks of same priority and time in insertion order.
+#  Descending index part needs MySQL 8.0+ (ignored by older MySQL and MariaDB before 10.8)
+#  scheduled_at follows priority, so claim also examines (within index, without reading rows)
+#  tasks scheduled in future of higher priority than due ones, and it is not bounded by range of
+#  due tasks. In exchange due tasks are read in claim order up to limit, while leading
+#  scheduled_at would filesort whole backlog of due tasks on every claim
+_CLAIM_INDEX = 'INDEX idx__claim (queue_name, status, priority DESC, scheduled_at, uuid)'
+# NOTE: lease_expires_at follows priority, so pending claim also examines (within index, without
+#  reading rows) unexpired in-flight tasks of higher priority than expired ones. In-flight tasks
+#  are bounded by concurrency of consumers, and in exchange expired tasks are read in claim order
+#  up to limit. Leading lease_expires_at would bound scan to expired tasks but filesort all of them
+_PENDING_INDEX = 'INDEX idx__pending (queue_name, status, priority DESC, lease_expires_at, uuid)'
+# NOTE: NULL dedup_key (task without key) never conflicts
+_DEDUP_INDEX = 'UNIQUE INDEX idx__dedup (queue_name, dedup_key)'
+
+
+def create_table_queries(table_name: str) -> List[str]:
+    # NOTE: Topic table is created at last since its comment represents whole schema version
+    return [
+        _create_queue_table_query(table_name),
+        _create_dependency_table_query(table_name),
+        _create_dedup_table_query(table_name),
+        _create_result_table_query(table_name),
+        _create_count_table_query(table_name),
+        f'CREATE TABLE IF NOT EXISTS {table_name} ('
+        '  uuid BINARY(16) NOT NULL,'
+        '  status TINYINT NOT NULL,'
+        '  progressed_at BIGINT NOT NULL,'
+        # NOTE: WIP-ed task is abandoned after this (progressed_at for claims without lease)
+        '  lease_expires_at BIGINT NOT NULL DEFAULT 0,'
+        '  scheduled_at BIGINT NOT NULL,'
+        '  priority INT NOT NULL DEFAULT 0,'  # NOTE: Higher is claimed first
+        '  task MEDIUMBLOB NOT NULL,'
+        '  task_codec TINYINT NOT NULL DEFAULT 0,'  # NOTE: Codec tag of task (see codec.py)
+        '  queue_name VARCHAR(255) NOT NULL,'
+        '  depend_on BINARY(16) DEFAULT NULL,'
+        # NOTE: Number of not completed parents. Task is DEFERRED until it becomes 0
+        '  pending_parents INT NOT NULL DEFAULT 0,'
+        '  attempts INT NOT NULL DEFAULT 0,'  # NOTE: Incremented by every claim
+        '  max_attempts INT NOT NULL DEFAULT 0,'  # NOTE: Unlimited if 0
+        '  dedup_key VARCHAR(255) DEFAULT NULL,'
+        '  dedup_seconds INT NOT NULL DEFAULT 0,'  # NOTE: Key is kept after completed for this
+        'PRIMARY KEY (uuid),'
+        f'{_CLAIM_INDEX},'
+        f'{_PENDING_INDEX},'
+        f'{_DEDUP_INDEX}'
+        f") COMMENT='{schema_comment(SCHEMA_VERSION)}';",
+    ]
+
+
+def _migrate_to_2(table_name: str) -> List[str]:
+    return [
+        f'ALTER TABLE {table_name}'
+        '  DROP INDEX idx__uuid,'
+        '  DROP INDEX idx__status,'
+        '  DROP INDEX idx__progressed_at,'
+        '  DROP INDEX idx__scheduled_at,'
+        '  DROP INDEX idx__is_urgent,'
+        '  DROP INDEX idx__queue_name,'
+        '  DROP INDEX idx__depend_on,'
+        '  ADD PRIMARY KEY (uuid),'
+        '  ADD INDEX idx__claim (queue_name, status, is_urgent, scheduled_at),'
+        '  ADD INDEX idx__pending (queue_name, status, is_urgent, progressed_at),'
+        f"  COMMENT='{schema_comment(2)}';",
+    ]
+
+
+def _migrate_to_3(table_name: str) -> List[str]:
+    return [
+        f'ALTER TABLE {table_name}'
+        '  ADD COLUMN uuid_binary BINARY(16) AFTER uuid,'
+        '  ADD COLUMN depend_on_binary BINARY(16) DEFAULT NULL AFTER depend_on;',
+        f'UPDATE {table_name} SET'
+        "  uuid_binary = UNHEX(REPLACE(uuid, '-', '')),"
+        "  depend_on_binary = UNHEX(REPLACE(depend_on, '-', ''));",
+        f'ALTER TABLE {table_name}'
+        '  DROP PRIMARY KEY,'
+        '  DROP COLUMN uuid,'
+        '  DROP COLUMN depend_on;',
+        f'ALTER TABLE {table_name}'
+        '  CHANGE uuid_binary uuid BINARY(16) NOT NULL,'
+        '  CHANGE depend_on_binary depend_on BINARY(16) DEFAULT NULL,'
+        '  ADD PRIMARY KEY (uuid),'
+        f"  COMMENT='{schema_comment(3)}';",
+    ]
+
+
+def _migrate_to_4(table_name: str) -> List[str]:
+    return [
+        _create_queue_table_query(table_name),
+        f"ALTER TABLE {table_name} COMMENT='{schema_comment(4)}';",
+    ]
+
+
+def _migrate_to_5(table_name: str) -> List[str]:
+    dependency_table = dependency_table_name(table_name)
+    return [
+        _create_dependency_table_query(table_name),
+        f'ALTER TABLE {table_name}'
+        '  ADD COLUMN pending_parents INT NOT NULL DEFAULT 0;',
+        f'INSERT IGNORE INTO {dependency_table} (parent, child)'
+        f'  SELECT parent.uuid, child.uuid FROM {table_name} child'
+        f'  JOIN {table_name} parent ON child.depend_on = parent.uuid;',
+        f'UPDATE {table_name} child'
+        f'  JOIN {dependency_table} dependency ON dependency.child = child.uuid'
+        '  SET child.pending_parents = 1,'
+        '  child.status = IF(child.status = 2, 1, child.status);',  # NOTE: QUEUED to DEFERRED
+        f"ALTER TABLE {table_name} COMMENT='{schema_comment(5)}';",
+    ]
+
+
+def _migrate_to_6(table_name: str) -> List[str]:
+    # NOTE: Existing utf-8 JSON text is kept as bytes and decoded by JSON codec (tag 0)
+    return [
+        f'ALTER TABLE {table_name}'
+        '  MODIFY task MEDIUMBLOB NOT NULL,'
+        '  ADD COLUMN task_codec TINYINT NOT NULL DEFAULT 0 AFTER task,'
+        f"  COMMENT='{schema_comment(6)}';",
+    ]
+
+
+def _migrate_to_7(table_name: str) -> List[str]:
+    return [
+        f'ALTER TABLE {table_name}'
+        '  ADD COLUMN priority INT NOT NULL DEFAULT 0 AFTER scheduled_at;',
+        f'UPDATE {table_name} SET priority = 1 WHERE is_urgent;',  # NOTE: URGENT_PRIORITY
+        f'ALTER TABLE {table_name}'
+        '  DROP INDEX idx__claim,'
+        '  DROP INDEX idx__pending,'
+        '  DROP COLUMN is_urgent,'
+        f'  ADD {_CLAIM_INDEX},'
+        '  ADD INDEX idx__pending (queue_name, status, priority DESC, progressed_at, uuid),'
+        f"  COMMENT='{schema_comment(7)}';",
+    ]
+
+
+def _migrate_to_8(table_name: str) -> List[str]:
+    # NOTE: Claims before leases are treated as claims with lease of 0 seconds
+    return [
+        f'ALTER TABLE {table_name}'
+        '  ADD COLUMN lease_expires_at BIGINT NOT NULL DEFAULT 0 AFTER progressed_at;',
+        f'UPDATE {table_name} SET lease_expires_at = progressed_at;',
+        f'ALTER TABLE {table_name}'
+        '  DROP INDEX idx__pending,'
+        f'  ADD {_PENDING_INDEX},'
+        f"  COMMENT='{schema_comment(8)}';",
+    ]
+
+
+def _migrate_to_9(table_name: str) -> List[str]:
+    return [
+        f'ALTER TABLE {table_name}'
+        '  ADD COLUMN attempts INT NOT NULL DEFAULT 0,'
+        '  ADD COLUMN max_attempts INT NOT NULL DEFAULT 0,'
+        f"  COMMENT='{schema_comment(9)}';",
+    ]
+
+
+def _migrate_to_10(table_name: str) -> List[str]:
+    return [
+        _create_dedup_table_query(table_name),
+        f'ALTER TABLE {table_name}'
+        '  ADD COLUMN dedup_key VARCHAR(255) DEFAULT NULL,'
+        '  ADD COLUMN dedup_seconds INT NOT NULL DEFAULT 0,'
+        f'  ADD {_DEDUP_INDEX},'
+        f"  COMMENT='{schema_comment(10)}';",
+    ]
+
+
+def _migrate_to_11(table_name: str) -> List[str]:
+    return [
+        _create_result_table_query(table_name),
+        f"ALTER TABLE {table_name} COMMENT='{schema_comment(11)}';",
+    ]
+
+
+def _migrate_to_12(table_name: str) -> List[str]:
+    return [
+        _create_count_table_query(table_name),
+        f"ALTER TABLE {table_name} COMMENT='{schema_comment(12)}';",
+    ]
+
+
+# NOTE: MIGRATIONS[version] upgrades topic table from (version - 1) to version
+MIGRATIONS: Dict[int, Callable[[str], List[str]]] = {
+    2: _migrate_to_2,
+    3: _migrate_to_3,
+    4: _migrate_to_4,
+    5: _migrate_to_5,
+    6: _migrate_to_6,
+    7: _migrate_to_7,
+    8: _migrate_to_8,
+    9: _migrate_to_9,
+    10: _migrate_to_10,
+    11: _migrate_to_11,
+    12: _migrate_to_12,
+}
+
+
+def migration_queries(table_name: str, current_version: Optional[int]) -> List[str]:
+    if current_version is None:
+        return create_table_queries(table_name)
+    return [
+        query
+        for version in range(current_version + 1, SCHEMA_VERSION + 1)
+        for query in MIGRATIONS[version](table_name)
+    ]
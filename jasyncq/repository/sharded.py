@@ -0,0 +1,405 @@
+import asyncio
+import copy
+import enum
+import logging
+import zlib
+from contextlib import asynccontextmanager, AsyncExitStack
+from typing import (
+    List, Dict, Optional, Callable, Any, Awaitable, Sequence, Tuple, AsyncIterator,
+)
+from uuid import UUID
+
+from aiomysql import Pool
+
+from jasyncq import wakeup
+from jasyncq.repository.abstract import AbstractTaskRepository, _weighted_limits
+from jasyncq.repository.model.stats import QueueStats, StatsMode, QUEUE_COUNTERS
+from jasyncq.repository.model.task import TaskRowIn, TaskRow, TaskFilter
+from jasyncq.repository.tasks import TaskRepository
+
+# NOTE: Index of shard is kept in lowest bits of task id (random bits of UUIDv7),
+#  so task is routed by its id without lookup
+SHARD_BITS = 16
+SHARD_MASK = (1 << SHARD_BITS) - 1
+
+
+class ShardClaim(enum.Enum):
+    # NOTE: Shards one by one from rotating start until limit is filled (or max_claim_shards
+    #  shards were claimed)
+    ROTATION = 'rotation'
+    PARALLEL = 'parallel'  # All shards at once with equal share of limit
+
+
+def _shard_task_id_factory(
+    index: int,
+    task_id_factory: Callable[[], UUID],
+) -> Callable[[], UUID]:
+    # NOTE: Factory of shard of other sharded repository is unwrapped, so bits are not nested
+    task_id_factory = getattr(task_id_factory, '__wrapped__', task_id_factory)
+
+    def _task_id() -> UUID:
+        return UUID(int=task_id_factory().int & ~SHARD_MASK | index)
+
+    _task_id.__wrapped__ = task_id_factory
+    return _task_id
+
+
+def shard_of(task_id: str) -> int:
+    return UUID(task_id).int & SHARD_MASK
+
+
+class ShardedTaskRepository(AbstractTaskRepository):
+    # NOTE: Spreads a topic over several repositories (tables or servers). Task is routed by
+    #  crc32 of its routing key (or dedup key, round robin without both), and task with parents
+    #  is routed to shard of its parents, so dependencies are resolved within a shard
+    def __init__(
+        self,
+        shards: Sequence[AbstractTaskRepository],
+        topic_name: str = 'default_topic',
+        routing_key: Optional[Callable[[TaskRowIn], Any]] = None,
+        shard_claim: ShardClaim = ShardClaim.ROTATION,
+        max_claim_shards: int = 2,
+    ):
+        if not 0 < len(shards) <= SHARD_MASK + 1:
+            raise ValueError(f'Count of shards should be in 1..{SHARD_MASK + 1}: {len(shards)}')
+        if max_claim_shards < 1:
+            raise ValueError(f'max_claim_shards should be positive: {max_claim_shards}')
+        # NOTE: Shards are shallow copies generating ids of their index, so repositories given
+        #  are not changed (and could be wrapped again). Use self.shards to reach them (e.g. close)
+        self.shards = [copy.copy(shard) for shard in shards]
+        self.topic_name = topic_name
+        self.routing_key = routing_key
+        self.shard_claim = shard_claim
+        # NOTE: Claim of ROTATION makes at most this many round-trips even if shards are empty,
+        #  so idle polling does not grow with count of shards. Start rotates on every claim, so
+        #  tasks of any shard are reached within ceil(shards / max_claim_shards) claims
+        self.max_claim_shards = max_claim_shards
+        self.table_name = f'jasyncq_{topic_name}'
+        for index, shard in enumerate(self.shards):
+            shard.task_id_factory = _shard_task_id_factory(index, shard.task_id_factory)
+            # NOTE: Shards notify waiters of their own table (on insert, release of children and
+            #  reschedule), and consumers wait for sharded topic
+            wakeup.forward(shard.table_name, self.table_name)
+        self._shard_rotation = 0
+        self._insert_rotation = 0
+
+    @classmethod
+    def for_tables(
+        cls,
+        pool: Pool,
+        topic_name: str,
+        shard_count: int,
+        routing_key: Optional[Callable[[TaskRowIn], Any]] = None,
+        shard_claim: ShardClaim = ShardClaim.ROTATION,
+        max_claim_shards: int = 2,
+        **kwargs,
+    ) -> 'ShardedTaskRepository':
+        # NOTE: Shards are tables of `jasyncq_{topic_name}__{index}` on one server
+        return cls(
+            shards=[
+                TaskRepository(pool=pool, topic_name=f'{topic_name}__{index}', **kwargs)
+                for index in range(shard_count)
+            ],
+            topic_name=topic_name,
+            routing_key=routing_key,
+            shard_claim=shard_claim,
+            max_claim_shards=max_claim_shards,
+        )
+
+    @classmethod
+    def for_pools(
+        cls,
+        pools: Sequence[Pool],
+        topic_name: str,
+        routing_key: Optional[Callable[[TaskRowIn], Any]] = None,
+        shard_claim: ShardClaim = ShardClaim.ROTATION,
+        max_claim_shards: int = 2,
+        **kwargs,
+    ) -> 'ShardedTaskRepository':
+        # NOTE: Shards are tables of `jasyncq_{topic_name}` on each server
+        return cls(
+            shards=[TaskRepository(pool=pool, topic_name=topic_name, **kwargs) for pool in pools],
+            topic_name=topic_name,
+            routing_key=routing_key,
+            shard_claim=shard_claim,
+            max_claim_shards=max_claim_shards,
+        )
+
+    async def initialize(self):
+        await asyncio.gather(*[shard.initialize() for shard in self.shards])
+
+    @asynccontextmanager
+    async def pin_claim_connection(self) -> AsyncIterator[None]:
+        # NOTE: Each shard pins its own connection, so shards could be claimed in parallel
+        async with AsyncExitStack() as stack:
+            for shard in self.shards:
+                await stack.enter_async_context(shard.pin_claim_connection())
+            yield
+
+    def _shard_index(self, task_id: str) -> int:
+        index = shard_of(task_id)
+        if index >= len(self.shards):
+            raise ValueError(f'Task {task_id} is not a task of {self.table_name}')
+        return index
+
+    def _group_by_shard(self, task_ids: List[str]) -> Dict[int, List[str]]:
+        task_ids_by_shard: Dict[int, List[str]] = {}
+        for task_id in task_ids:
+            task_ids_by_shard.setdefault(self._shard_index(task_id), []).append(task_id)
+        return task_ids_by_shard
+
+    async def _claim(
+        self,
+        limit: int,
+        claim: Callable[[AbstractTaskRepository, int], Awaitable[List[TaskRow]]],
+    ) -> List[TaskRow]:
+        rotation = self._shard_rotation
+        self._shard_rotation += 1
+        if self.shard_claim == ShardClaim.PARALLEL:
+            shard_limits = _weighted_limits(
+                {index: 1 for index in range(len(self.shards))}, limit, rotation)
+            results = await asyncio.gather(*[
+                claim(self.shards[index], shard_limit)
+                for index, shard_limit in shard_limits.items()
+                if shard_limit > 0
+            ])
+            return [task_row for task_rows in results for task_row in task_rows]
+
+        # NOTE: Each claim starts from shard after shards of previous claim, so consumers are
+        #  spread over shards and all shards are visited over consecutive claims
+        probes = min(self.max_claim_shards, len(self.shards))
+        task_rows = []
+        for offset in range(probes):
+            shard = self.shards[(rotation * probes + offset) % len(self.shards)]
+            task_rows.extend(await claim(shard, limit - len(task_rows)))
+            if len(task_rows) >= limit:
+                break
+        return task_rows
+
+    async def fetch_scheduled_tasks(
+        self,
+        offset: int,
+        limit: int,
+        queue_name: str,
+        ignore_dependency: bool = False,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        # NOTE: Offset is applied within each shard
+        return await self._claim(limit, lambda shard, shard_limit: shard.fetch_scheduled_tasks(
+            offset=offset,
+            limit=shard_limit,
+            queue_name=queue_name,
+            ignore_dependency=ignore_dependency,
+            lease_seconds=lease_seconds,
+        ))
+
+    async def fetch_pending_tasks(
+        self,
+        offset: int,
+        limit: int,
+        check_term_seconds: int,
+        queue_name: str,
+        ignore_dependency: bool = False,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        return await self._claim(limit, lambda shard, shard_limit: shard.fetch_pending_tasks(
+            offset=offset,
+            limit=shard_limit,
+            check_term_seconds=check_term_seconds,
+            queue_name=queue_name,
+            ignore_dependency=ignore_dependency,
+            lease_seconds=lease_seconds,
+        ))
+
+    async def fetch_tasks(
+        self,
+        limit: int,
+        queue_name: str,
+        check_term_seconds: int,
+        ignore_dependency: bool = False,
+        pending_first: bool = True,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        return await self._claim(limit, lambda shard, shard_limit: shard.fetch_tasks(
+            limit=shard_limit,
+            queue_name=queue_name,
+            check_term_seconds=check_term_seconds,
+            ignore_dependency=ignore_dependency,
+            pending_first=pending_first,
+            lease_seconds=lease_seconds,
+        ))
+
+    async def fetch_tasks_from_queues(
+        self,
+        queue_weights: Dict[str, int],
+        limit: int,
+        check_term_seconds: int,
+        ignore_dependency: bool = False,
+        pending_first: bool = True,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        return await self._claim(limit, lambda shard, shard_limit: shard.fetch_tasks_from_queues(
+            queue_weights=queue_weights,
+            limit=shard_limit,
+            check_term_seconds=check_term_seconds,
+            ignore_dependency=ignore_dependency,
+            pending_first=pending_first,
+            lease_seconds=lease_seconds,
+        ))
+
+    def _route(self, task: TaskRowIn) -> int:
+        parents = [*task.dependencies, *filter(None, [task.depend_on])]
+        if parents and task.dedup_key is not None:
+            # NOTE: Duplicates with other parents (or without parents) would be routed to other
+            #  shards, where they are not detected
+            raise ValueError(f'Task with dedup key should not have parents: {task.dedup_key}')
+        if parents:
+            shard_indexes = {self._shard_index(str(parent)) for parent in parents}
+            if len(shard_indexes) > 1:
+                raise ValueError(f'Parents of task should be on same shard: {parents}')
+            return shard_indexes.pop()
+        if self.routing_key is not None:
+            key = str(self.routing_key(task)).encode()
+        elif task.dedup_key is not None:
+            # NOTE: Duplicates are routed to same shard to be detected by its unique index
+            key = f'{task.queue_name}:{task.dedup_key}'.encode()
+        else:
+            self._insert_rotation += 1
+            return self._insert_rotation % len(self.shards)
+        return zlib.crc32(key) % len(self.shards)
+
+    async def insert_tasks(self, tasks: List[TaskRowIn]) -> List[TaskRow]:
+        logging.debug(tasks)
+        positions_by_shard: Dict[int, List[int]] = {}
+        for position, task in enumerate(tasks):
+            positions_by_shard.setdefault(self._route(task), []).append(position)
+
+        # NOTE: Each shard inserts in its own transaction, so batch spanning shards is not atomic
+        shard_items: List[Tuple[int, List[int]]] = list(positions_by_shard.items())
+        results = await asyncio.gather(*[
+            self.shards[index].insert_tasks([tasks[position] for position in positions])
+            for index, positions in shard_items
+        ])
+        inserted_tasks: List[Optional[TaskRow]] = [None] * len(tasks)
+        for (_, positions), task_rows in zip(shard_items, results):
+            for position, task_row in zip(positions, task_rows):
+                inserted_tasks[position] = task_row
+        return inserted_tasks
+
+    async def delete_tasks(self, task_ids: List[str]):
+        logging.debug(task_ids)
+        await asyncio.gather(*[
+            self.shards[index].delete_tasks(task_ids_)
+            for index, task_ids_ in self._group_by_shard(task_ids).items()
+        ])
+
+    async def extend_leases(self, task_ids: List[str], lease_seconds: int):
+        await asyncio.gather(*[
+            self.shards[index].extend_leases(task_ids_, lease_seconds)
+            for index, task_ids_ in self._group_by_shard(task_ids).items()
+        ])
+
+    async def fail_tasks(
+        self,
+        task_ids: List[str],
+        base_delay_seconds: int,
+        max_delay_seconds: int,
+    ):
+        logging.debug(task_ids)
+        await asyncio.gather(*[
+            self.shards[index].fail_tasks(task_ids_, base_delay_seconds, max_delay_seconds)
+            for index, task_ids_ in self._group_by_shard(task_ids).items()
+        ])
+
+    async def fetch_dead_letter_tasks(
+        self,
+        offset: int,
+        limit: int,
+        queue_name: str,
+    ) -> List[TaskRow]:
+        # NOTE: Each shard returns its first offset + limit rows to be merged in same order
+        results = await asyncio.gather(*[
+            shard.fetch_dead_letter_tasks(offset=0, limit=offset + limit, queue_name=queue_name)
+            for shard in self.shards
+        ])
+        task_rows = sorted(
+            (task_row for task_rows in results for task_row in task_rows),
+            key=lambda task_row: (-task_row.priority, task_row.scheduled_at, task_row.uuid),
+        )
+        return task_rows[offset:offset + limit]
+
+    async def delete_tasks_by_filter(self, task_filter: TaskFilter, chunk_size: int) -> int:
+        counts = await asyncio.gather(*[
+            shard.delete_tasks_by_filter(task_filter, chunk_size) for shard in self.shards
+        ])
+        return sum(counts)
+
+    async def reschedule_tasks_by_filter(
+        self,
+        task_filter: TaskFilter,
+        scheduled_at: int,
+        chunk_size: int,
+    ) -> int:
+        counts = await asyncio.gather(*[
+            shard.reschedule_tasks_by_filter(task_filter, scheduled_at, chunk_size)
+            for shard in self.shards
+        ])
+        return sum(counts)
+
+    async def reprioritize_tasks_by_filter(
+        self,
+        task_filter: TaskFilter,
+        priority: int,
+        chunk_size: int,
+    ) -> int:
+        counts = await asyncio.gather(*[
+            shard.reprioritize_tasks_by_filter(task_filter, priority, chunk_size)
+            for shard in self.shards
+        ])
+        return sum(counts)
+
+    async def insert_results(self, results: Dict[str, Any], ttl_seconds: int):
+        # NOTE: Result is kept on shard of its task
+        await asyncio.gather(*[
+            self.shards[index].insert_results(
+                {task_id: results[task_id] for task_id in task_ids_}, ttl_seconds)
+            for index, task_ids_ in self._group_by_shard(list(results)).items()
+        ])
+
+    async def fetch_results(self, task_ids: List[str]) -> Dict[str, Any]:
+        results = await asyncio.gather(*[
+            self.shards[index].fetch_results(task_ids_)
+            for index, task_ids_ in self._group_by_shard(task_ids).items()
+        ])
+        return {task_id: result for results_ in results for task_id, result in results_.items()}
+
+    async def fetch_queue_stats(
+        self,
+        queue_names: List[str],
+        mode: StatsMode,
+    ) -> Dict[str, QueueStats]:
+        # NOTE: Counts are summed over shards, and lag is the largest one of shards
+        results = await asyncio.gather(*[
+            shard.fetch_queue_stats(queue_names, mode) for shard in self.shards
+        ])
+        stats = {}
+        for queue_name in queue_names:
+            shard_stats = [result[queue_name] for result in results]
+            stats[queue_name] = QueueStats(
+                queue_name=queue_name,
+                lag_seconds=max(queue_stats.lag_seconds for queue_stats in shard_stats),
+                **{
+                    counter: sum(getattr(queue_stats, counter) for queue_stats in shard_stats)
+                    for counter in QUEUE_COUNTERS
+                },
+            )
+        return stats
+
+    async def fetch_queue_versions(self, queue_names: List[str]) -> Dict[str, int]:
+        results = await asyncio.gather(*[
+            shard.fetch_queue_versions(queue_names) for shard in self.shards
+        ])
+        return {
+            queue_name: sum(versions.get(queue_name, 0) for versions in results)
+            for queue_name in queue_names
+        }
@@ -0,0 +1,806 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import (
+    List, Dict, Optional, Callable, Any, Sequence, Iterator, TypeVar, Tuple, Set, Iterable,
+)
+from uuid import UUID
+
+from jasyncq import wakeup
+from jasyncq.repository.abstract import (
+    AbstractTaskRepository, MAX_BACKOFF_SHIFT, _is_exhausted, _lag_seconds,
+)
+from jasyncq.repository.codec import PayloadCodec
+from jasyncq.repository.model.stats import QueueStats, StatsMode, STATUS_COUNTERS
+from jasyncq.repository.model.task import (
+    TaskStatus, TaskRowIn, TaskRow, TaskFilter, effective_priority,
+)
+from jasyncq.util import let_if, uuid7, uuid_str_from_binary
+
+BUSY_TIMEOUT_SECONDS = 30
+MAX_VARIABLES = 500  # NOTE: Under SQLITE_MAX_VARIABLE_NUMBER of old SQLite (999)
+
+T = TypeVar('T')
+
+_COLUMNS = (
+    'uuid, status, progressed_at, scheduled_at, priority, task, queue_name, depend_on, task_codec,'
+    ' attempts, max_attempts, dedup_key'
+)
+
+
+def _chunks(values: Sequence[T], size: int = MAX_VARIABLES) -> Iterator[Sequence[T]]:
+    for index in range(0, len(values), size):
+        yield values[index:index + size]
+
+
+def _placeholders(count: int) -> str:
+    return ', '.join('?' * count)
+
+
+class SQLiteTaskRepository(AbstractTaskRepository):
+    # NOTE: Durable single host backend. Queries run on one connection in one dedicated thread,
+    #  and every operation is one `BEGIN IMMEDIATE` transaction, so several processes could
+    #  share same database file (writers take turns)
+    def __init__(
+        self,
+        path: str,
+        topic_name: str = 'default_topic',
+        task_id_factory: Callable[[], UUID] = uuid7,
+        codec: Optional[PayloadCodec] = None,
+    ):
+        self.path = path
+        self.topic_name = topic_name
+        self.task_id_factory = task_id_factory
+        self.codec = codec or PayloadCodec()
+        self.table_name = f'jasyncq_{topic_name}'
+        self.dependency_table_name = f'{self.table_name}__dependencies'
+        self.queue_table_name = f'{self.table_name}__queues'
+        self.dedup_table_name = f'{self.table_name}__dedup'
+        self.result_table_name = f'{self.table_name}__results'
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='jasyncq-sqlite')
+        self._connection: Optional[sqlite3.Connection] = None
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # NOTE: Autocommit mode, transactions are opened explicitly
+            connection = sqlite3.connect(
+                self.path,
+                timeout=BUSY_TIMEOUT_SECONDS,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._connection = connection
+        return self._connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Cursor]:
+        connection = self._connect()
+        cursor = connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        cursor.execute('COMMIT')
+
+    async def close(self):
+        def _close():
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+        await self._run(_close)
+        self._executor.shutdown(wait=False)
+
+    async def initialize(self):
+        await self._run(self._initialize)
+
+    def _initialize(self):
+        with self._transaction() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table_name} ('
+                '  uuid BLOB NOT NULL PRIMARY KEY,'
+                '  status INTEGER NOT NULL,'
+                '  progressed_at INTEGER NOT NULL,'
+                '  lease_expires_at INTEGER NOT NULL DEFAULT 0,'
+                '  scheduled_at INTEGER NOT NULL,'
+                '  priority INTEGER NOT NULL DEFAULT 0,'
+                '  task BLOB NOT NULL,'
+                '  task_codec INTEGER NOT NULL DEFAULT 0,'
+                '  queue_name TEXT NOT NULL,'
+                '  depend_on BLOB DEFAULT NULL,'
+                '  pending_parents INTEGER NOT NULL DEFAULT 0,'
+                '  attempts INTEGER NOT NULL DEFAULT 0,'
+                '  max_attempts INTEGER NOT NULL DEFAULT 0,'
+                '  dedup_key TEXT DEFAULT NULL,'
+                '  dedup_seconds INTEGER NOT NULL DEFAULT 0'
+                ') WITHOUT ROWID'
+            )
+            # NOTE: Same ordering as claim, so claim reads index in order (see schema.py)
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {self.table_name}__claim ON {self.table_name}'
+                '  (queue_name, status, priority DESC, scheduled_at, uuid)'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {self.table_name}__pending ON {self.table_name}'
+                '  (queue_name, status, priority DESC, lease_expires_at, uuid)'
+            )
+            cursor.execute(
+                f'CREATE UNIQUE INDEX IF NOT EXISTS {self.table_name}__dedup_key'
+                f'  ON {self.table_name} (queue_name, dedup_key)'
+            )
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.dedup_table_name} ('
+                '  queue_name TEXT NOT NULL,'
+                '  dedup_key TEXT NOT NULL,'
+                '  uuid BLOB NOT NULL,'
+                '  expires_at INTEGER NOT NULL,'
+                '  PRIMARY KEY (queue_name, dedup_key)'
+                ') WITHOUT ROWID'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {self.dedup_table_name}__expires_at'
+                f'  ON {self.dedup_table_name} (expires_at)'
+            )
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.dependency_table_name} ('
+                '  parent BLOB NOT NULL,'
+                '  child BLOB NOT NULL,'
+                '  PRIMARY KEY (parent, child)'
+                ') WITHOUT ROWID'
+            )
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.result_table_name} ('
+                '  uuid BLOB NOT NULL PRIMARY KEY,'
+                '  result BLOB NOT NULL,'
+                '  result_codec INTEGER NOT NULL DEFAULT 0,'
+                '  expires_at INTEGER NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {self.result_table_name}__expires_at'
+                f'  ON {self.result_table_name} (expires_at)'
+            )
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.queue_table_name} ('
+                '  queue_name TEXT NOT NULL PRIMARY KEY,'
+                '  version INTEGER NOT NULL DEFAULT 0'
+                ')'
+            )
+
+    def _task_row(self, row: Sequence[Any]) -> TaskRow:
+        return TaskRow(
+            uuid=uuid_str_from_binary(row[0]),
+            status=TaskStatus(row[1]),
+            progressed_at=row[2],
+            scheduled_at=row[3],
+            priority=row[4],
+            task=self.codec.decode(row[5], row[8]),
+            queue_name=row[6],
+            depend_on=let_if(row[7], uuid_str_from_binary),
+            attempts=row[9],
+            max_attempts=row[10],
+            dedup_key=row[11],
+        )
+
+    def _select_scheduled(
+        self,
+        cursor: sqlite3.Cursor,
+        offset: int,
+        limit: int,
+        queue_name: str,
+        ignore_dependency: bool,
+        current_epoch: float,
+    ) -> List[Any]:
+        if ignore_dependency:
+            status = f'status IN ({int(TaskStatus.DEFERRED)}, {int(TaskStatus.QUEUED)})'
+        else:
+            status = f'status = {int(TaskStatus.QUEUED)}'
+        cursor.execute(
+            f'SELECT {_COLUMNS} FROM {self.table_name}'
+            f'  WHERE queue_name = ? AND {status} AND scheduled_at <= ?'
+            '  ORDER BY priority DESC, scheduled_at, uuid LIMIT ? OFFSET ?',
+            (queue_name, current_epoch, limit, offset),
+        )
+        return cursor.fetchall()
+
+    def _select_pending(
+        self,
+        cursor: sqlite3.Cursor,
+        offset: int,
+        limit: int,
+        check_term_seconds: int,
+        queue_name: str,
+        ignore_dependency: bool,
+        current_epoch: float,
+    ) -> List[Any]:
+        # NOTE: Task which was claimed with ignoring dependency
+        dependency = '' if ignore_dependency else ' AND pending_parents = 0'
+        cursor.execute(
+            f'SELECT {_COLUMNS} FROM {self.table_name}'
+            f'  WHERE queue_name = ? AND status = {int(TaskStatus.WORK_IN_PROGRESS)}'
+            f'  AND lease_expires_at <= ?{dependency}'
+            '  ORDER BY priority DESC, lease_expires_at, uuid LIMIT ? OFFSET ?',
+            (queue_name, int(current_epoch) - check_term_seconds, limit, offset),
+        )
+        return cursor.fetchall()
+
+    def _claim(
+        self,
+        select: Callable[[sqlite3.Cursor], List[Any]],
+        current_epoch: float,
+        lease_seconds: int,
+    ) -> List[TaskRow]:
+        with self._transaction() as cursor:
+            rows = []
+            exhausted_uuids = []
+            for row in select(cursor):
+                if _is_exhausted(row[9], row[10]):
+                    exhausted_uuids.append(row[0])
+                else:
+                    rows.append(row)
+            # NOTE: Task claimed over its max attempts (crashed on every attempt) is dead-lettered
+            for uuids in _chunks(exhausted_uuids):
+                cursor.execute(
+                    f'UPDATE {self.table_name} SET status = {int(TaskStatus.DEAD_LETTER)}'
+                    f'  WHERE uuid IN ({_placeholders(len(uuids))})',
+                    uuids,
+                )
+            for uuids in _chunks([row[0] for row in rows]):
+                cursor.execute(
+                    f'UPDATE {self.table_name}'
+                    f'  SET status = {int(TaskStatus.WORK_IN_PROGRESS)}, progressed_at = ?,'
+                    '  lease_expires_at = ?, attempts = attempts + 1'
+                    f'  WHERE uuid IN ({_placeholders(len(uuids))})',
+                    (int(current_epoch), int(current_epoch) + lease_seconds, *uuids),
+                )
+        logging.debug(rows)
+        return [self._task_row(row) for row in rows]
+
+    async def fetch_scheduled_tasks(
+        self,
+        offset: int,
+        limit: int,
+        queue_name: str,
+        ignore_dependency: bool = False,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        current_epoch = time.time()
+
+        return await self._run(self._claim, lambda cursor: self._select_scheduled(
+            cursor, offset, limit, queue_name, ignore_dependency, current_epoch,
+        ), current_epoch, lease_seconds)
+
+    async def fetch_pending_tasks(
+        self,
+        offset: int,
+        limit: int,
+        check_term_seconds: int,
+        queue_name: str,
+        ignore_dependency: bool = False,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        current_epoch = time.time()
+
+        return await self._run(self._claim, lambda cursor: self._select_pending(
+            cursor, offset, limit, check_term_seconds, queue_name, ignore_dependency,
+            current_epoch,
+        ), current_epoch, lease_seconds)
+
+    async def fetch_tasks(
+        self,
+        limit: int,
+        queue_name: str,
+        check_term_seconds: int,
+        ignore_dependency: bool = False,
+        pending_first: bool = True,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        current_epoch = time.time()
+
+        selects = [
+            lambda cursor, limit_: self._select_pending(
+                cursor, 0, limit_, check_term_seconds, queue_name, ignore_dependency,
+                current_epoch,
+            ),
+            lambda cursor, limit_: self._select_scheduled(
+                cursor, 0, limit_, queue_name, ignore_dependency, current_epoch,
+            ),
+        ]
+        if not pending_first:
+            selects.reverse()
+
+        def select(cursor: sqlite3.Cursor) -> List[Any]:
+            rows = []
+            for select_ in selects:
+                if len(rows) < limit:
+                    rows.extend(select_(cursor, limit - len(rows)))
+            return rows
+
+        return await self._run(self._claim, select, current_epoch, lease_seconds)
+
+    async def insert_tasks(self, tasks: List[TaskRowIn]) -> List[TaskRow]:
+        logging.debug(tasks)
+        if not tasks:
+            return []
+        encoded_tasks = [self.codec.encode(task.task) for task in tasks]
+        inserted_tasks = await self._run(self._insert_tasks, tasks, encoded_tasks)
+        wakeup.notify(self.table_name, {task.queue_name for task in tasks})
+        return inserted_tasks
+
+    def _insert_tasks(self, tasks: List[TaskRowIn], encoded_tasks: List[Any]) -> List[TaskRow]:
+        task_ids = [self.task_id_factory() for _ in tasks]
+        parents_by_task = [
+            {UUID(parent) for parent in [*task.dependencies, *filter(None, [task.depend_on])]}
+            for task in tasks
+        ]
+        with self._transaction() as cursor:
+            parents = [parent.bytes for parent in set().union(*parents_by_task)]
+            unfinished_parents = set()
+            for parents_ in _chunks(parents):
+                cursor.execute(
+                    f'SELECT uuid FROM {self.table_name}'
+                    f'  WHERE uuid IN ({_placeholders(len(parents_))})',
+                    parents_,
+                )
+                unfinished_parents.update(UUID(bytes=row[0]) for row in cursor.fetchall())
+
+            holders = self._fetch_dedup_holders(cursor, tasks)
+            inserted_tasks = []
+            insert_args = []
+            dependency_args = []
+            for task, (encoded_task, task_codec), task_id, parents_ in zip(
+                tasks, encoded_tasks, task_ids, parents_by_task,
+            ):
+                holder = holders.get((task.queue_name, task.dedup_key))
+                if holder is not None:
+                    inserted_tasks.append(holder)
+                    continue
+                pending_parents = parents_ & unfinished_parents
+                task_row = TaskRow(
+                    uuid=str(task_id),
+                    status=TaskStatus.DEFERRED if pending_parents else TaskStatus.QUEUED,
+                    progressed_at=0,
+                    scheduled_at=task.scheduled_at,
+                    priority=effective_priority(task.priority, task.is_urgent),
+                    task=task.task,
+                    queue_name=task.queue_name,
+                    depend_on=task.depend_on,
+                    max_attempts=task.max_attempts,
+                    dedup_key=task.dedup_key,
+                )
+                if task.dedup_key is not None:
+                    holders[(task.queue_name, task.dedup_key)] = task_row
+                insert_args.append((
+                    task_id.bytes,
+                    int(task_row.status),
+                    task_row.progressed_at,
+                    task_row.scheduled_at,
+                    task_row.priority,
+                    encoded_task,
+                    task_row.queue_name,
+                    let_if(task_row.depend_on, lambda depend_on: UUID(depend_on).bytes),
+                    task_codec,
+                    task_row.attempts,
+                    task_row.max_attempts,
+                    task_row.dedup_key,
+                    task.dedup_seconds,
+                    len(pending_parents),
+                ))
+                dependency_args.extend(
+                    (parent.bytes, task_id.bytes) for parent in pending_parents)
+                inserted_tasks.append(task_row)
+
+            cursor.executemany(
+                f'INSERT INTO {self.table_name} ({_COLUMNS}, dedup_seconds, pending_parents)'
+                f'  VALUES ({_placeholders(14)})',
+                insert_args,
+            )
+            cursor.executemany(
+                f'INSERT OR IGNORE INTO {self.dependency_table_name} (parent, child)'
+                '  VALUES (?, ?)',
+                dependency_args,
+            )
+            self._bump_queue_versions_in(cursor, {task.queue_name for task in tasks})
+        return inserted_tasks
+
+    def _bump_queue_versions_in(self, cursor: sqlite3.Cursor, queue_names: Iterable[str]):
+        cursor.executemany(
+            f'INSERT INTO {self.queue_table_name} (queue_name, version) VALUES (?, 1)'
+            '  ON CONFLICT (queue_name) DO UPDATE SET version = version + 1',
+            [(queue_name,) for queue_name in sorted(queue_names)],
+        )
+
+    def _bump_queue_versions(self, queue_names: List[str]):
+        with self._transaction() as cursor:
+            self._bump_queue_versions_in(cursor, queue_names)
+
+    async def delete_tasks(self, task_ids: List[str]):
+        logging.debug(task_ids)
+        if not task_ids:
+            return
+        released_queue_names = await self._run(
+            self._delete_tasks, [UUID(task_id).bytes for task_id in task_ids])
+        if released_queue_names:
+            wakeup.notify(self.table_name, released_queue_names)
+
+    def _fetch_dedup_holders(
+        self,
+        cursor: sqlite3.Cursor,
+        tasks: List[TaskRowIn],
+    ) -> Dict[Tuple[str, str], TaskRow]:
+        # NOTE: Writers are serialized by BEGIN IMMEDIATE, so holders are looked up before insert
+        #  instead of ON CONFLICT
+        dedup_keys_by_queue: Dict[str, Set[str]] = {}
+        for task in tasks:
+            if task.dedup_key is not None:
+                dedup_keys_by_queue.setdefault(task.queue_name, set()).add(task.dedup_key)
+        holders = {}
+        completed_task_ids: Dict[Tuple[str, str], bytes] = {}
+        for queue_name, dedup_keys in dedup_keys_by_queue.items():
+            for dedup_keys_ in _chunks(sorted(dedup_keys)):
+                cursor.execute(
+                    f'SELECT {_COLUMNS} FROM {self.table_name}'
+                    f'  WHERE queue_name = ? AND dedup_key IN ({_placeholders(len(dedup_keys_))})',
+                    (queue_name, *dedup_keys_),
+                )
+                holders.update({
+                    (queue_name, task_row.dedup_key): task_row
+                    for task_row in map(self._task_row, cursor.fetchall())
+                })
+                cursor.execute(
+                    f'SELECT dedup_key, uuid FROM {self.dedup_table_name}'
+                    f'  WHERE queue_name = ? AND dedup_key IN ({_placeholders(len(dedup_keys_))})'
+                    '  AND expires_at > ?',
+                    (queue_name, *dedup_keys_, int(time.time())),
+                )
+                completed_task_ids.update({
+                    (queue_name, dedup_key): uuid for dedup_key, uuid in cursor.fetchall()
+                })
+        # NOTE: Completed task is not kept, so it is returned as applied with its id
+        for task in tasks:
+            key = (task.queue_name, task.dedup_key)
+            if key in completed_task_ids and key not in holders:
+                holders[key] = TaskRow(
+                    uuid=uuid_str_from_binary(completed_task_ids[key]),
+                    status=TaskStatus.COMPLETED,
+                    progressed_at=0,
+                    scheduled_at=task.scheduled_at,
+                    priority=effective_priority(task.priority, task.is_urgent),
+                    task=task.task,
+                    queue_name=task.queue_name,
+                    depend_on=task.depend_on,
+                    max_attempts=task.max_attempts,
+                    dedup_key=task.dedup_key,
+                )
+        return holders
+
+    def _delete_tasks(self, uuids: List[bytes]) -> Set[str]:
+        with self._transaction() as cursor:
+            # NOTE: Dedup keys are kept for dedup_seconds of completed tasks
+            current_epoch = int(time.time())
+            kept = 0
+            for uuids_ in _chunks(uuids):
+                cursor.execute(
+                    f'INSERT OR REPLACE INTO {self.dedup_table_name}'
+                    '  (queue_name, dedup_key, uuid, expires_at)'
+                    '  SELECT queue_name, dedup_key, uuid, ? + dedup_seconds'
+                    f'  FROM {self.table_name}'
+                    f'  WHERE uuid IN ({_placeholders(len(uuids_))})'
+                    '  AND dedup_key IS NOT NULL AND dedup_seconds > 0',
+                    (current_epoch, *uuids_),
+                )
+                kept += cursor.rowcount
+            if kept > 0:
+                cursor.execute(
+                    f'DELETE FROM {self.dedup_table_name} WHERE expires_at <= ?', (current_epoch,))
+            return self._delete_in(cursor, uuids)
+
+    def _delete_in(self, cursor: sqlite3.Cursor, uuids: Sequence[bytes]) -> Set[str]:
+        # NOTE: Returns queue names of released children, to be notified after commit
+        children = Counter()
+        for uuids_ in _chunks(uuids):
+            placeholders = _placeholders(len(uuids_))
+            cursor.execute(
+                f'DELETE FROM {self.table_name} WHERE uuid IN ({placeholders})', uuids_)
+            cursor.execute(
+                f'SELECT child FROM {self.dependency_table_name}'
+                f'  WHERE parent IN ({placeholders})',
+                uuids_,
+            )
+            children.update(row[0] for row in cursor.fetchall())
+            cursor.execute(
+                f'DELETE FROM {self.dependency_table_name} WHERE parent IN ({placeholders})',
+                uuids_,
+            )
+        # NOTE: Right side of SET refers values before update in SQLite
+        cursor.executemany(
+            f'UPDATE {self.table_name} SET'
+            '  pending_parents = pending_parents - ?,'
+            f'  status = CASE WHEN status = {int(TaskStatus.DEFERRED)}'
+            f'    AND pending_parents - ? <= 0 THEN {int(TaskStatus.QUEUED)} ELSE status END'
+            '  WHERE uuid = ?',
+            [(count, count, child) for child, count in children.items()],
+        )
+        released_queue_names = set()
+        for children_ in _chunks(list(children)):
+            cursor.execute(
+                f'SELECT DISTINCT queue_name FROM {self.table_name}'
+                f'  WHERE uuid IN ({_placeholders(len(children_))})'
+                f'  AND status = {int(TaskStatus.QUEUED)} AND pending_parents = 0',
+                children_,
+            )
+            released_queue_names.update(row[0] for row in cursor.fetchall())
+        self._bump_queue_versions_in(cursor, released_queue_names)
+        return released_queue_names
+
+    @staticmethod
+    def _filter_clause(task_filter: TaskFilter) -> Tuple[str, List[Any]]:
+        clause = (
+            f'queue_name = ? AND status IN ({_placeholders(len(task_filter.statuses))})')
+        args = [task_filter.queue_name, *[int(status) for status in task_filter.statuses]]
+        for condition, value in [
+            ('scheduled_at >= ?', task_filter.scheduled_from),
+            ('scheduled_at < ?', task_filter.scheduled_to),
+            ('priority >= ?', task_filter.min_priority),
+            ('priority <= ?', task_filter.max_priority),
+        ]:
+            if value is not None:
+                clause += f' AND {condition}'
+                args.append(value)
+        return clause, args
+
+    def _execute_in_chunks(self, chunk_size: int, execute: Callable[[sqlite3.Cursor], int]) -> int:
+        # NOTE: Each chunk is one transaction, so other writers take turns in between
+        count = 0
+        while True:
+            with self._transaction() as cursor:
+                changed = execute(cursor)
+            count += changed
+            if changed < chunk_size:
+                return count
+
+    async def delete_tasks_by_filter(self, task_filter: TaskFilter, chunk_size: int) -> int:
+        logging.debug(task_filter)
+        if not task_filter.statuses:
+            return 0
+        clause, args = self._filter_clause(task_filter)
+        released_queue_names: Set[str] = set()
+
+        def delete_chunk(cursor: sqlite3.Cursor) -> int:
+            cursor.execute(
+                f'SELECT uuid FROM {self.table_name} WHERE {clause} LIMIT ?', (*args, chunk_size))
+            uuids = [row[0] for row in cursor.fetchall()]
+            released_queue_names.update(self._delete_in(cursor, uuids))
+            return len(uuids)
+
+        count = await self._run(self._execute_in_chunks, chunk_size, delete_chunk)
+        if released_queue_names:
+            wakeup.notify(self.table_name, released_queue_names)
+        return count
+
+    async def _update_by_filter(
+        self,
+        task_filter: TaskFilter,
+        column: str,
+        value: int,
+        chunk_size: int,
+    ) -> int:
+        if not task_filter.statuses:
+            return 0
+        clause, args = self._filter_clause(task_filter)
+
+        # NOTE: UPDATE ... LIMIT is not in default build of SQLite
+        def update_chunk(cursor: sqlite3.Cursor) -> int:
+            cursor.execute(
+                f'UPDATE {self.table_name} SET {column} = ? WHERE uuid IN ('
+                f'  SELECT uuid FROM {self.table_name} WHERE {clause} AND {column} != ? LIMIT ?'
+                ')',
+                (value, *args, value, chunk_size),
+            )
+            return cursor.rowcount
+
+        return await self._run(self._execute_in_chunks, chunk_size, update_chunk)
+
+    async def reschedule_tasks_by_filter(
+        self,
+        task_filter: TaskFilter,
+        scheduled_at: int,
+        chunk_size: int,
+    ) -> int:
+        logging.debug(task_filter)
+        count = await self._update_by_filter(task_filter, 'scheduled_at', scheduled_at, chunk_size)
+        if count:
+            await self._run(self._bump_queue_versions, [task_filter.queue_name])
+            wakeup.notify(self.table_name, [task_filter.queue_name])
+        return count
+
+    async def reprioritize_tasks_by_filter(
+        self,
+        task_filter: TaskFilter,
+        priority: int,
+        chunk_size: int,
+    ) -> int:
+        logging.debug(task_filter)
+        return await self._update_by_filter(task_filter, 'priority', priority, chunk_size)
+
+    async def extend_leases(self, task_ids: List[str], lease_seconds: int):
+        if task_ids:
+            await self._run(
+                self._extend_leases,
+                [UUID(task_id).bytes for task_id in task_ids],
+                int(time.time()) + lease_seconds,
+            )
+
+    def _extend_leases(self, uuids: List[bytes], lease_expires_at: int):
+        with self._transaction() as cursor:
+            for uuids_ in _chunks(uuids):
+                cursor.execute(
+                    f'UPDATE {self.table_name} SET lease_expires_at = ?'
+                    f'  WHERE uuid IN ({_placeholders(len(uuids_))})'
+                    f'  AND status = {int(TaskStatus.WORK_IN_PROGRESS)}',
+                    (lease_expires_at, *uuids_),
+                )
+
+    async def fail_tasks(
+        self,
+        task_ids: List[str],
+        base_delay_seconds: int,
+        max_delay_seconds: int,
+    ):
+        logging.debug(task_ids)
+        if task_ids:
+            await self._run(
+                self._fail_tasks,
+                [UUID(task_id).bytes for task_id in task_ids],
+                int(time.time()),
+                base_delay_seconds,
+                max_delay_seconds,
+            )
+
+    def _fail_tasks(
+        self,
+        uuids: List[bytes],
+        current_epoch: int,
+        base_delay_seconds: int,
+        max_delay_seconds: int,
+    ):
+        # NOTE: Same as MySQL statement. Multi-argument MIN/MAX are scalar functions in SQLite
+        with self._transaction() as cursor:
+            for uuids_ in _chunks(uuids):
+                cursor.execute(
+                    f'UPDATE {self.table_name} SET'
+                    '  status = CASE WHEN max_attempts > 0 AND attempts >= max_attempts'
+                    f'    THEN {int(TaskStatus.DEAD_LETTER)}'
+                    f'    WHEN pending_parents > 0 THEN {int(TaskStatus.DEFERRED)}'
+                    f'    ELSE {int(TaskStatus.QUEUED)} END,'
+                    '  scheduled_at = CASE WHEN max_attempts > 0 AND attempts >= max_attempts'
+                    '    THEN scheduled_at ELSE ? + MIN('
+                    f'    ? << MIN(MAX(attempts - 1, 0), {MAX_BACKOFF_SHIFT}), ?) END'
+                    f'  WHERE uuid IN ({_placeholders(len(uuids_))})'
+                    f'  AND status = {int(TaskStatus.WORK_IN_PROGRESS)}',
+                    (current_epoch, base_delay_seconds, max_delay_seconds, *uuids_),
+                )
+
+    async def fetch_dead_letter_tasks(
+        self,
+        offset: int,
+        limit: int,
+        queue_name: str,
+    ) -> List[TaskRow]:
+        return await self._run(self._fetch_dead_letter_tasks, offset, limit, queue_name)
+
+    def _fetch_dead_letter_tasks(self, offset: int, limit: int, queue_name: str) -> List[TaskRow]:
+        cursor = self._connect().cursor()
+        cursor.execute(
+            f'SELECT {_COLUMNS} FROM {self.table_name}'
+            f'  WHERE queue_name = ? AND status = {int(TaskStatus.DEAD_LETTER)}'
+            '  ORDER BY priority DESC, scheduled_at, uuid LIMIT ? OFFSET ?',
+            (queue_name, limit, offset),
+        )
+        return [self._task_row(row) for row in cursor.fetchall()]
+
+    async def insert_results(self, results: Dict[str, Any], ttl_seconds: int):
+        if not results:
+            return
+        current_epoch = int(time.time())
+        await self._run(self._insert_results, [
+            (UUID(task_id).bytes, *self.codec.encode(result), current_epoch + ttl_seconds)
+            for task_id, result in results.items()
+        ], current_epoch)
+
+    def _insert_results(self, insert_args: List[Tuple[Any, ...]], current_epoch: int):
+        with self._transaction() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {self.result_table_name}'
+                '  (uuid, result, result_codec, expires_at) VALUES (?, ?, ?, ?)',
+                insert_args,
+            )
+            cursor.execute(
+                f'DELETE FROM {self.result_table_name} WHERE expires_at <= ?', (current_epoch,))
+
+    async def fetch_results(self, task_ids: List[str]) -> Dict[str, Any]:
+        if not task_ids:
+            return {}
+        return await self._run(self._fetch_results, [UUID(task_id).bytes for task_id in task_ids])
+
+    def _fetch_results(self, uuids: List[bytes]) -> Dict[str, Any]:
+        results = {}
+        cursor = self._connect().cursor()
+        for uuids_ in _chunks(uuids):
+            cursor.execute(
+                f'SELECT uuid, result, result_codec FROM {self.result_table_name}'
+                f'  WHERE uuid IN ({_placeholders(len(uuids_))}) AND expires_at > ?',
+                (*uuids_, int(time.time())),
+            )
+            results.update({
+                uuid_str_from_binary(uuid): self.codec.decode(result, result_codec)
+                for uuid, result, result_codec in cursor.fetchall()
+            })
+        return results
+
+    async def fetch_queue_stats(
+        self,
+        queue_names: List[str],
+        mode: StatsMode,
+    ) -> Dict[str, QueueStats]:
+        # NOTE: Counted by (queue_name, status) prefix of claim index in both modes. Database of
+        #  one host has no contention on counting to be avoided by counters
+        if not queue_names:
+            return {}
+        return await self._run(self._fetch_queue_stats, queue_names)
+
+    def _fetch_queue_stats(self, queue_names: List[str]) -> Dict[str, QueueStats]:
+        current_epoch = time.time()
+        stats = {queue_name: QueueStats(queue_name=queue_name) for queue_name in queue_names}
+        cursor = self._connect().cursor()
+        for queue_names_ in _chunks(queue_names):
+            cursor.execute(
+                f'SELECT queue_name, status, COUNT(*) FROM {self.table_name}'
+                f'  WHERE queue_name IN ({_placeholders(len(queue_names_))})'
+                '  GROUP BY queue_name, status',
+                queue_names_,
+            )
+            for queue_name, status, count in cursor.fetchall():
+                counter = STATUS_COUNTERS.get(TaskStatus(status))
+                if counter is not None:
+                    queue_stats = stats[queue_name]
+                    setattr(queue_stats, counter, getattr(queue_stats, counter) + count)
+        for queue_name, queue_stats in stats.items():
+            cursor.execute(
+                f'SELECT scheduled_at, uuid FROM {self.table_name}'
+                f'  WHERE queue_name = ? AND status = {int(TaskStatus.QUEUED)}'
+                '  AND scheduled_at <= ?'
+                '  ORDER BY priority DESC, scheduled_at, uuid LIMIT 1',
+                (queue_name, current_epoch),
+            )
+            head = cursor.fetchone()
+            if head is not None:
+                queue_stats.lag_seconds = _lag_seconds(head[0], head[1], current_epoch)
+        return stats
+
+    async def fetch_queue_versions(self, queue_names: List[str]) -> Dict[str, int]:
+        if not queue_names:
+            return {}
+        return await self._run(self._fetch_queue_versions, queue_names)
+
+    def _fetch_queue_versions(self, queue_names: List[str]) -> Dict[str, int]:
+        versions = {queue_name: 0 for queue_name in queue_names}
+        cursor = self._connect().cursor()
+        for queue_names_ in _chunks(queue_names):
+            cursor.execute(
+                f'SELECT queue_name, version FROM {self.queue_table_name}'
+                f'  WHERE queue_name IN ({_placeholders(len(queue_names_))})',
+                queue_names_,
+            )
+            versions.update({queue_name: version for queue_name, version in cursor.fetchall()})
+        return versions
@@ -1,140 +1,848 @@
-import json
+import enum
 import logging
+import random
 import time
-import uuid
-from typing import List
+from collections import Counter, defaultdict
+from typing import (
+    List, Optional, Any, Callable, Dict, Tuple, Sequence, Set, Union, Iterable, AsyncIterable,
+    AsyncIterator, Awaitable,
+)
+from uuid import UUID
 
-from aiomysql import Pool, Connection
-from pypika import Query, Table, Order
-from pypika.terms import BasicCriterion
+from aiomysql import Pool, Connection, Cursor
+from pypika import (
+    Query, MySQLQuery, Table, Tuple as Row, Order, Parameter, CustomFunction, functions as fn,
+)
+from pypika.enums import Arithmetic
+from pypika.terms import Case, Field, ArithmeticExpression, Values
 
-from jasyncq.repository.model.task import TaskStatus, TaskRowIn, TaskRow
-from jasyncq.repository.abstract import AbstractRepository
+from jasyncq.repository.model.stats import (
+    QueueStats, StatsMode, STATUS_COUNTERS, QUEUE_COUNTERS,
+)
+from jasyncq.repository.model.task import (
+    TaskStatus, TaskRowIn, TaskRow, TaskFilter, effective_priority,
+)
+from jasyncq.repository.abstract import (
+    AbstractRepository, AbstractTaskRepository, PoolRole, MAX_BACKOFF_SHIFT, _chunk_tasks,
+    _weighted_limits, _is_exhausted, _lag_seconds,
+)
+from jasyncq.metrics import Instrumentation, Metric
+from jasyncq.repository.codec import PayloadCodec
+from jasyncq.repository.schema import (
+    SCHEMA_VERSION, migration_queries, parse_schema_version, queue_table_name,
+    dependency_table_name, dedup_table_name, result_table_name, count_table_name,
+)
+from jasyncq.util import (
+    is_skip_locked_supported, let_if, uuid7, uuid_str_from_binary, uuid7_epoch,
+)
+from jasyncq import wakeup
 
+INITIALIZE_LOCK_TIMEOUT_SECONDS = 60
+QUEUE_VERSION_SLOTS = 8
+_least = CustomFunction('LEAST', ['a', 'b'])
+_greatest = CustomFunction('GREATEST', ['a', 'b'])
 
-class TaskRepository(AbstractRepository):
-    def __init__(self, pool: Pool, topic_name: str = 'default_topic'):
-        super().__init__(pool=pool)
+
+# NOTE: (queue_name, dedup_key)
+DedupKey = Tuple[str, str]
+DEDUP_PURGE_LIMIT = 1000
+RESULT_PURGE_LIMIT = 1000
+# NOTE: (queue_name, counter of QueueStats): delta
+CountDeltas = Counter
+
+
+def _claim_aliases(count: int) -> List[str]:
+    return [f'claim_{index}' for index in range(count)]
+
+
+def _check_claimed(updated: int, uuids: List[bytes]):
+    if updated != len(uuids):
+        raise RuntimeError(f'Claimed {updated} of {len(uuids)} selected tasks')
+
+
+class ClaimMode(enum.Enum):
+    AUTO = 'auto'  # SKIP_LOCKED if server supports it, otherwise LOCK_TABLES
+    LOCK_TABLES = 'lock_tables'
+    SKIP_LOCKED = 'skip_locked'
+
+
+class FetchFilter(enum.Enum):
+    SCHEDULED = 'scheduled'
+    PENDING = 'pending'
+
+
+class TaskRepository(AbstractRepository, AbstractTaskRepository):
+    def __init__(
+        self,
+        pool: Pool,
+        topic_name: str = 'default_topic',
+        claim_mode: ClaimMode = ClaimMode.AUTO,
+        task_id_factory: Callable[[], UUID] = uuid7,
+        codec: Optional[PayloadCodec] = None,
+        instrumentation: Optional[Instrumentation] = None,
+        count_tasks: bool = False,
+        claim_pool: Optional[Pool] = None,
+        read_pool: Optional[Pool] = None,
+    ):
+        super().__init__(
+            pool=pool,
+            instrumentation=instrumentation,
+            claim_pool=claim_pool,
+            read_pool=read_pool,
+        )
+        self.topic_name = topic_name
+        self.claim_mode = claim_mode
+        # NOTE: Writers maintain counter rows read by StatsMode.APPROXIMATE (should be enabled
+        #  for all writers of topic, otherwise counters drift until recount_queues)
+        self.count_tasks = count_tasks
+        self._exact_fallback_warned = False
+        self.task_id_factory = task_id_factory
+        self.codec = codec or PayloadCodec()
+        self._skip_locked: Optional[bool] = {
+            ClaimMode.AUTO: None,  # NOTE: Resolved by server version on first use
+            ClaimMode.LOCK_TABLES: False,
+            ClaimMode.SKIP_LOCKED: True,
+        }[claim_mode]
         self.table_name = f'jasyncq_{topic_name}'
         self.task: Table = Table(self.table_name)
         self.task__uuid = self.task.field('uuid')
         self.task__status = self.task.field('status')
         self.task__progressed_at = self.task.field('progressed_at')
+        self.task__lease_expires_at = self.task.field('lease_expires_at')
         self.task__scheduled_at = self.task.field('scheduled_at')
-        self.task__is_urgent = self.task.field('is_urgent')
+        self.task__priority = self.task.field('priority')
         self.task__task = self.task.field('task')
+        self.task__task_codec = self.task.field('task_codec')
         self.task__queue_name = self.task.field('queue_name')
         self.task__depend_on = self.task.field('depend_on')
+        self.task__pending_parents = self.task.field('pending_parents')
+        self.task__attempts = self.task.field('attempts')
+        self.task__max_attempts = self.task.field('max_attempts')
+        self.task__dedup_key = self.task.field('dedup_key')
+        self.task__dedup_seconds = self.task.field('dedup_seconds')
+
+        self.dependency: Table = Table(dependency_table_name(self.table_name))
+        self.dependency__parent = self.dependency.field('parent')
+        self.dependency__child = self.dependency.field('child')
 
-        self.task_child: Table = Table(self.table_name).as_(f'{self.table_name}_child')
-        self.task_child__uuid = self.task_child.field('uuid')
+        self.dedup: Table = Table(dedup_table_name(self.table_name))
+        self.dedup__queue_name = self.dedup.field('queue_name')
+        self.dedup__dedup_key = self.dedup.field('dedup_key')
+        self.dedup__uuid = self.dedup.field('uuid')
+        self.dedup__expires_at = self.dedup.field('expires_at')
+
+        self.result: Table = Table(result_table_name(self.table_name))
+        self.result__uuid = self.result.field('uuid')
+        self.result__result = self.result.field('result')
+        self.result__result_codec = self.result.field('result_codec')
+        self.result__expires_at = self.result.field('expires_at')
+
+        self.count: Table = Table(count_table_name(self.table_name))
+        self.count__queue_name = self.count.field('queue_name')
+        self.count__slot = self.count.field('slot')
+
+        self.queue: Table = Table(queue_table_name(self.table_name))
+        self.queue__queue_name = self.queue.field('queue_name')
+        self.queue__slot = self.queue.field('slot')
+        self.queue__version = self.queue.field('version')
+
+        self.task__columns = [
+            self.task__uuid,
+            self.task__status,
+            self.task__progressed_at,
+            self.task__scheduled_at,
+            self.task__priority,
+            self.task__task,
+            self.task__queue_name,
+            self.task__depend_on,
+            self.task__task_codec,
+            self.task__attempts,
+            self.task__max_attempts,
+            self.task__dedup_key,
+        ]
+
+        # NOTE: Statements are rendered once per repository and executed with driver parameters
+        #  (%s placeholders) instead of building query tree with literal values for every call
+        self._claim_statements: Dict[Tuple[FetchFilter, bool, str], str] = {}
+        self._multi_queue_claim_statements: Dict[Tuple[Any, ...], str] = {}
+        self._claim_rotation = 0
+        # args: (progressed_at, lease_expires_at, uuids)
+        self._update_claimed_tasks_statement = Query.update(self.task).set(
+            self.task__status, int(TaskStatus.WORK_IN_PROGRESS)
+        ).set(
+            self.task__progressed_at, Parameter('%s')
+        ).set(
+            self.task__lease_expires_at, Parameter('%s')
+        ).set(
+            self.task__attempts, self.task__attempts + 1
+        ).where(
+            self.task__uuid.isin(Parameter('%s')) & (self.task__status == Parameter('%s'))
+        ).get_sql(quote_char='`')
+        # args: (uuids, selected status)
+        self._dead_letter_tasks_statement = Query.update(self.task).set(
+            self.task__status, int(TaskStatus.DEAD_LETTER)
+        ).where(
+            self.task__uuid.isin(Parameter('%s')) & (self.task__status == Parameter('%s'))
+        ).get_sql(quote_char='`')
+        # args: (current_epoch, base_delay_seconds, max_delay_seconds, uuids)
+        #  NOTE: Delay is same as _retry_delay, and dead-lettered task keeps its scheduled_at
+        #  (attempts is not updated here, so condition still holds after status is assigned)
+        exhausted = (self.task__max_attempts > 0) & (
+            self.task__attempts >= self.task__max_attempts)
+        self._fail_tasks_statement = Query.update(self.task).set(
+            self.task__status, Case().when(
+                exhausted, int(TaskStatus.DEAD_LETTER),
+            ).when(
+                self.task__pending_parents > 0,  # NOTE: Claimed with ignoring dependency
+                int(TaskStatus.DEFERRED),
+            ).else_(int(TaskStatus.QUEUED))
+        ).set(
+            self.task__scheduled_at, Case().when(
+                exhausted, self.task__scheduled_at,
+            ).else_(Parameter('%s') + _least(
+                ArithmeticExpression(
+                    Arithmetic.lshift,
+                    Parameter('%s'),
+                    _least(_greatest(self.task__attempts - 1, 0), MAX_BACKOFF_SHIFT),
+                ),
+                Parameter('%s'),
+            ))
+        ).where(
+            self.task__uuid.isin(Parameter('%s'))
+            & (self.task__status == int(TaskStatus.WORK_IN_PROGRESS))
+        ).get_sql(quote_char='`')
+        # args: (queue_name, limit, offset)
+        self._fetch_dead_letter_tasks_statement = Query.from_(self.task).select(
+            *self.task__columns
+        ).where(
+            (self.task__status == int(TaskStatus.DEAD_LETTER))
+            & (self.task__queue_name == Parameter('%s'))
+        ).orderby(
+            self.task__priority, order=Order.desc,
+        ).orderby(
+            self.task__scheduled_at, self.task__uuid,
+        ).limit(Parameter('%s')).offset(Parameter('%s')).get_sql(quote_char='`')
+        # args: (lease_expires_at, uuids)
+        self._extend_leases_statement = Query.update(self.task).set(
+            self.task__lease_expires_at, Parameter('%s')
+        ).where(
+            self.task__uuid.isin(Parameter('%s'))
+            & (self.task__status == int(TaskStatus.WORK_IN_PROGRESS))
+        ).get_sql(quote_char='`')
+        # args: (each column of task row, dedup_seconds, pending_parents)
+        #  NOTE: Task of dedup key held by other task is not inserted (and not failed)
+        self._insert_tasks_statement = MySQLQuery.into(self.task).columns(
+            *self.task__columns,
+            self.task__dedup_seconds,
+            self.task__pending_parents,
+        ).insert(
+            *[Parameter('%s') for _ in self.task__columns],
+            Parameter('%s'),
+            Parameter('%s'),
+        ).on_duplicate_key_update(
+            self.task__uuid, self.task__uuid,
+        ).get_sql(quote_char='`')
+        # args: (dedup keys,)
+        #  NOTE: Locking read sees tasks committed by other producers after snapshot
+        self._lock_dedup_keys_statement = Query.from_(self.task).select(
+            *self.task__columns
+        ).where(
+            Row(self.task__queue_name, self.task__dedup_key).isin(Parameter('%s'))
+        ).get_sql(quote_char='`') + ' FOR UPDATE'
+        # args: (dedup keys, current_epoch)
+        #  NOTE: Locking read (see _fetch_completed_dedup_keys)
+        self._fetch_completed_dedup_keys_statement = Query.from_(self.dedup).select(
+            self.dedup__queue_name,
+            self.dedup__dedup_key,
+            self.dedup__uuid,
+        ).where(
+            Row(self.dedup__queue_name, self.dedup__dedup_key).isin(Parameter('%s'))
+            & (self.dedup__expires_at > Parameter('%s'))
+        ).get_sql(quote_char='`') + ' LOCK IN SHARE MODE'
+        # args: (current_epoch, uuids)
+        self._keep_dedup_keys_statement = MySQLQuery.into(self.dedup).columns(
+            self.dedup__queue_name,
+            self.dedup__dedup_key,
+            self.dedup__uuid,
+            self.dedup__expires_at,
+        ).from_(self.task).select(
+            self.task__queue_name,
+            self.task__dedup_key,
+            self.task__uuid,
+            Parameter('%s') + self.task__dedup_seconds,
+        ).where(
+            self.task__uuid.isin(Parameter('%s'))
+            & self.task__dedup_key.notnull()
+            & (self.task__dedup_seconds > 0)
+        ).on_duplicate_key_update(
+            self.dedup__uuid, Values(self.dedup__uuid),
+        ).on_duplicate_key_update(
+            self.dedup__expires_at, Values(self.dedup__expires_at),
+        ).get_sql(quote_char='`')
+        # args: (current_epoch, DEDUP_PURGE_LIMIT)
+        self._purge_dedup_keys_statement = MySQLQuery.from_(self.dedup).where(
+            self.dedup__expires_at <= Parameter('%s')
+        ).limit(Parameter('%s')).delete().get_sql(quote_char='`')
+        # args: (uuids,)
+        self._delete_tasks_statement = Query.from_(self.task).where(
+            self.task__uuid.isin(Parameter('%s'))
+        ).delete().get_sql(quote_char='`')
+        # args: (uuids,)
+        self._lock_parents_statement = Query.from_(self.task).select(
+            self.task__uuid,
+        ).where(
+            self.task__uuid.isin(Parameter('%s'))
+        ).get_sql(quote_char='`') + ' LOCK IN SHARE MODE'
+        # args: (parent, child)
+        self._insert_dependencies_statement = Query.into(self.dependency).columns(
+            self.dependency__parent,
+            self.dependency__child,
+        ).insert(
+            Parameter('%s'), Parameter('%s'),
+        ).get_sql(quote_char='`')
+        # args: (parents,)
+        self._lock_children_statement = Query.from_(self.dependency).select(
+            self.dependency__child,
+        ).where(
+            self.dependency__parent.isin(Parameter('%s'))
+        ).get_sql(quote_char='`') + ' FOR UPDATE'
+        # args: (parents,)
+        self._delete_dependencies_statement = Query.from_(self.dependency).where(
+            self.dependency__parent.isin(Parameter('%s'))
+        ).delete().get_sql(quote_char='`')
+        # args: (number of completed parents, children)
+        #  NOTE: MySQL evaluates SET from left to right, so status sees decremented pending_parents
+        self._release_children_statement = Query.update(self.task).set(
+            self.task__pending_parents, self.task__pending_parents - Parameter('%s')
+        ).set(
+            self.task__status, Case().when(
+                (self.task__status == int(TaskStatus.DEFERRED)) & (self.task__pending_parents == 0),
+                int(TaskStatus.QUEUED),
+            ).else_(self.task__status)
+        ).where(self.task__uuid.isin(Parameter('%s'))).get_sql(quote_char='`')
+        # args: (children,)
+        self._fetch_released_queues_statement = Query.from_(self.task).select(
+            self.task__queue_name,
+        ).distinct().where(
+            self.task__uuid.isin(Parameter('%s'))
+            & (self.task__status == int(TaskStatus.QUEUED))
+            & (self.task__pending_parents == 0)
+        ).get_sql(quote_char='`')
+        # args: (uuid, result, result_codec, expires_at)
+        self._insert_results_statement = MySQLQuery.into(self.result).columns(
+            self.result__uuid,
+            self.result__result,
+            self.result__result_codec,
+            self.result__expires_at,
+        ).insert(
+            Parameter('%s'), Parameter('%s'), Parameter('%s'), Parameter('%s'),
+        ).on_duplicate_key_update(
+            self.result__result, Values(self.result__result),
+        ).on_duplicate_key_update(
+            self.result__result_codec, Values(self.result__result_codec),
+        ).on_duplicate_key_update(
+            self.result__expires_at, Values(self.result__expires_at),
+        ).get_sql(quote_char='`')
+        # args: (current_epoch, RESULT_PURGE_LIMIT)
+        self._purge_results_statement = MySQLQuery.from_(self.result).where(
+            self.result__expires_at <= Parameter('%s')
+        ).limit(Parameter('%s')).delete().get_sql(quote_char='`')
+        # args: (uuids, current_epoch)
+        self._fetch_results_statement = Query.from_(self.result).select(
+            self.result__uuid,
+            self.result__result,
+            self.result__result_codec,
+        ).where(
+            self.result__uuid.isin(Parameter('%s'))
+            & (self.result__expires_at > Parameter('%s'))
+        ).get_sql(quote_char='`')
+        # args: (queue_name, slot, 1)
+        self._bump_queue_version_statement = MySQLQuery.into(self.queue).columns(
+            self.queue__queue_name,
+            self.queue__slot,
+            self.queue__version,
+        ).insert(
+            Parameter('%s'), Parameter('%s'), Parameter('%s'),
+        ).on_duplicate_key_update(
+            self.queue__version, self.queue__version + 1,
+        ).get_sql(quote_char='`')
+        # args: (queue_names,)
+        self._fetch_queue_versions_statement = Query.from_(self.queue).select(
+            self.queue__queue_name,
+            fn.Sum(self.queue__version),
+        ).where(
+            self.queue__queue_name.isin(Parameter('%s'))
+        ).groupby(self.queue__queue_name).get_sql(quote_char='`')
+        # args: (queue_name, slot, waiting, in_progress, dead_letter)
+        counters = [self.count.field(counter) for counter in QUEUE_COUNTERS]
+        count_tasks_query = MySQLQuery.into(self.count).columns(
+            self.count__queue_name, self.count__slot, *counters,
+        ).insert(*[Parameter('%s') for _ in range(2 + len(counters))])
+        for counter in counters:
+            count_tasks_query = count_tasks_query.on_duplicate_key_update(
+                counter, counter + Values(counter))
+        self._count_tasks_statement = count_tasks_query.get_sql(quote_char='`')
+        # args: (queue_names,)
+        self._fetch_queue_counts_statement = Query.from_(self.count).select(
+            self.count__queue_name, *[fn.Sum(counter) for counter in counters],
+        ).where(
+            self.count__queue_name.isin(Parameter('%s'))
+        ).groupby(self.count__queue_name).get_sql(quote_char='`')
+        # args: (queue_names,)
+        self._lock_queue_counts_statement = Query.from_(self.count).select(
+            self.count__queue_name, self.count__slot,
+        ).where(
+            self.count__queue_name.isin(Parameter('%s'))
+        ).get_sql(quote_char='`') + ' FOR UPDATE'
+        # args: (queue_names,)
+        self._delete_queue_counts_statement = Query.from_(self.count).where(
+            self.count__queue_name.isin(Parameter('%s'))
+        ).delete().get_sql(quote_char='`')
+        # args: (queue_names,)
+        #  NOTE: Index only scan of (queue_name, status) prefix of idx__claim
+        self._count_tasks_by_status_statement = Query.from_(self.task).select(
+            self.task__queue_name, self.task__status, fn.Count('*'),
+        ).where(
+            self.task__queue_name.isin(Parameter('%s'))
+        ).groupby(self.task__queue_name, self.task__status).get_sql(quote_char='`')
+        # args: (uuids,)
+        #  NOTE: Rows are locked, so they are counted in status they are deleted with
+        self._lock_tasks_by_status_statement = Query.from_(self.task).select(
+            self.task__queue_name, self.task__status, fn.Count('*'),
+        ).where(
+            self.task__uuid.isin(Parameter('%s'))
+        ).groupby(self.task__queue_name, self.task__status).get_sql(quote_char='`') + (
+            ' FOR UPDATE')
+        # args: (uuids,)
+        self._lock_failed_tasks_statement = Query.from_(self.task).select(
+            self.task__queue_name, exhausted, fn.Count('*'),
+        ).where(
+            self.task__uuid.isin(Parameter('%s'))
+            & (self.task__status == int(TaskStatus.WORK_IN_PROGRESS))
+        ).groupby(self.task__queue_name, exhausted).get_sql(quote_char='`') + ' FOR UPDATE'
+        self._fetch_queue_heads_statements: Dict[int, str] = {}
 
     async def initialize(self):
-        queries = [
-            f'CREATE TABLE IF NOT EXISTS {self.table_name} ('
-            '  uuid VARCHAR(36) NOT NULL,'
-            '  status TINYINT NOT NULL,'
-            '  progressed_at BIGINT NOT NULL,'
-            '  scheduled_at BIGINT NOT NULL,'
-            '  is_urgent BOOL NOT NULL DEFAULT false,'
-            '  task TEXT NOT NULL,'
-            '  queue_name VARCHAR(255) NOT NULL,'
-            '  depend_on VARCHAR(36) DEFAULT NULL,'
-            'INDEX idx__uuid (uuid),'
-            'INDEX idx__status (status),'
-            'INDEX idx__progressed_at (progressed_at),'
-            'INDEX idx__scheduled_at (scheduled_at),'
-            'INDEX idx__is_urgent (is_urgent),'
-            'INDEX idx__queue_name (queue_name),'
-            'INDEX idx__depend_on (depend_on)'
-            ');',
+        async with self._acquire() as conn:
+            conn: Connection = conn  # NOTE(pjongy): For type hinting
+            async with conn.cursor() as cur:
+                cur: Cursor = cur  # NOTE(pjongy): For type hinting
+                # NOTE: Serialize creating and migrating same topic from several processes
+                await cur.execute(
+                    'SELECT GET_LOCK(%s, %s)', (self.table_name, INITIALIZE_LOCK_TIMEOUT_SECONDS))
+                (locked,) = await cur.fetchone()
+                if not locked:
+                    raise TimeoutError(f'Could not acquire initialize lock of {self.table_name}')
+                try:
+                    await cur.execute(
+                        'SELECT TABLE_COMMENT FROM information_schema.TABLES '
+                        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                        (self.table_name,),
+                    )
+                    table = await cur.fetchone()
+                    current_version = let_if(table, lambda row: parse_schema_version(row[0]))
+                    if current_version is not None and current_version < SCHEMA_VERSION:
+                        logging.info(
+                            f'Migrate {self.table_name} from {current_version} to {SCHEMA_VERSION}')
+                    for query in migration_queries(self.table_name, current_version):
+                        logging.debug(query)
+                        await cur.execute(query)
+                    await conn.commit()
+                finally:
+                    await cur.execute('SELECT RELEASE_LOCK(%s)', (self.table_name,))
+                    await conn.commit()
+        await self._resolve_claim_mode()
+
+    async def _resolve_claim_mode(self) -> bool:
+        if self._skip_locked is None:
+            results = await self._execute_and_fetch(['SELECT VERSION()'], PoolRole.CLAIM)
+            server_version = results[0][0][0]
+            self._skip_locked = is_skip_locked_supported(server_version)
+            logging.debug(f'{server_version} supports SKIP LOCKED: {self._skip_locked}')
+        return self._skip_locked
+
+    def _claim_statement(
+        self,
+        fetch_filter: FetchFilter,
+        ignore_dependency: bool,
+        locking_clause: str = '',
+    ) -> str:
+        key = (fetch_filter, ignore_dependency, locking_clause)
+        statement = self._claim_statements.get(key)
+        if statement is None:
+            statement = self._claim_statements[key] = self._build_claim_statement(
+                fetch_filter=fetch_filter,
+                ignore_dependency=ignore_dependency,
+                locking_clause=locking_clause,
+            )
+        return statement
+
+    def _build_claim_statement(
+        self,
+        fetch_filter: FetchFilter,
+        ignore_dependency: bool,
+        locking_clause: str,
+    ) -> str:
+        statuses = self._claim_statuses(fetch_filter, ignore_dependency)
+        if len(statuses) == 1:
+            # args: (*fetch filter args, limit, offset)
+            return Query.from_(
+                self.task
+            ).select(
+                *self.task__columns
+            ).where(
+                self._claim_criterion(self.task, fetch_filter, statuses[0], ignore_dependency)
+            ).orderby(
+                self.task__priority,
+                order=Order.desc,
+            ).orderby(
+                *self._claim_ordering(self.task, fetch_filter),
+            ).offset(Parameter('%s')).limit(Parameter('%s')).get_sql(
+                quote_char='`') + locking_clause
+        # NOTE: UNION ALL of claim of each status (merged by caller same as claim of several
+        #  queues), since index can not be read in order over several statuses
+        parts = []
+        for status, alias in zip(statuses, _claim_aliases(len(statuses))):
+            task = Table(self.table_name).as_(alias)
+            # args: (*fetch filter args, limit + offset) for each status
+            part = Query.from_(
+                task
+            ).select(
+                *[task.field(column.name) for column in self.task__columns]
+            ).where(
+                self._claim_criterion(task, fetch_filter, status, ignore_dependency)
+            ).orderby(
+                task.priority,
+                order=Order.desc,
+            ).orderby(
+                *self._claim_ordering(task, fetch_filter),
+            ).limit(Parameter('%s')).get_sql(quote_char='`')
+            parts.append(f'({part}{locking_clause})')
+        return ' UNION ALL '.join(parts)
+
+    @staticmethod
+    def _claim_statuses(fetch_filter: FetchFilter, ignore_dependency: bool) -> List[TaskStatus]:
+        # NOTE: Status is equality part of idx__claim and idx__pending, so each status is claimed
+        #  by its own part (IN of several statuses would make MySQL filesort rows of them)
+        if fetch_filter == FetchFilter.PENDING:
+            return [TaskStatus.WORK_IN_PROGRESS]
+        if ignore_dependency:
+            return [TaskStatus.DEFERRED, TaskStatus.QUEUED]
+        # NOTE: Task becomes QUEUED from DEFERRED when its all parents are completed, so it is
+        #  not necessary to look up parents
+        return [TaskStatus.QUEUED]
+
+    def _claim_criterion(
+        self,
+        task: Table,
+        fetch_filter: FetchFilter,
+        status: TaskStatus,
+        ignore_dependency: bool,
+    ):
+        criterion = task.status == int(status)
+        if fetch_filter == FetchFilter.SCHEDULED:
+            # args: (current_epoch, queue_name)
+            criterion &= task.scheduled_at <= Parameter('%s')
+        else:
+            # args: (current_epoch - check_term_seconds, queue_name)
+            if not ignore_dependency:
+                # NOTE: Task which was claimed with ignoring dependency
+                criterion &= task.pending_parents == 0
+            criterion &= task.lease_expires_at <= Parameter('%s')
+        criterion &= task.queue_name == Parameter('%s')
+        return criterion
+
+    def _claim_ordering(self, task: Table, fetch_filter: FetchFilter) -> List[Field]:
+        # NOTE: Follows idx__claim and idx__pending after priority DESC, so tasks of same priority
+        #  are claimed in FIFO (uuid is time-ordered) without filesort
+        if fetch_filter == FetchFilter.SCHEDULED:
+            return [task.scheduled_at, task.uuid]
+        return [task.lease_expires_at, task.uuid]
+
+    def _multi_queue_claim_statement(
+        self,
+        fetch_filters: Tuple[FetchFilter, ...],
+        queue_count: int,
+        ignore_dependency: bool,
+        locking_clause: str,
+    ) -> str:
+        key = (fetch_filters, queue_count, ignore_dependency, locking_clause)
+        statement = self._multi_queue_claim_statements.get(key)
+        if statement is None:
+            # NOTE: Every part reads table by its own alias, since a table locked by LOCK TABLES
+            #  can not be referred several times in one query by same name
+            claim_parts = self._claim_parts(fetch_filters, ignore_dependency)
+            parts = []
+            for alias in _claim_aliases(queue_count * len(claim_parts)):
+                task = Table(self.table_name).as_(alias)
+                fetch_filter, status = claim_parts[len(parts) % len(claim_parts)]
+                # args: (*fetch filter args, limit)
+                part = Query.from_(
+                    task
+                ).select(
+                    *[task.field(column.name) for column in self.task__columns]
+                ).where(
+                    self._claim_criterion(task, fetch_filter, status, ignore_dependency)
+                ).orderby(
+                    task.priority,
+                    order=Order.desc,
+                ).orderby(
+                    *self._claim_ordering(task, fetch_filter),
+                ).limit(Parameter('%s')).get_sql(quote_char='`')
+                parts.append(f'({part}{locking_clause})')
+            statement = self._multi_queue_claim_statements[key] = ' UNION ALL '.join(parts)
+        return statement
+
+    def _claim_parts(
+        self,
+        fetch_filters: Sequence[FetchFilter],
+        ignore_dependency: bool,
+    ) -> List[Tuple[FetchFilter, TaskStatus]]:
+        return [
+            (fetch_filter, status)
+            for fetch_filter in fetch_filters
+            for status in self._claim_statuses(fetch_filter, ignore_dependency)
         ]
-        await self._execute(queries=queries)
 
-    async def _fetch_tasks_by_filter(
+    async def _select_claimable_tasks(
         self,
-        fetch_filter: BasicCriterion,
+        cur: Cursor,
+        fetch_filters: List[Tuple[FetchFilter, Sequence[Any]]],
+        offset: int,
+        limit: int,
+        ignore_dependency: bool,
+        locking_clause: str = '',
+    ) -> List[Any]:
+        # NOTE: Filters are applied in order until limit is filled
+        task_rows = []
+        for fetch_filter, filter_args in fetch_filters:
+            remaining = limit - len(task_rows)
+            if remaining <= 0:
+                break
+            get_tasks_query = self._claim_statement(fetch_filter, ignore_dependency, locking_clause)
+            status_count = len(self._claim_statuses(fetch_filter, ignore_dependency))
+            if status_count == 1:
+                args = (*filter_args, remaining, offset)
+            else:
+                args = (*filter_args, remaining + offset) * status_count
+            logging.debug('%s %s', get_tasks_query, args)
+            await cur.execute(get_tasks_query, args)
+            rows = await cur.fetchall()
+            if status_count > 1:
+                # NOTE: Rows of each status are merged in order of idx__claim (only scheduled
+                #  claim has several statuses), and rows out of range are left unclaimed
+                rows = sorted(rows, key=lambda row: (-row[4], row[3], row[0]))
+                rows = rows[offset:offset + remaining]
+            task_rows.extend(rows)
+        return task_rows
+
+    async def _claim_with_skip_locked(
+        self,
+        conn: Connection,
+        cur: Cursor,
+        select: Callable[[Cursor, str], Awaitable[List[Any]]],
+        current_epoch: float,
+        lease_seconds: int,
+        aliases: Sequence[str] = (),
+    ) -> List[Any]:
+        # NOTE: READ COMMITTED does not take gap locks, so inserts are never blocked by claiming
+        #  and rows locked by other consumers are skipped instead of waited. Transaction is
+        #  started explicitly, since row locks would be released right after select on autocommit
+        await cur.execute('SET TRANSACTION ISOLATION LEVEL READ COMMITTED')
+        await cur.execute('START TRANSACTION')
+        try:
+            task_rows = await select(cur, ' FOR UPDATE SKIP LOCKED')
+            claimed_rows = await self._update_claimed_tasks(
+                cur, task_rows, current_epoch, lease_seconds)
+            await self._count(cur, self._claim_deltas(task_rows))
+        except BaseException:
+            await conn.rollback()
+            raise
+        await conn.commit()
+        return claimed_rows
+
+    async def _claim_with_table_lock(
+        self,
+        conn: Connection,
+        cur: Cursor,
+        select: Callable[[Cursor, str], Awaitable[List[Any]]],
+        current_epoch: float,
+        lease_seconds: int,
+        aliases: Sequence[str] = (),
+    ) -> List[Any]:
+        instrumentation = self.instrumentation
+        if instrumentation.enabled:
+            started_at = time.perf_counter()
+        await cur.execute(f'LOCK TABLES {self.table_name} WRITE' + ''.join(
+            f', {self.table_name} AS {alias} WRITE' for alias in aliases))
+        if instrumentation.enabled:
+            locked_at = time.perf_counter()
+            instrumentation.observe(
+                Metric.LOCK_WAIT_SECONDS, locked_at - started_at, self.topic_name)
+        try:
+            task_rows = await select(cur, '')
+            claimed_rows = await self._update_claimed_tasks(
+                cur, task_rows, current_epoch, lease_seconds)
+        except BaseException:
+            # NOTE: UNLOCK TABLES commits active transaction, so claim is rolled back before
+            #  tables are unlocked (and connection is not returned to pool holding locks)
+            await conn.rollback()
+            await cur.execute('UNLOCK TABLES')
+            raise
+        await cur.execute('UNLOCK TABLES')
+        if instrumentation.enabled:
+            instrumentation.observe(
+                Metric.LOCK_HOLD_SECONDS, time.perf_counter() - locked_at, self.topic_name)
+        # NOTE: Counter table is not locked with topic table, so counters are changed right
+        #  after claim is committed by UNLOCK TABLES
+        await self._count(cur, self._claim_deltas(task_rows))
+        await conn.commit()
+        return claimed_rows
+
+    async def _update_claimed_tasks(
+        self,
+        cur: Cursor,
+        task_rows: List[Any],
+        current_epoch: float,
+        lease_seconds: int,
+    ) -> List[Any]:
+        # NOTE: Task claimed over its max attempts (e.g. worker always crashed while running it)
+        #  is dead-lettered instead of being claimed again
+        #  Rows are updated only in status they were selected in, and claim fails if any of them
+        #  has been changed since select (i.e. it was not locked)
+        claimed_rows = []
+        exhausted_uuids: Dict[int, List[bytes]] = defaultdict(list)
+        claimed_uuids: Dict[int, List[bytes]] = defaultdict(list)
+        for task_row in task_rows:
+            if _is_exhausted(task_row[9], task_row[10]):
+                exhausted_uuids[task_row[1]].append(task_row[0])
+            else:
+                claimed_rows.append(task_row)
+                claimed_uuids[task_row[1]].append(task_row[0])
+        for status, uuids in exhausted_uuids.items():
+            updated = await cur.execute(self._dead_letter_tasks_statement, (uuids, status))
+            _check_claimed(updated, uuids)
+        for status, uuids in claimed_uuids.items():
+            updated = await cur.execute(
+                self._update_claimed_tasks_statement,
+                (int(current_epoch), int(current_epoch) + lease_seconds, uuids, status),
+            )
+            _check_claimed(updated, uuids)
+        return claimed_rows
+
+    @staticmethod
+    def _claim_deltas(task_rows: List[Any]) -> CountDeltas:
+        # NOTE: Rows are selected before update, so status is the one task was claimed from
+        deltas = CountDeltas()
+        for task_row in task_rows:
+            source = STATUS_COUNTERS[TaskStatus(task_row[1])]
+            target = 'dead_letter' if _is_exhausted(task_row[9], task_row[10]) else 'in_progress'
+            if source != target:
+                deltas[(task_row[6], source)] -= 1
+                deltas[(task_row[6], target)] += 1
+        return deltas
+
+    async def _count(self, cur: Cursor, deltas: CountDeltas):
+        # NOTE: Counters are changed in transaction of tasks. Rows are written in order of queue
+        #  names (to one random slot per transaction), so writers do not deadlock each other
+        if not self.count_tasks:
+            return
+        slot = random.randrange(QUEUE_VERSION_SLOTS)
+        count_args = []
+        for queue_name in sorted({queue_name for queue_name, _ in deltas}):
+            counts = [deltas[(queue_name, counter)] for counter in QUEUE_COUNTERS]
+            if any(counts):
+                count_args.append((queue_name, slot, *counts))
+        if count_args:
+            await cur.executemany(self._count_tasks_statement, count_args)
+
+    async def _fetch_tasks_by_filters(
+        self,
+        fetch_filters: List[Tuple[FetchFilter, Sequence[Any]]],
         offset: int,
         limit: int,
         ignore_dependency: bool = False,
+        lease_seconds: int = 0,
     ) -> List[TaskRow]:
-        current_epoch = time.time()
+        async def select(cur: Cursor, locking_clause: str) -> List[Any]:
+            return await self._select_claimable_tasks(
+                cur, fetch_filters, offset, limit, ignore_dependency, locking_clause)
 
-        if ignore_dependency:
-            # Faster than fetching with dependency
-            get_tasks_query = Query.from_(
-                self.task
-            ).select(
-                self.task__uuid,
-                self.task__status,
-                self.task__progressed_at,
-                self.task__scheduled_at,
-                self.task__is_urgent,
-                self.task__task,
-                self.task__queue_name,
-                self.task__depend_on,
-            )
-        else:
-            # Note(pjongy): Represent dependent task is already done or no dependency
-            fetch_filter &= self.task_child__uuid.isnull()
-            get_tasks_query = Query.from_(
-                self.task
-            ).left_join(
-                self.task_child
-            ).on(
-                self.task__depend_on == self.task_child__uuid
-            ).select(
-                self.task__uuid,
-                self.task__status,
-                self.task__progressed_at,
-                self.task__scheduled_at,
-                self.task__is_urgent,
-                self.task__task,
-                self.task__queue_name,
-                self.task__depend_on,
-            )
+        aliases = _claim_aliases(max(
+            len(self._claim_statuses(fetch_filter, ignore_dependency))
+            for fetch_filter, _ in fetch_filters
+        ))
+        return await self._claim(select, lease_seconds, aliases if len(aliases) > 1 else ())
 
-        get_tasks_query = get_tasks_query.where(fetch_filter).orderby(
-            self.task__is_urgent,
-            order=Order.desc,
-        ).offset(offset).limit(limit).get_sql(quote_char='`')
-        logging.debug(get_tasks_query)
+    async def _claim(
+        self,
+        select: Callable[[Cursor, str], Awaitable[List[Any]]],
+        lease_seconds: int,
+        aliases: Sequence[str] = (),
+    ) -> List[TaskRow]:
+        current_epoch = time.time()
 
-        async with self.pool.acquire() as conn:
+        skip_locked = await self._resolve_claim_mode()
+        claim = self._claim_with_skip_locked if skip_locked else self._claim_with_table_lock
+        async with self._acquire(PoolRole.CLAIM) as conn:
             conn: Connection = conn  # NOTE(pjongy): For type hinting
             async with conn.cursor() as cur:
-                await cur.execute(
-                    f'LOCK TABLES {self.table_name} WRITE, '
-                    f'{self.table_name} as {self.task_child.alias} WRITE'
-                )
-                await cur.execute(get_tasks_query)
-                task_rows = await cur.fetchall()
-                uuids = [task_row[0] for task_row in task_rows]
-                if uuids:
-                    update_tasks_status = Query.update(self.task).set(
-                        self.task__status, int(TaskStatus.WORK_IN_PROGRESS)
-                    ).set(
-                        self.task__progressed_at, int(current_epoch)
-                    ).where(self.task__uuid.isin(uuids)).get_sql(quote_char='`')
-                    logging.debug(update_tasks_status)
-                    await cur.execute(update_tasks_status)
-                await cur.execute('UNLOCK TABLES')
-                await conn.commit()
+                cur: Cursor = cur  # NOTE(pjongy): For type hinting
+                if self.instrumentation.enabled:
+                    started_at = time.perf_counter()
+                    task_rows = await claim(
+                        conn, cur, select, current_epoch, lease_seconds, aliases)
+                    self._observe_claim(task_rows, time.perf_counter() - started_at, current_epoch)
+                else:
+                    task_rows = await claim(
+                        conn, cur, select, current_epoch, lease_seconds, aliases)
                 logging.debug(task_rows)
 
-        return [
-            TaskRow(
-                uuid=task_row[0],
-                status=task_row[1],
-                progressed_at=task_row[2],
-                scheduled_at=task_row[3],
-                is_urgent=task_row[4],
-                task=json.loads(task_row[5]),
-                queue_name=task_row[6],
-                depend_on=task_row[7],
-            )
-            for task_row in task_rows
-        ]
+        return [self._task_row(task_row) for task_row in task_rows]
+
+    def _observe_claim(self, task_rows: List[Any], elapsed: float, current_epoch: float):
+        self.instrumentation.observe(Metric.CLAIM_SECONDS, elapsed, self.topic_name)
+        self.instrumentation.observe(Metric.CLAIMED_ROWS, len(task_rows), self.topic_name)
+        for task_row in task_rows:
+            # NOTE: Pending tasks (claimed again) are not counted as lag of task
+            if task_row[1] == int(TaskStatus.WORK_IN_PROGRESS):
+                continue
+            # NOTE: scheduled_at of task applied without schedule is 0, so its lag is counted from
+            #  creation time in task id (if it is UUIDv7)
+            ready_at = max(task_row[3], uuid7_epoch(task_row[0]) or 0)
+            if ready_at:
+                self.instrumentation.observe(
+                    Metric.TASK_LAG_SECONDS, max(current_epoch - ready_at, 0), self.topic_name)
+
+    def _task_row(self, row: Sequence[Any]) -> TaskRow:
+        return TaskRow(
+            uuid=uuid_str_from_binary(row[0]),
+            status=TaskStatus(row[1]),
+            progressed_at=row[2],
+            scheduled_at=row[3],
+            priority=row[4],
+            task=self.codec.decode(row[5], row[8]),
+            queue_name=row[6],
+            depend_on=let_if(row[7], uuid_str_from_binary),
+            attempts=row[9],
+            max_attempts=row[10],
+            dedup_key=row[11],
+        )
+
+    def _scheduled_filter(
+        self,
+        queue_name: str,
+        current_epoch: float,
+    ) -> Tuple[FetchFilter, Sequence[Any]]:
+        return FetchFilter.SCHEDULED, (current_epoch, queue_name)
+
+    def _pending_filter(
+        self,
+        queue_name: str,
+        current_epoch: float,
+        check_term_seconds: int,
+    ) -> Tuple[FetchFilter, Sequence[Any]]:
+        return FetchFilter.PENDING, (int(current_epoch) - check_term_seconds, queue_name)
 
     async def fetch_scheduled_tasks(
         self,
@@ -142,18 +850,16 @@ class TaskRepository(AbstractRepository):
         limit: int,
         queue_name: str,
         ignore_dependency: bool = False,
+        lease_seconds: int = 0,
     ) -> List[TaskRow]:
         current_epoch = time.time()
 
-        fetch_filter = (self.task__status == int(TaskStatus.QUEUED))
-        fetch_filter &= (self.task__scheduled_at <= current_epoch)
-        fetch_filter &= (self.task__queue_name == queue_name)
-
-        return await self._fetch_tasks_by_filter(
-            fetch_filter=fetch_filter,
+        return await self._fetch_tasks_by_filters(
+            fetch_filters=[self._scheduled_filter(queue_name, current_epoch)],
             offset=offset,
             limit=limit,
             ignore_dependency=ignore_dependency,
+            lease_seconds=lease_seconds,
         )
 
     async def fetch_pending_tasks(
@@ -163,66 +869,640 @@ class TaskRepository(AbstractRepository):
         check_term_seconds: int,
         queue_name: str,
         ignore_dependency: bool = False,
+        lease_seconds: int = 0,
     ) -> List[TaskRow]:
         current_epoch = time.time()
 
-        fetch_filter = (self.task__status == int(TaskStatus.WORK_IN_PROGRESS))
-        fetch_filter &= (self.task__progressed_at <= (int(current_epoch) - check_term_seconds))
-        fetch_filter &= (self.task__queue_name == queue_name)
-
-        return await self._fetch_tasks_by_filter(
-            fetch_filter=fetch_filter,
+        return await self._fetch_tasks_by_filters(
+            fetch_filters=[self._pending_filter(queue_name, current_epoch, check_term_seconds)],
             offset=offset,
             limit=limit,
             ignore_dependency=ignore_dependency,
+            lease_seconds=lease_seconds,
         )
 
+    async def fetch_tasks(
+        self,
+        limit: int,
+        queue_name: str,
+        check_term_seconds: int,
+        ignore_dependency: bool = False,
+        pending_first: bool = True,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        # NOTE: Claims pending (lease expired over check term) and scheduled tasks
+        #  up to limit in total, with one connection, lock and transaction
+        current_epoch = time.time()
+
+        fetch_filters = [
+            self._pending_filter(queue_name, current_epoch, check_term_seconds),
+            self._scheduled_filter(queue_name, current_epoch),
+        ]
+        if not pending_first:
+            fetch_filters.reverse()
+        return await self._fetch_tasks_by_filters(
+            fetch_filters=fetch_filters,
+            offset=0,
+            limit=limit,
+            ignore_dependency=ignore_dependency,
+            lease_seconds=lease_seconds,
+        )
+
+    async def fetch_tasks_from_queues(
+        self,
+        queue_weights: Dict[str, int],
+        limit: int,
+        check_term_seconds: int,
+        ignore_dependency: bool = False,
+        pending_first: bool = True,
+        lease_seconds: int = 0,
+    ) -> List[TaskRow]:
+        # NOTE: Claims from several queues with one statement (UNION ALL of per-queue claims),
+        #  limit of each queue is share of limit by its weight
+        current_epoch = time.time()
+
+        queue_limits = [
+            (queue_name, queue_limit)
+            for queue_name, queue_limit in _weighted_limits(
+                queue_weights, limit, self._claim_rotation).items()
+            if queue_limit > 0
+        ]
+        self._claim_rotation += 1
+        if not queue_limits:
+            return []
+
+        fetch_filters = (FetchFilter.PENDING, FetchFilter.SCHEDULED)
+        if not pending_first:
+            fetch_filters = tuple(reversed(fetch_filters))
+        claim_parts = self._claim_parts(fetch_filters, ignore_dependency)
+        args = []
+        for queue_name, queue_limit in queue_limits:
+            for fetch_filter, _ in claim_parts:
+                if fetch_filter == FetchFilter.PENDING:
+                    _, filter_args = self._pending_filter(
+                        queue_name, current_epoch, check_term_seconds)
+                else:
+                    _, filter_args = self._scheduled_filter(queue_name, current_epoch)
+                args.extend((*filter_args, queue_limit))
+        aliases = _claim_aliases(len(queue_limits) * len(claim_parts))
+
+        async def select(cur: Cursor, locking_clause: str) -> List[Any]:
+            get_tasks_query = self._multi_queue_claim_statement(
+                fetch_filters, len(queue_limits), ignore_dependency, locking_clause)
+            logging.debug('%s %s', get_tasks_query, args)
+            await cur.execute(get_tasks_query, args)
+            rows_by_queue: Dict[str, List[Any]] = {}
+            for row in await cur.fetchall():
+                rows_by_queue.setdefault(row[6], []).append(row)
+            # NOTE: Each queue was claimed by each filter up to its limit, so rows over limit are
+            #  dropped in order of filters (not updated, so they are left to other consumers)
+            #  Scheduled rows of several statuses are merged in order of idx__claim
+            filter_order = {
+                fetch_filter: index for index, fetch_filter in enumerate(fetch_filters)}
+
+            def order(row: Sequence[Any]) -> Tuple[Any, ...]:
+                if row[1] == int(TaskStatus.WORK_IN_PROGRESS):
+                    return filter_order[FetchFilter.PENDING],
+                return filter_order[FetchFilter.SCHEDULED], -row[4], row[3], row[0]
+
+            task_rows = []
+            for queue_name, queue_limit in queue_limits:
+                rows = sorted(rows_by_queue.get(queue_name, []), key=order)
+                task_rows.extend(rows[:queue_limit])
+            return task_rows
+
+        return await self._claim(select, lease_seconds, aliases)
+
     async def insert_tasks(self, tasks: List[TaskRowIn]) -> List[TaskRow]:
         logging.debug(tasks)
-        insert_tasks_query = Query.into(self.task).columns(
-            self.task__uuid,
-            self.task__status,
-            self.task__progressed_at,
-            self.task__scheduled_at,
-            self.task__is_urgent,
-            self.task__task,
-            self.task__queue_name,
-            self.task__depend_on,
-        )
+        if not tasks:
+            return []
+        return await self._insert_encoded_tasks(
+            tasks, [self.codec.encode(task.task) for task in tasks])
 
-        inserted_tasks = []
-        for task in tasks:
-            task_row = TaskRow(
-                uuid=str(uuid.uuid4()),
-                status=TaskStatus.QUEUED,
-                progressed_at=0,
-                scheduled_at=task.scheduled_at,
-                is_urgent=task.is_urgent,
-                task=task.task,
-                queue_name=task.queue_name,
-                depend_on=task.depend_on,
-            )
-            insert_tasks_query = insert_tasks_query.insert(
-                task_row.uuid,
-                int(task_row.status),
-                task_row.progressed_at,
-                task_row.scheduled_at,
-                task_row.is_urgent,
-                json.dumps(task_row.task),
-                task_row.queue_name,
-                task_row.depend_on,
-            )
-            inserted_tasks.append(task_row)
-        insert_tasks_query = insert_tasks_query.get_sql(quote_char='`')
-        logging.debug(insert_tasks_query)
-        await self._execute([insert_tasks_query])
+    async def _chunk_tasks_for_insert(
+        self,
+        tasks: Union[Iterable[TaskRowIn], AsyncIterable[TaskRowIn]],
+        chunk_size: int,
+        chunk_bytes: int,
+    ) -> AsyncIterator[Tuple[List[TaskRowIn], List[Tuple[bytes, int]]]]:
+        async for chunk in _chunk_tasks(tasks, self.codec, chunk_size, chunk_bytes):
+            yield chunk
+
+    async def _insert_chunk(
+        self,
+        chunk: Tuple[List[TaskRowIn], List[Tuple[bytes, int]]],
+    ) -> List[TaskRow]:
+        return await self._insert_encoded_tasks(*chunk)
+
+    async def _insert_encoded_tasks(
+        self,
+        tasks: List[TaskRowIn],
+        encoded_tasks: List[Tuple[bytes, int]],
+    ) -> List[TaskRow]:
+        task_ids = [self.task_id_factory() for _ in tasks]
+        parents_by_task = [
+            {UUID(parent) for parent in [*task.dependencies, *filter(None, [task.depend_on])]}
+            for task in tasks
+        ]
+
+        queue_names = {task.queue_name for task in tasks}
+        dedup_keys = sorted({
+            (task.queue_name, task.dedup_key) for task in tasks if task.dedup_key is not None
+        })
+        if self.instrumentation.enabled:
+            started_at = time.perf_counter()
+        async with self._acquire() as conn:
+            conn: Connection = conn  # NOTE(pjongy): For type hinting
+            async with conn.cursor() as cur:
+                cur: Cursor = cur  # NOTE(pjongy): For type hinting
+                if dedup_keys:
+                    # NOTE: Keys not kept are locked by gap locks, which READ COMMITTED skips
+                    await cur.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                unfinished_parents = await self._lock_unfinished_parents(cur, parents_by_task)
+                completed_tasks = await self._fetch_completed_dedup_keys(cur, dedup_keys)
+                inserted_tasks = []
+                insert_args = []
+                dependency_args = []
+                for task, (encoded_task, task_codec), task_id, parents in zip(
+                    tasks, encoded_tasks, task_ids, parents_by_task,
+                ):
+                    pending_parents = parents & unfinished_parents
+                    task_row = TaskRow(
+                        uuid=str(task_id),
+                        status=TaskStatus.DEFERRED if pending_parents else TaskStatus.QUEUED,
+                        progressed_at=0,
+                        scheduled_at=task.scheduled_at,
+                        priority=effective_priority(task.priority, task.is_urgent),
+                        task=task.task,
+                        queue_name=task.queue_name,
+                        depend_on=task.depend_on,
+                        max_attempts=task.max_attempts,
+                        dedup_key=task.dedup_key,
+                    )
+                    completed_task_id = completed_tasks.get((task.queue_name, task.dedup_key))
+                    if completed_task_id is not None:
+                        task_row.uuid = completed_task_id
+                        task_row.status = TaskStatus.COMPLETED
+                        inserted_tasks.append(task_row)
+                        continue
+                    insert_args.append((
+                        task_id.bytes,
+                        int(task_row.status),
+                        task_row.progressed_at,
+                        task_row.scheduled_at,
+                        task_row.priority,
+                        encoded_task,
+                        task_row.queue_name,
+                        let_if(task_row.depend_on, lambda depend_on: UUID(depend_on).bytes),
+                        task_codec,
+                        task_row.attempts,
+                        task_row.max_attempts,
+                        task_row.dedup_key,
+                        task.dedup_seconds,
+                        len(pending_parents),
+                    ))
+                    dependency_args.extend(
+                        (parent.bytes, task_id.bytes) for parent in pending_parents)
+                    inserted_tasks.append(task_row)
+
+                if insert_args:
+                    await cur.executemany(self._insert_tasks_statement, insert_args)
+                if dedup_keys and insert_args:
+                    inserted_tasks = await self._resolve_duplicates(cur, dedup_keys, inserted_tasks)
+                    inserted_ids = {UUID(task_row.uuid).bytes for task_row in inserted_tasks}
+                    dependency_args = [
+                        (parent, child) for parent, child in dependency_args
+                        if child in inserted_ids
+                    ]
+                if dependency_args:
+                    await cur.executemany(self._insert_dependencies_statement, dependency_args)
+                if self.count_tasks and insert_args:
+                    # NOTE: Duplicates were replaced with their holders, so tasks (other than
+                    #  completed ones) keeping own id are the inserted ones
+                    inserted_ids = {
+                        task_row.uuid for task_row in inserted_tasks
+                        if task_row.status != TaskStatus.COMPLETED
+                    }
+                    await self._count(cur, CountDeltas(
+                        (args[6], 'waiting') for args in insert_args
+                        if uuid_str_from_binary(args[0]) in inserted_ids
+                    ))
+                # NOTE: Bumped in same transaction, so consumer seeing new version sees new tasks
+                await cur.executemany(self._bump_queue_version_statement, [
+                    (queue_name, random.randrange(QUEUE_VERSION_SLOTS), 1)
+                    for queue_name in sorted(queue_names)
+                ])
+                await conn.commit()
+        if self.instrumentation.enabled:
+            self.instrumentation.observe(
+                Metric.INSERT_SECONDS, time.perf_counter() - started_at, self.topic_name)
+            self.instrumentation.observe(Metric.INSERT_BATCH_SIZE, len(tasks), self.topic_name)
+        wakeup.notify(self.table_name, queue_names)
         return inserted_tasks
 
+    async def _fetch_completed_dedup_keys(
+        self,
+        cur: Cursor,
+        dedup_keys: List[DedupKey],
+    ) -> Dict[DedupKey, str]:
+        # NOTE: Locking read waits for completion of holder keeping its key in progress, and
+        #  (next-key) locks keys not kept, so holder completed meanwhile could not keep its key
+        #  until this insert is committed (one of them is rolled back as deadlock if holder was
+        #  locked by both). Otherwise a task could be inserted as its holder was just completed
+        if not dedup_keys:
+            return {}
+        await cur.execute(
+            self._fetch_completed_dedup_keys_statement, (dedup_keys, int(time.time())))
+        return {
+            (queue_name, dedup_key): uuid_str_from_binary(uuid)
+            for queue_name, dedup_key, uuid in await cur.fetchall()
+        }
+
+    async def _resolve_duplicates(
+        self,
+        cur: Cursor,
+        dedup_keys: List[DedupKey],
+        inserted_tasks: List[TaskRow],
+    ) -> List[TaskRow]:
+        # NOTE: Duplicate was not inserted by ON DUPLICATE KEY, so it is replaced with task
+        #  holding its key (inserted before or by earlier task of same batch)
+        await cur.execute(self._lock_dedup_keys_statement, (dedup_keys,))
+        holders = {
+            (task_row.queue_name, task_row.dedup_key): task_row
+            for task_row in map(self._task_row, await cur.fetchall())
+        }
+        return [
+            holders.get((task_row.queue_name, task_row.dedup_key), task_row)
+            if task_row.dedup_key is not None and task_row.status != TaskStatus.COMPLETED
+            else task_row
+            for task_row in inserted_tasks
+        ]
+
+    async def _lock_unfinished_parents(
+        self,
+        cur: Cursor,
+        parents_by_task: List[Set[UUID]],
+    ) -> Set[UUID]:
+        # NOTE: Parents are share-locked until commit, so parent could not be completed (deleted)
+        #  between counting and inserting edges from it
+        parents = set().union(*parents_by_task)
+        if not parents:
+            return set()
+        await cur.execute(self._lock_parents_statement, ([parent.bytes for parent in parents],))
+        return {UUID(bytes=row[0]) for row in await cur.fetchall()}
+
+    async def extend_leases(self, task_ids: List[str], lease_seconds: int):
+        # NOTE: Heartbeat of several in-flight tasks with one statement (primary key lookups)
+        if not task_ids:
+            return
+        await self._execute([(
+            self._extend_leases_statement,
+            (int(time.time()) + lease_seconds, [UUID(task_id).bytes for task_id in task_ids]),
+        )], PoolRole.CLAIM)
+
+    async def fail_tasks(
+        self,
+        task_ids: List[str],
+        base_delay_seconds: int,
+        max_delay_seconds: int,
+    ):
+        # NOTE: Reschedules WIP-ed tasks after exponential backoff with one statement, or
+        #  dead-letters tasks which used up their max attempts
+        logging.debug(task_ids)
+        if not task_ids:
+            return
+        uuids = [UUID(task_id).bytes for task_id in task_ids]
+        fail_args = (int(time.time()), base_delay_seconds, max_delay_seconds, uuids)
+        if not self.count_tasks:
+            await self._execute([(self._fail_tasks_statement, fail_args)])
+            return
+        async with self._acquire() as conn:
+            conn: Connection = conn  # NOTE(pjongy): For type hinting
+            async with conn.cursor() as cur:
+                cur: Cursor = cur  # NOTE(pjongy): For type hinting
+                await cur.execute(self._lock_failed_tasks_statement, (uuids,))
+                deltas = CountDeltas()
+                for queue_name, exhausted, count in await cur.fetchall():
+                    deltas[(queue_name, 'in_progress')] -= count
+                    deltas[(queue_name, 'dead_letter' if exhausted else 'waiting')] += count
+                await cur.execute(self._fail_tasks_statement, fail_args)
+                await self._count(cur, deltas)
+                await conn.commit()
+
+    async def insert_results(self, results: Dict[str, Any], ttl_seconds: int):
+        if not results:
+            return
+        current_epoch = int(time.time())
+        insert_args = [
+            (UUID(task_id).bytes, *self.codec.encode(result), current_epoch + ttl_seconds)
+            for task_id, result in results.items()
+        ]
+        async with self._acquire() as conn:
+            conn: Connection = conn  # NOTE(pjongy): For type hinting
+            async with conn.cursor() as cur:
+                cur: Cursor = cur  # NOTE(pjongy): For type hinting
+                await cur.executemany(self._insert_results_statement, insert_args)
+                # NOTE: Expired results are purged by writers little by little
+                await cur.execute(
+                    self._purge_results_statement, (current_epoch, RESULT_PURGE_LIMIT))
+                await conn.commit()
+
+    async def fetch_results(self, task_ids: List[str]) -> Dict[str, Any]:
+        if not task_ids:
+            return {}
+        (rows,) = await self._execute_and_fetch([(
+            self._fetch_results_statement,
+            ([UUID(task_id).bytes for task_id in task_ids], int(time.time())),
+        )], PoolRole.READ)
+        return {
+            uuid_str_from_binary(uuid): self.codec.decode(result, result_codec)
+            for uuid, result, result_codec in rows
+        }
+
+    async def fetch_dead_letter_tasks(
+        self,
+        offset: int,
+        limit: int,
+        queue_name: str,
+    ) -> List[TaskRow]:
+        # NOTE: Non-locking read. Dead-lettered tasks could be deleted by delete_tasks
+        results = await self._execute_and_fetch([
+            (self._fetch_dead_letter_tasks_statement, (queue_name, limit, offset)),
+        ], PoolRole.READ)
+        return [self._task_row(row) for row in results[0]]
+
+    async def fetch_queue_versions(self, queue_names: List[str]) -> Dict[str, int]:
+        # NOTE: Non-locking primary key lookup which is cheap enough to poll instead of claiming
+        if not queue_names:
+            return {}
+        # NOTE: Version read from lagging replica only wakes consumer up later (never misses)
+        results = await self._execute_and_fetch([
+            (self._fetch_queue_versions_statement, (queue_names,)),
+        ], PoolRole.READ)
+        versions = {queue_name: 0 for queue_name in queue_names}
+        versions.update({queue_name: int(version) for queue_name, version in results[0]})
+        return versions
+
+    def _fetch_queue_heads_statement(self, queue_count: int) -> str:
+        statement = self._fetch_queue_heads_statements.get(queue_count)
+        if statement is None:
+            # NOTE: UNION ALL of head of claim order of each queue, which is read from idx__claim
+            #  without touching rows
+            parts = []
+            for _ in range(queue_count):
+                # args: (queue_name, current_epoch) for each queue
+                part = Query.from_(self.task).select(
+                    self.task__queue_name, self.task__scheduled_at, self.task__uuid,
+                ).where(
+                    (self.task__queue_name == Parameter('%s'))
+                    & (self.task__status == int(TaskStatus.QUEUED))
+                    & (self.task__scheduled_at <= Parameter('%s'))
+                ).orderby(
+                    self.task__priority, order=Order.desc,
+                ).orderby(
+                    self.task__scheduled_at, self.task__uuid,
+                ).limit(1).get_sql(quote_char='`')
+                parts.append(f'({part})')
+            statement = self._fetch_queue_heads_statements[queue_count] = ' UNION ALL '.join(
+                parts)
+        return statement
+
+    async def fetch_queue_stats(
+        self,
+        queue_names: List[str],
+        mode: StatsMode,
+    ) -> Dict[str, QueueStats]:
+        # NOTE: Non-locking reads. Exact mode counts tasks by index, and approximate mode sums
+        #  counter rows of queues, which does not depend on number of tasks
+        if not queue_names:
+            return {}
+        if mode == StatsMode.APPROXIMATE and not self.count_tasks:
+            # NOTE: Counter rows are not maintained without count_tasks, so counted exactly (cost
+            #  grows with number of tasks). Warned once per repository, since stats are polled
+            if not self._exact_fallback_warned:
+                self._exact_fallback_warned = True
+                logging.warning(
+                    f'{self.table_name}: approximate stats are counted exactly without count_tasks')
+            mode = StatsMode.EXACT
+        current_epoch = time.time()
+        queue_names = sorted(set(queue_names))
+        count_statement = (
+            self._count_tasks_by_status_statement if mode == StatsMode.EXACT
+            else self._fetch_queue_counts_statement
+        )
+        counts, heads = await self._execute_and_fetch([
+            (count_statement, (queue_names,)),
+            (
+                self._fetch_queue_heads_statement(len(queue_names)),
+                [arg for queue_name in queue_names for arg in (queue_name, int(current_epoch))],
+            ),
+        ], PoolRole.READ)
+        stats = {queue_name: QueueStats(queue_name=queue_name) for queue_name in queue_names}
+        if mode == StatsMode.EXACT:
+            for queue_name, status, count in counts:
+                counter = STATUS_COUNTERS.get(TaskStatus(status))
+                if counter is not None:
+                    queue_stats = stats[queue_name]
+                    setattr(queue_stats, counter, getattr(queue_stats, counter) + count)
+        else:
+            for queue_name, *queue_counts in counts:
+                for counter, count in zip(QUEUE_COUNTERS, queue_counts):
+                    # NOTE: Counter could be under 0 if tasks were there before counting
+                    setattr(stats[queue_name], counter, max(int(count), 0))
+        for queue_name, scheduled_at, uuid in heads:
+            stats[queue_name].lag_seconds = _lag_seconds(scheduled_at, uuid, current_epoch)
+        return stats
+
+    async def recount_queues(self, queue_names: List[str]):
+        # NOTE: Resets counters of queues to exact counts (e.g. after count_tasks was enabled for
+        #  existing topic). Counter rows are locked before tasks are counted, so writers changed
+        #  tasks after the count add their deltas after this is committed
+        if not queue_names:
+            return
+        async with self._acquire() as conn:
+            conn: Connection = conn  # NOTE(pjongy): For type hinting
+            async with conn.cursor() as cur:
+                cur: Cursor = cur  # NOTE(pjongy): For type hinting
+                await cur.execute(self._lock_queue_counts_statement, (queue_names,))
+                await cur.execute(self._count_tasks_by_status_statement, (queue_names,))
+                deltas = CountDeltas()
+                for queue_name, status, count in await cur.fetchall():
+                    counter = STATUS_COUNTERS.get(TaskStatus(status))
+                    if counter is not None:
+                        deltas[(queue_name, counter)] += count
+                await cur.execute(self._delete_queue_counts_statement, (queue_names,))
+                await cur.executemany(self._count_tasks_statement, [
+                    (queue_name, 0, *[deltas[(queue_name, counter)] for counter in QUEUE_COUNTERS])
+                    for queue_name in sorted(set(queue_names))
+                ])
+                await conn.commit()
+
     async def delete_tasks(self, task_ids: List[str]):
         logging.debug(task_ids)
-        fetch_filter = self.task__uuid.isin(task_ids)
-        delete_tasks_query = Query.from_(self.task).where(
-            fetch_filter
-        ).delete().get_sql(quote_char='`')
-        logging.debug(delete_tasks_query)
-        await self._execute([delete_tasks_query])
+        if not task_ids:
+            return
+        uuids = [UUID(task_id).bytes for task_id in task_ids]
+        if self.instrumentation.enabled:
+            started_at = time.perf_counter()
+        async with self._acquire() as conn:
+            conn: Connection = conn  # NOTE(pjongy): For type hinting
+            async with conn.cursor() as cur:
+                cur: Cursor = cur  # NOTE(pjongy): For type hinting
+                # NOTE: Dedup keys are kept for dedup_seconds of completed tasks
+                current_epoch = int(time.time())
+                await cur.execute(self._keep_dedup_keys_statement, (current_epoch, uuids))
+                if cur.rowcount > 0:
+                    await cur.execute(
+                        self._purge_dedup_keys_statement, (current_epoch, DEDUP_PURGE_LIMIT))
+                released_queue_names = await self._delete_tasks(cur, uuids)
+                await conn.commit()
+        if self.instrumentation.enabled:
+            self.instrumentation.observe(
+                Metric.DELETE_SECONDS, time.perf_counter() - started_at, self.topic_name)
+            self.instrumentation.observe(Metric.DELETE_BATCH_SIZE, len(task_ids), self.topic_name)
+        if released_queue_names:
+            wakeup.notify(self.table_name, released_queue_names)
+
+    async def _delete_tasks(self, cur: Cursor, uuids: List[bytes]) -> Set[str]:
+        # NOTE: Returns queue names of released children, to be notified after commit
+        if self.count_tasks:
+            await cur.execute(self._lock_tasks_by_status_statement, (uuids,))
+            deltas = CountDeltas()
+            for queue_name, status, count in await cur.fetchall():
+                deltas[(queue_name, STATUS_COUNTERS[TaskStatus(status)])] -= count
+        # NOTE: Deleting first locks tasks, so edges from them are not inserted meanwhile
+        await cur.execute(self._delete_tasks_statement, (uuids,))
+        if self.count_tasks:
+            await self._count(cur, deltas)
+        await cur.execute(self._lock_children_statement, (uuids,))
+        children = Counter(row[0] for row in await cur.fetchall())
+        if not children:
+            return set()
+        await cur.execute(self._delete_dependencies_statement, (uuids,))
+        return await self._release_children(cur, children)
+
+    def _filter_criterion(self, task_filter: TaskFilter) -> Tuple[Any, List[Any]]:
+        # NOTE: Leading columns of idx__claim, so chunks are read by index range
+        criterion = (self.task__queue_name == Parameter('%s')) & self.task__status.isin(
+            Parameter('%s'))
+        args = [task_filter.queue_name, [int(status) for status in task_filter.statuses]]
+        for field, value, compare in [
+            (self.task__scheduled_at, task_filter.scheduled_from, Field.__ge__),
+            (self.task__scheduled_at, task_filter.scheduled_to, Field.__lt__),
+            (self.task__priority, task_filter.min_priority, Field.__ge__),
+            (self.task__priority, task_filter.max_priority, Field.__le__),
+        ]:
+            if value is not None:
+                criterion &= compare(field, Parameter('%s'))
+                args.append(value)
+        return criterion, args
+
+    async def _execute_in_chunks(
+        self,
+        chunk_size: int,
+        execute: Callable[[Cursor], Awaitable[int]],
+    ) -> int:
+        # NOTE: Each chunk is committed in its own transaction until a chunk is not filled
+        count = 0
+        while True:
+            async with self._acquire() as conn:
+                conn: Connection = conn  # NOTE(pjongy): For type hinting
+                async with conn.cursor() as cur:
+                    cur: Cursor = cur  # NOTE(pjongy): For type hinting
+                    changed = await execute(cur)
+                    await conn.commit()
+            count += changed
+            if changed < chunk_size:
+                return count
+
+    async def delete_tasks_by_filter(self, task_filter: TaskFilter, chunk_size: int) -> int:
+        logging.debug(task_filter)
+        if not task_filter.statuses:
+            return 0
+        criterion, args = self._filter_criterion(task_filter)
+        # NOTE: Ids of chunk are locked and deleted in same transaction (never shipped to caller),
+        #  so children of cancelled tasks are released same as completion
+        select_statement = Query.from_(self.task).select(
+            self.task__uuid,
+        ).where(criterion).limit(Parameter('%s')).get_sql(quote_char='`') + ' FOR UPDATE'
+
+        released_queue_names: Set[str] = set()
+
+        async def delete_chunk(cur: Cursor) -> int:
+            await cur.execute(select_statement, (*args, chunk_size))
+            uuids = [row[0] for row in await cur.fetchall()]
+            if uuids:
+                released_queue_names.update(await self._delete_tasks(cur, uuids))
+            return len(uuids)
+
+        count = await self._execute_in_chunks(chunk_size, delete_chunk)
+        if released_queue_names:
+            wakeup.notify(self.table_name, released_queue_names)
+        return count
+
+    async def _update_by_filter(
+        self,
+        task_filter: TaskFilter,
+        field: Field,
+        value: int,
+        chunk_size: int,
+    ) -> int:
+        if not task_filter.statuses:
+            return 0
+        criterion, args = self._filter_criterion(task_filter)
+        # NOTE: Updated rows do not match any more, so next chunk goes on to other rows
+        statement = Query.update(self.task).set(field, Parameter('%s')).where(
+            criterion & (field != Parameter('%s'))
+        ).limit(Parameter('%s')).get_sql(quote_char='`')
+
+        async def update_chunk(cur: Cursor) -> int:
+            await cur.execute(statement, (value, *args, value, chunk_size))
+            return cur.rowcount
+
+        return await self._execute_in_chunks(chunk_size, update_chunk)
+
+    async def reschedule_tasks_by_filter(
+        self,
+        task_filter: TaskFilter,
+        scheduled_at: int,
+        chunk_size: int,
+    ) -> int:
+        logging.debug(task_filter)
+        count = await self._update_by_filter(
+            task_filter, self.task__scheduled_at, scheduled_at, chunk_size)
+        if count:
+            # NOTE: Tasks could become due earlier, so waiting consumers are woken up
+            await self._execute([(
+                self._bump_queue_version_statement,
+                (task_filter.queue_name, random.randrange(QUEUE_VERSION_SLOTS), 1),
+            )])
+            wakeup.notify(self.table_name, [task_filter.queue_name])
+        return count
+
+    async def reprioritize_tasks_by_filter(
+        self,
+        task_filter: TaskFilter,
+        priority: int,
+        chunk_size: int,
+    ) -> int:
+        logging.debug(task_filter)
+        return await self._update_by_filter(
+            task_filter, self.task__priority, priority, chunk_size)
+
+    async def _release_children(self, cur: Cursor, children: Counter) -> Set[str]:
+        # NOTE: Child is decremented by number of its parents completed in this batch at once
+        children_by_count: Dict[int, List[bytes]] = {}
+        for child, count in children.items():
+            children_by_count.setdefault(count, []).append(child)
+        for count, children_ in sorted(children_by_count.items()):
+            await cur.execute(self._release_children_statement, (count, sorted(children_)))
+        # NOTE: Versions of queues having released children are bumped in same transaction, so
+        #  consumers waiting on them see children as soon as they are QUEUED
+        await cur.execute(self._fetch_released_queues_statement, (sorted(children),))
+        queue_names = {row[0] for row in await cur.fetchall()}
+        await cur.executemany(self._bump_queue_version_statement, [
+            (queue_name, random.randrange(QUEUE_VERSION_SLOTS), 1)
+            for queue_name in sorted(queue_names)
+        ])
+        return queue_names
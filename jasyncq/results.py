@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, Set, Any, List, Callable, Awaitable, Iterable
+
+# NOTE: Waiters of task results, keyed by topic table name and task id. Results completed in same
+#  process resolve waiters immediately, and the others are polled for all outstanding tasks of
+#  topic in process with one query per tick
+_waiters: Dict[str, Dict[str, Set[asyncio.Future]]] = defaultdict(dict)
+_pollers: Dict[str, asyncio.Future] = {}
+_polls: Dict[str, asyncio.Event] = {}  # NOTE: Set to poll before interval for new waiters
+
+FetchResults = Callable[[List[str]], Awaitable[Dict[str, Any]]]
+
+
+def notify(table_name: str, results: Dict[str, Any]):
+    waiters = _waiters.get(table_name)
+    if not waiters:
+        return
+    for task_id, result in results.items():
+        for waiter in waiters.pop(task_id, ()):
+            if not waiter.done():
+                waiter.set_result(result)
+
+
+async def _poll(table_name: str, fetch_results: FetchResults, interval_seconds: float):
+    # NOTE: Runs while any result of topic is awaited. Waiters added in same tick share one poll
+    poll = _polls[table_name]
+    while _waiters.get(table_name):
+        poll.clear()
+        try:
+            notify(table_name, await fetch_results(list(_waiters[table_name])))
+        except Exception:
+            logging.exception(f'Failed to fetch results of {table_name}')
+        try:
+            await asyncio.wait_for(poll.wait(), timeout=interval_seconds)
+        except asyncio.TimeoutError:
+            pass
+    _waiters.pop(table_name, None)
+    _polls.pop(table_name, None)
+
+
+async def wait(
+    table_name: str,
+    task_ids: Iterable[str],
+    fetch_results: FetchResults,
+    timeout: float,
+    interval_seconds: float,
+) -> Dict[str, Any]:
+    # NOTE: Returns results arrived within timeout (tasks not completed yet are omitted)
+    loop = asyncio.get_event_loop()
+    futures = {task_id: loop.create_future() for task_id in task_ids}
+    if not futures:
+        return {}
+    waiters = _waiters[table_name]
+    for task_id, future in futures.items():
+        waiters.setdefault(task_id, set()).add(future)
+    poller = _pollers.get(table_name)
+    if poller is None or poller.done():
+        _polls[table_name] = asyncio.Event()
+        _pollers[table_name] = asyncio.ensure_future(
+            _poll(table_name, fetch_results, interval_seconds))
+    else:
+        _polls[table_name].set()
+    try:
+        await asyncio.wait(list(futures.values()), timeout=timeout)
+    finally:
+        for task_id, future in futures.items():
+            if future.done():
+                continue
+            future.cancel()
+            waiters_ = waiters.get(task_id)
+            if waiters_ is not None:
+                waiters_.discard(future)
+                if not waiters_:
+                    del waiters[task_id]
+    return {
+        task_id: future.result()
+        for task_id, future in futures.items()
+        if future.done() and not future.cancelled()
+    }
@@ -0,0 +1,80 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict, Tuple, Set, List, Callable, Awaitable, Iterable
+
+from jasyncq.repository.model.stats import QueueStats, StatsMode
+
+# NOTE: Stats of queues cached in process, keyed by (topic table name, mode). Readers within
+#  max age share cached stats, and stale queues requested at once share one fetch in flight
+_CacheKey = Tuple[str, StatsMode]
+_cache: Dict[_CacheKey, Dict[str, Tuple[float, QueueStats]]] = defaultdict(dict)
+_fetches: Dict[_CacheKey, Tuple[Set[str], asyncio.Future]] = {}
+
+FetchStats = Callable[[List[str]], Awaitable[Dict[str, QueueStats]]]
+
+
+async def _fetch(
+    key: _CacheKey,
+    queue_names: List[str],
+    fetch_stats: FetchStats,
+) -> Dict[str, QueueStats]:
+    stats = await fetch_stats(queue_names)
+    fetched_at = time.monotonic()
+    cache = _cache[key]
+    for queue_name in queue_names:
+        cache[queue_name] = (fetched_at, stats[queue_name])
+    return stats
+
+
+def _evict(key: _CacheKey, now: float, max_age_seconds: float):
+    # NOTE: Stats older than max age are never read again as they are, so queues no longer read
+    #  (e.g. of temporary queue names) do not stay in cache
+    cache = _cache[key]
+    for queue_name in [
+        queue_name for queue_name, (fetched_at, _) in cache.items()
+        if now - fetched_at > max_age_seconds
+    ]:
+        del cache[queue_name]
+    if not cache:
+        del _cache[key]
+
+
+def _forget(key: _CacheKey, future: asyncio.Future):
+    fetch = _fetches.get(key)
+    if fetch is not None and fetch[1] is future:
+        del _fetches[key]
+
+
+async def fetch(
+    table_name: str,
+    queue_names: Iterable[str],
+    mode: StatsMode,
+    fetch_stats: FetchStats,
+    max_age_seconds: float,
+) -> Dict[str, QueueStats]:
+    key = (table_name, mode)
+    queue_names = list(queue_names)
+    cache = _cache[key]
+    now = time.monotonic()
+    stale = {
+        queue_name for queue_name in queue_names
+        if queue_name not in cache or now - cache[queue_name][0] > max_age_seconds
+    }
+    # NOTE: Fresh stats are taken before waiting, since they could be evicted by other readers
+    #  meanwhile. Stale ones are taken from result of fetch
+    stats = {
+        queue_name: cache[queue_name][1] for queue_name in queue_names if queue_name not in stale}
+    if stale:
+        _evict(key, now, max_age_seconds)
+        fetch_ = _fetches.get(key)
+        if fetch_ is not None and stale <= fetch_[0]:
+            future = fetch_[1]
+        else:
+            future = asyncio.ensure_future(_fetch(key, sorted(stale), fetch_stats))
+            future.add_done_callback(lambda future_: _forget(key, future_))
+            _fetches[key] = (stale, future)
+        # NOTE: Fetch is shared, so it is not cancelled with one of its readers
+        fetched = await asyncio.shield(future)
+        stats.update((queue_name, fetched[queue_name]) for queue_name in stale)
+    return {queue_name: stats[queue_name] for queue_name in queue_names}
@@ -1,7 +1,81 @@
+import os
+import random
+import re
+import threading
+import time
 from typing import Optional, Any
+from uuid import UUID
 
 
 def let_if(value, func) -> Optional[Any]:
     if value is not None:
         return func(value)
     return value
+
+
+def is_skip_locked_supported(server_version: str) -> bool:
+    # NOTE: `FOR UPDATE SKIP LOCKED` exists since MySQL 8.0.1 and MariaDB 10.6
+    mariadb = re.search(r'(\d+)\.(\d+)\.(\d+)-MariaDB', server_version, re.IGNORECASE)
+    if mariadb is not None:
+        return tuple(int(number) for number in mariadb.groups()) >= (10, 6, 0)
+    mysql = re.match(r'(\d+)\.(\d+)\.(\d+)', server_version)
+    if mysql is None:
+        return False
+    return tuple(int(number) for number in mysql.groups()) >= (8, 0, 1)
+
+
+def uuid_str_from_binary(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        # NOTE: Same as str(UUID(bytes=value)) without building UUID object
+        hex_value = value.hex()
+        return (
+            f'{hex_value[:8]}-{hex_value[8:12]}-{hex_value[12:16]}-'
+            f'{hex_value[16:20]}-{hex_value[20:]}'
+        )
+    return value
+
+
+def uuid_from_binary(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return UUID(bytes=bytes(value))
+    return value
+
+
+_UUID7_COUNTER_MAX = 0xFFF
+_uuid7_lock = threading.Lock()
+_uuid7_last_ms = 0
+_uuid7_counter = 0
+
+
+def uuid7() -> UUID:
+    # NOTE: Unix epoch milliseconds in leading 48 bits make ids (and index inserts) time-ordered.
+    #  12 bits after version are counter within millisecond (RFC 9562 6.2 method 1) seeded with
+    #  11 random bits, so ids of same process are monotonic even if created in same millisecond.
+    #  Timestamp is advanced on counter overflow or clock going back
+    global _uuid7_last_ms, _uuid7_counter
+    with _uuid7_lock:
+        timestamp_ms = time.time_ns() // 1_000_000
+        if timestamp_ms > _uuid7_last_ms:
+            _uuid7_last_ms = timestamp_ms
+            _uuid7_counter = random.getrandbits(11)
+        else:
+            _uuid7_counter += 1
+            if _uuid7_counter > _UUID7_COUNTER_MAX:
+                _uuid7_last_ms += 1
+                _uuid7_counter = random.getrandbits(11)
+        timestamp_ms, counter = _uuid7_last_ms, _uuid7_counter
+    value = (
+        (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76  # version
+        | counter << 64
+        | 0x2 << 62  # variant (RFC 4122)
+        | int.from_bytes(os.urandom(8), 'big') & 0x3FFF_FFFF_FFFF_FFFF
+    )
+    return UUID(int=value)
+
+
+def uuid7_epoch(value: bytes) -> Optional[float]:
+    # NOTE: Creation time of UUIDv7 (None for ids of other versions)
+    if len(value) != 16 or value[6] >> 4 != 7:
+        return None
+    return int.from_bytes(value[:6], 'big') / 1000
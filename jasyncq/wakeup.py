@@ -0,0 +1,52 @@
+import asyncio
+from collections import defaultdict
+from typing import Dict, Tuple, Set, Iterable
+
+# NOTE: In-process notification of inserted tasks, keyed by (topic table name, queue name).
+#  Lets consumer wake up right after producer in same process applied tasks
+_versions: Dict[Tuple[str, str], int] = defaultdict(int)
+_waiters: Dict[Tuple[str, str], Set[asyncio.Future]] = defaultdict(set)
+# NOTE: Notifications of table are forwarded to these tables too (e.g. from shard to sharded
+#  topic, since consumers wait for sharded topic while shards notify their own tables)
+_forwards: Dict[str, Set[str]] = defaultdict(set)
+
+
+def forward(table_name: str, to_table_name: str):
+    if table_name != to_table_name:
+        _forwards[table_name].add(to_table_name)
+
+
+def version(table_name: str, queue_names: Iterable[str]) -> int:
+    return sum(_versions.get((table_name, queue_name), 0) for queue_name in queue_names)
+
+
+def notify(table_name: str, queue_names: Iterable[str]):
+    queue_names = list(queue_names)
+    for to_table_name in _forwards.get(table_name, ()):
+        notify(to_table_name, queue_names)
+    for queue_name in queue_names:
+        key = (table_name, queue_name)
+        _versions[key] += 1
+        for waiter in _waiters.pop(key, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+async def wait(table_name: str, queue_names: Iterable[str], since: int, timeout: float) -> bool:
+    queue_names = list(queue_names)
+    if version(table_name, queue_names) != since:
+        return True
+    waiter = asyncio.get_event_loop().create_future()
+    keys = [(table_name, queue_name) for queue_name in queue_names]
+    for key in keys:
+        _waiters[key].add(waiter)
+    try:
+        await asyncio.wait_for(waiter, timeout=timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        for key in keys:
+            _waiters[key].discard(waiter)
+            if not _waiters[key]:
+                del _waiters[key]
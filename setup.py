@@ -17,6 +17,11 @@ setup(
         'aiomysql>=0.0.20',
         'PyPika>=0.37.6',
     ],
+    extras_require={
+        'orjson': ['orjson>=3.0.0'],
+        'msgpack': ['msgpack>=1.0.0'],
+        'zstd': ['zstandard>=0.15.0'],
+    },
     packages=find_packages(),
     keywords=['message queue', 'queue', 'distributed', 'microservice'],
     python_requires='>=3.7',
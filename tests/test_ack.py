@@ -0,0 +1,79 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from jasyncq.dispatcher.ack import AckBuffer
+
+
+class FakeDispatcher:
+    def __init__(self, failures: int = 0):
+        self.calls: List[List[str]] = []
+        self.failures = failures
+
+    async def complete_tasks(self, task_ids: List[str]):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError()
+        self.calls.append(task_ids)
+
+
+@pytest.mark.asyncio
+async def test_if_flushed_by_size():
+    dispatcher = FakeDispatcher()
+    acks = AckBuffer(dispatcher, max_size=3, max_delay_seconds=10)
+    for task_id in ['a', 'b', 'c', 'd']:
+        await acks.add(task_id)
+    assert dispatcher.calls == [['a', 'b', 'c']]
+    assert len(acks) == 1
+
+
+@pytest.mark.asyncio
+async def test_if_flushed_by_age():
+    dispatcher = FakeDispatcher()
+    acks = AckBuffer(dispatcher, max_size=100, max_delay_seconds=0.01)
+    await acks.add('a')
+    await acks.add('b')
+    assert dispatcher.calls == []
+    await asyncio.sleep(0.05)
+    assert dispatcher.calls == [['a', 'b']]
+
+
+@pytest.mark.asyncio
+async def test_if_flushed_by_close():
+    dispatcher = FakeDispatcher()
+    acks = AckBuffer(dispatcher, max_size=100, max_delay_seconds=10)
+    await acks.add('a')
+    await acks.close()
+    assert dispatcher.calls == [['a']]
+
+
+@pytest.mark.asyncio
+async def test_if_failed_flush_is_retried_by_timer():
+    dispatcher = FakeDispatcher(failures=2)
+    acks = AckBuffer(dispatcher, max_size=2, max_delay_seconds=0.01)
+    await acks.add('a')
+    await acks.add('b')
+    assert dispatcher.calls == []
+    assert len(acks) == 2
+    # NOTE: Retried after 0.02s and 0.04s without another add or close
+    await asyncio.sleep(0.2)
+    assert dispatcher.calls == [['a', 'b']]
+    assert len(acks) == 0
+
+
+class FakeResultDispatcher(FakeDispatcher):
+    async def complete_tasks(self, task_ids: List[str], results=None, result_ttl_seconds=None):
+        await super().complete_tasks(task_ids)
+        self.results = (results, result_ttl_seconds)
+
+
+@pytest.mark.asyncio
+async def test_if_results_flushed_with_completions():
+    dispatcher = FakeResultDispatcher()
+    acks = AckBuffer(dispatcher, max_size=3, max_delay_seconds=10, result_ttl_seconds=60)
+    await acks.add('a', {'ok': True})
+    await acks.add('b')
+    await acks.add('c', None)
+    assert dispatcher.calls == [['a', 'b', 'c']]
+    assert dispatcher.results == ({'a': {'ok': True}, 'c': None}, 60)
@@ -0,0 +1,497 @@
+import time
+
+import aiomysql
+import pytest
+
+from jasyncq.repository.abstract import AbstractTaskRepository
+from jasyncq.repository.memory import MemoryTaskRepository
+from jasyncq.repository.model.stats import StatsMode
+from jasyncq.repository.model.task import TaskRowIn, TaskStatus, TaskFilter
+from jasyncq.repository.sqlite import SQLiteTaskRepository
+from jasyncq.repository.tasks import TaskRepository
+
+from tests.util import random_string_lower
+
+BACKENDS = ['memory', 'sqlite', 'mysql']
+
+
+def _past(index: int) -> int:
+    # NOTE: Distinct scheduled_at of due tasks for filters by range
+    return int(time.time()) - 100 + index
+
+
+async def _repository(backend: str, tmp_path) -> AbstractTaskRepository:
+    topic_name = random_string_lower()
+    if backend == 'memory':
+        repository = MemoryTaskRepository(topic_name=topic_name)
+    elif backend == 'sqlite':
+        repository = SQLiteTaskRepository(path=str(tmp_path / 'jasyncq.db'), topic_name=topic_name)
+    else:
+        pool = await aiomysql.create_pool(
+            host='127.0.0.1',
+            port=3306,
+            user='root',
+            db='test',
+            autocommit=False,
+        )
+        repository = TaskRepository(pool=pool, topic_name=topic_name)
+    await repository.initialize()
+    return repository
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_claim_order_by_priority_and_fifo(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    inserted = await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name),
+        TaskRowIn(task={'id': 2}, queue_name=queue_name, priority=5),
+        TaskRowIn(task={'id': 3}, queue_name=queue_name),
+        TaskRowIn(task={'id': 4}, queue_name=queue_name, is_urgent=True),
+        TaskRowIn(task={'id': 5}, queue_name=queue_name, scheduled_at=int(time.time()) + 60),
+    ])
+    assert [task.status for task in inserted] == [TaskStatus.QUEUED] * 5
+
+    tasks = await repository.fetch_scheduled_tasks(1, 2, queue_name)
+    assert [task.task['id'] for task in tasks] == [4, 1]
+    tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert [task.task['id'] for task in tasks] == [2, 3]
+    assert [task.status for task in tasks] == [TaskStatus.QUEUED] * 2
+    assert await repository.fetch_scheduled_tasks(0, 10, queue_name) == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_pending_tasks_reclaimed_after_check_term(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name),
+        TaskRowIn(task={'id': 2}, queue_name=queue_name, priority=1),
+    ])
+    claimed = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert [task.task['id'] for task in claimed] == [2, 1]
+
+    assert await repository.fetch_pending_tasks(0, 10, 60, queue_name) == []
+    tasks = await repository.fetch_pending_tasks(0, 10, 0, queue_name)
+    assert [task.task['id'] for task in tasks] == [2, 1]
+    assert [task.status for task in tasks] == [TaskStatus.WORK_IN_PROGRESS] * 2
+    assert all(task.progressed_at > 0 for task in tasks)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_fetch_tasks_pending_first(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name),
+    ])
+    await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    await repository.insert_tasks([
+        TaskRowIn(task={'id': 2}, queue_name=queue_name),
+        TaskRowIn(task={'id': 3}, queue_name=queue_name),
+    ])
+
+    tasks = await repository.fetch_tasks(2, queue_name, check_term_seconds=0)
+    assert [task.task['id'] for task in tasks] == [1, 2]
+    tasks = await repository.fetch_tasks(
+        2, queue_name, check_term_seconds=0, pending_first=False)
+    assert tasks[0].task['id'] == 3
+    assert tasks[1].task['id'] in [1, 2]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_dependencies_released_by_delete(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    parents = await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name),
+        TaskRowIn(task={'id': 2}, queue_name=queue_name),
+    ])
+    [child] = await repository.insert_tasks([
+        TaskRowIn(
+            task={'id': 3},
+            queue_name=queue_name,
+            depend_on=parents[0].uuid,
+            dependencies=[parents[1].uuid],
+        ),
+    ])
+    assert child.status == TaskStatus.DEFERRED
+
+    tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert [task.task['id'] for task in tasks] == [1, 2]
+    await repository.delete_tasks([parents[0].uuid])
+    assert await repository.fetch_scheduled_tasks(0, 10, queue_name) == []
+    await repository.delete_tasks([parents[1].uuid])
+    tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert [task.uuid for task in tasks] == [child.uuid]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_ignore_dependency(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    [parent] = await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name),
+    ])
+    await repository.insert_tasks([
+        TaskRowIn(
+            task={'id': 2}, queue_name=queue_name, depend_on=parent.uuid),
+    ])
+
+    tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name, ignore_dependency=True)
+    assert [task.task['id'] for task in tasks] == [1, 2]
+    assert tasks[1].status == TaskStatus.DEFERRED
+    tasks = await repository.fetch_pending_tasks(0, 10, 0, queue_name)
+    assert [task.task['id'] for task in tasks] == [1]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_ignore_dependency_keeps_order_over_statuses(backend, tmp_path):
+    # NOTE: MySQL claims DEFERRED and QUEUED tasks by separate parts merged in order
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    [parent] = await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name, scheduled_at=_past(2)),
+    ])
+    await repository.insert_tasks([
+        TaskRowIn(task={'id': 2}, queue_name=queue_name, depend_on=parent.uuid, priority=5),
+        TaskRowIn(task={'id': 3}, queue_name=queue_name, priority=3),
+        TaskRowIn(
+            task={'id': 4}, queue_name=queue_name, depend_on=parent.uuid, scheduled_at=_past(1)),
+    ])
+
+    tasks = await repository.fetch_scheduled_tasks(1, 2, queue_name, ignore_dependency=True)
+    assert [task.task['id'] for task in tasks] == [3, 4]
+    tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name, ignore_dependency=True)
+    assert [task.task['id'] for task in tasks] == [2, 1]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_fetch_tasks_from_queues(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    hot_queue_name = random_string_lower()
+    cold_queue_name = random_string_lower()
+    await repository.insert_tasks([
+        *[TaskRowIn(task={'id': i}, queue_name=hot_queue_name) for i in range(10)],
+        *[TaskRowIn(task={'id': i}, queue_name=cold_queue_name) for i in range(10)],
+    ])
+
+    tasks = await repository.fetch_tasks_from_queues(
+        {hot_queue_name: 3, cold_queue_name: 1}, limit=8, check_term_seconds=30)
+    assert [task.queue_name for task in tasks].count(hot_queue_name) == 6
+    assert [task.queue_name for task in tasks].count(cold_queue_name) == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_delete_tasks_and_queue_versions(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    other_queue_name = random_string_lower()
+    assert await repository.fetch_queue_versions([queue_name]) == {queue_name: 0}
+
+    tasks = await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name),
+    ])
+    await repository.insert_tasks([
+        TaskRowIn(task={'id': 2}, queue_name=queue_name),
+    ])
+    versions = await repository.fetch_queue_versions([queue_name, other_queue_name])
+    assert versions[queue_name] >= 2
+    assert versions[other_queue_name] == 0
+
+    await repository.delete_tasks([tasks[0].uuid])
+    tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert [task.task['id'] for task in tasks] == [2]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_queue_versions_bumped_by_released_children(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    child_queue_name = random_string_lower()
+    parents = await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name),
+        TaskRowIn(task={'id': 2}, queue_name=queue_name),
+    ])
+    await repository.insert_tasks([
+        TaskRowIn(
+            task={'id': 3},
+            queue_name=child_queue_name,
+            depend_on=parents[0].uuid,
+            dependencies=[parents[1].uuid],
+        ),
+    ])
+    [version] = (await repository.fetch_queue_versions([child_queue_name])).values()
+
+    await repository.delete_tasks([parents[0].uuid])
+    assert await repository.fetch_queue_versions([child_queue_name]) == {
+        child_queue_name: version}
+    await repository.delete_tasks_by_filter(
+        TaskFilter(queue_name=queue_name, statuses=[TaskStatus.QUEUED]), chunk_size=10)
+    assert (await repository.fetch_queue_versions([child_queue_name]))[child_queue_name] > version
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_pending_tasks_reclaimed_after_lease_expired(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name),
+        TaskRowIn(task={'id': 2}, queue_name=queue_name),
+    ])
+    claimed = await repository.fetch_scheduled_tasks(0, 10, queue_name, lease_seconds=60)
+    assert await repository.fetch_pending_tasks(0, 10, 0, queue_name) == []
+
+    # NOTE: Lease of 0 seconds from now expires immediately
+    await repository.extend_leases([claimed[0].uuid], lease_seconds=0)
+    tasks = await repository.fetch_pending_tasks(0, 10, 0, queue_name, lease_seconds=60)
+    assert [task.task['id'] for task in tasks] == [1]
+    assert await repository.fetch_pending_tasks(0, 10, 0, queue_name) == []
+
+    # NOTE: Check term is grace period after lease expired
+    await repository.extend_leases([claimed[1].uuid], lease_seconds=-60)
+    assert await repository.fetch_pending_tasks(0, 10, 90, queue_name) == []
+    tasks = await repository.fetch_pending_tasks(0, 10, 30, queue_name)
+    assert [task.task['id'] for task in tasks] == [2]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_failed_tasks_retried_after_backoff(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name),
+        TaskRowIn(task={'id': 2}, queue_name=queue_name),
+    ])
+    first, second = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert (first.attempts, second.attempts) == (0, 0)
+
+    await repository.fail_tasks([first.uuid], base_delay_seconds=60, max_delay_seconds=3600)
+    await repository.fail_tasks([second.uuid], base_delay_seconds=0, max_delay_seconds=3600)
+    tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert [(task.task['id'], task.attempts) for task in tasks] == [(2, 1)]
+    assert await repository.fetch_pending_tasks(0, 10, 30, queue_name) == []
+
+    # NOTE: Task not in progress is not failed
+    await repository.fail_tasks([first.uuid], base_delay_seconds=0, max_delay_seconds=3600)
+    assert await repository.fetch_scheduled_tasks(0, 10, queue_name) == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_exhausted_tasks_dead_lettered(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name, max_attempts=1),
+        TaskRowIn(task={'id': 2}, queue_name=queue_name, max_attempts=1),
+        TaskRowIn(task={'id': 3}, queue_name=queue_name, max_attempts=2),
+    ])
+    first, second, third = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+
+    # NOTE: Failed on last attempt
+    await repository.fail_tasks(
+        [first.uuid, third.uuid], base_delay_seconds=0, max_delay_seconds=3600)
+    # NOTE: Crashed on last attempt, so it is dead-lettered when reclaimed
+    tasks = await repository.fetch_tasks(10, queue_name, check_term_seconds=0)
+    assert [(task.task['id'], task.attempts) for task in tasks] == [(3, 1)]
+
+    dead_tasks = await repository.fetch_dead_letter_tasks(0, 10, queue_name)
+    assert [task.task['id'] for task in dead_tasks] == [1, 2]
+    assert [task.attempts for task in dead_tasks] == [1, 1]
+    assert dead_tasks[0].status == TaskStatus.DEAD_LETTER
+    assert [
+        task.task['id'] for task in await repository.fetch_dead_letter_tasks(1, 10, queue_name)
+    ] == [2]
+
+    await repository.delete_tasks([first.uuid])
+    dead_tasks = await repository.fetch_dead_letter_tasks(0, 10, queue_name)
+    assert [task.task['id'] for task in dead_tasks] == [2]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_duplicate_tasks_not_applied(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    first, second, third = await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name, dedup_key='a'),
+        TaskRowIn(task={'id': 2}, queue_name=queue_name, dedup_key='a'),
+        TaskRowIn(task={'id': 3}, queue_name=queue_name, dedup_key='b'),
+    ])
+    assert second.uuid == first.uuid
+    assert third.uuid != first.uuid
+    # NOTE: Key is scoped by queue
+    (other,) = await repository.insert_tasks([
+        TaskRowIn(task={'id': 4}, queue_name=f'{queue_name}_other', dedup_key='a'),
+    ])
+    assert other.uuid != first.uuid
+
+    (duplicate,) = await repository.insert_tasks([
+        TaskRowIn(task={'id': 5}, queue_name=queue_name, dedup_key='a'),
+    ])
+    assert duplicate.uuid == first.uuid
+    assert duplicate.task == {'id': 1}
+    tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert [task.task['id'] for task in tasks] == [1, 3]
+    assert [task.dedup_key for task in tasks] == ['a', 'b']
+
+    # NOTE: Key is released by completion
+    await repository.delete_tasks([first.uuid])
+    (reapplied,) = await repository.insert_tasks([
+        TaskRowIn(task={'id': 6}, queue_name=queue_name, dedup_key='a'),
+    ])
+    assert reapplied.uuid != first.uuid
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_dedup_key_kept_after_completion(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    first, second = await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name, dedup_key='a', dedup_seconds=60),
+        TaskRowIn(task={'id': 2}, queue_name=queue_name, dedup_key='b', dedup_seconds=-1),
+    ])
+    await repository.delete_tasks([first.uuid, second.uuid])
+
+    duplicate, reapplied = await repository.insert_tasks([
+        TaskRowIn(task={'id': 3}, queue_name=queue_name, dedup_key='a'),
+        TaskRowIn(task={'id': 4}, queue_name=queue_name, dedup_key='b'),
+    ])
+    assert (duplicate.uuid, duplicate.status) == (first.uuid, TaskStatus.COMPLETED)
+    assert reapplied.uuid != second.uuid
+    tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert [task.task['id'] for task in tasks] == [4]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_results_kept_until_expired(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    first, second, third = await repository.insert_tasks([
+        TaskRowIn(task={'id': i}, queue_name=queue_name) for i in range(3)
+    ])
+    await repository.insert_results({first.uuid: {'ok': True}, second.uuid: [1]}, ttl_seconds=60)
+    await repository.insert_results({third.uuid: 'expired'}, ttl_seconds=-1)
+    assert await repository.fetch_results([first.uuid, second.uuid, third.uuid]) == {
+        first.uuid: {'ok': True}, second.uuid: [1],
+    }
+
+    # NOTE: Overwritten by completing again
+    await repository.insert_results({first.uuid: {'ok': False}}, ttl_seconds=60)
+    assert await repository.fetch_results([first.uuid]) == {first.uuid: {'ok': False}}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_tasks_cancelled_by_filter(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    parents = await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name),
+        TaskRowIn(task={'id': 2}, queue_name=queue_name),
+        TaskRowIn(task={'id': 3}, queue_name=queue_name, priority=5),
+    ])
+    [child] = await repository.insert_tasks([
+        TaskRowIn(
+            task={'id': 4},
+            queue_name=queue_name,
+            priority=5,
+            depend_on=parents[0].uuid,
+        ),
+    ])
+
+    task_filter = TaskFilter(queue_name=queue_name, max_priority=0)
+    assert await repository.delete_tasks_by_filter(task_filter, chunk_size=1) == 2
+    assert await repository.delete_tasks_by_filter(task_filter, chunk_size=1) == 0
+    # NOTE: Dependents of cancelled tasks are released
+    tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert [task.task['id'] for task in tasks] == [3, 4]
+
+    # NOTE: Tasks in progress are not matched by default
+    task_filter = TaskFilter(queue_name=queue_name)
+    assert await repository.delete_tasks_by_filter(task_filter, chunk_size=1) == 0
+    task_filter = TaskFilter(queue_name=queue_name, statuses=[TaskStatus.WORK_IN_PROGRESS])
+    assert await repository.delete_tasks_by_filter(task_filter, chunk_size=1) == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_tasks_rescheduled_by_filter(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    await repository.insert_tasks([
+        TaskRowIn(task={'id': i}, queue_name=queue_name, scheduled_at=_past(i)) for i in range(3)
+    ])
+    later = int(time.time()) + 60
+
+    task_filter = TaskFilter(queue_name=queue_name, scheduled_to=_past(2))
+    assert await repository.reschedule_tasks_by_filter(task_filter, later, chunk_size=1) == 2
+    assert await repository.reschedule_tasks_by_filter(task_filter, later, chunk_size=1) == 0
+    tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert [task.task['id'] for task in tasks] == [2]
+
+    task_filter = TaskFilter(queue_name=queue_name, scheduled_from=later)
+    assert await repository.reschedule_tasks_by_filter(task_filter, _past(0), chunk_size=1) == 2
+    tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert sorted(task.task['id'] for task in tasks) == [0, 1]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_tasks_reprioritized_by_filter(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    await repository.insert_tasks([
+        TaskRowIn(task={'id': i}, queue_name=queue_name, scheduled_at=_past(i)) for i in range(3)
+    ])
+
+    task_filter = TaskFilter(queue_name=queue_name, scheduled_from=_past(1))
+    assert await repository.reprioritize_tasks_by_filter(task_filter, 10, chunk_size=1) == 2
+    assert await repository.reprioritize_tasks_by_filter(task_filter, 10, chunk_size=1) == 0
+    tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert [(task.task['id'], task.priority) for task in tasks] == [(1, 10), (2, 10), (0, 0)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_queue_stats_counted_by_status(backend, tmp_path):
+    repository = await _repository(backend, tmp_path)
+    queue_name = random_string_lower()
+    parents = await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name, max_attempts=1),
+        TaskRowIn(task={'id': 2}, queue_name=queue_name),
+        TaskRowIn(task={'id': 3}, queue_name=queue_name, priority=5),
+        TaskRowIn(task={'id': 4}, queue_name=queue_name, scheduled_at=int(time.time()) + 60),
+    ])
+    await repository.insert_tasks([
+        TaskRowIn(task={'id': 5}, queue_name=queue_name, depend_on=parents[0].uuid),
+    ])
+    stats = await repository.fetch_queue_stats([queue_name, 'empty'], StatsMode.EXACT)
+    assert (stats[queue_name].waiting, stats[queue_name].in_progress) == (5, 0)
+    # NOTE: Lag is counted from creation time of task (if it is later than scheduled_at)
+    assert 0 < stats[queue_name].lag_seconds < 5
+    assert stats['empty'].waiting == 0 and stats['empty'].lag_seconds == 0
+
+    third, first = await repository.fetch_scheduled_tasks(0, 2, queue_name, lease_seconds=60)
+    await repository.fail_tasks([first.uuid], base_delay_seconds=0, max_delay_seconds=0)
+    stats = await repository.fetch_queue_stats([queue_name], StatsMode.EXACT)
+    assert (stats[queue_name].waiting, stats[queue_name].in_progress) == (3, 1)
+    assert stats[queue_name].dead_letter == 1
+
+    await repository.delete_tasks([third.uuid])
+    stats = await repository.fetch_queue_stats([queue_name], StatsMode.EXACT)
+    assert (stats[queue_name].waiting, stats[queue_name].in_progress) == (3, 0)
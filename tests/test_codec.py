@@ -0,0 +1,56 @@
+import pytest
+
+from jasyncq.repository.codec import (
+    PayloadCodec, Serializer, Compression, codec_tag, parse_codec_tag, orjson,
+)
+
+PAYLOAD = {'id': 1, 'nested': {'list': [1, 2, 3], 'text': 'a' * 2048}}
+
+
+def test_if_codec_tag_round_trip():
+    tag = codec_tag(Serializer.MSGPACK, Compression.ZSTD)
+    assert parse_codec_tag(tag) == (Serializer.MSGPACK, Compression.ZSTD)
+
+
+def test_if_json_payload_round_trip():
+    codec = PayloadCodec()
+    encoded, tag = codec.encode(PAYLOAD)
+    assert tag == 0
+    assert codec.decode(encoded, tag) == PAYLOAD
+
+
+def test_if_legacy_json_text_decoded():
+    assert PayloadCodec().decode(b'{"id": 1}', 0) == {'id': 1}
+
+
+def test_if_compressed_above_threshold():
+    codec = PayloadCodec(compression=Compression.ZLIB, compression_threshold=1024)
+    encoded, tag = codec.encode(PAYLOAD)
+    assert parse_codec_tag(tag) == (Serializer.JSON, Compression.ZLIB)
+    assert len(encoded) < 1024
+    assert codec.decode(encoded, tag) == PAYLOAD
+
+
+def test_if_not_compressed_below_threshold():
+    codec = PayloadCodec(compression=Compression.ZLIB, compression_threshold=1024)
+    encoded, tag = codec.encode({'id': 1})
+    assert parse_codec_tag(tag) == (Serializer.JSON, Compression.NONE)
+
+
+@pytest.mark.skipif(orjson is None, reason='orjson is not installed')
+def test_if_mixed_codec_payloads_decoded():
+    orjson_codec = PayloadCodec(serializer=Serializer.ORJSON, compression=Compression.ZLIB)
+    json_codec = PayloadCodec()
+    encoded, tag = orjson_codec.encode(PAYLOAD)
+    # Decoded by tag, not by codec of repository
+    assert json_codec.decode(encoded, tag) == PAYLOAD
+
+
+def test_if_missing_optional_dependency_raises_import_error():
+    from jasyncq.repository import codec
+    if codec.msgpack is None:
+        with pytest.raises(ImportError, match='msgpack'):
+            PayloadCodec(serializer=Serializer.MSGPACK)
+    if codec.zstandard is None:
+        with pytest.raises(ImportError, match='zstandard'):
+            PayloadCodec(compression=Compression.ZSTD)
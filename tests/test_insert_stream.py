@@ -0,0 +1,108 @@
+import asyncio
+from typing import List, Tuple
+
+import pytest
+
+from jasyncq.repository.codec import PayloadCodec
+from jasyncq.repository.model.task import TaskRowIn, TaskRow, TaskStatus
+from jasyncq.repository.tasks import TaskRepository, _chunk_tasks
+
+
+class FakeInsertRepository(TaskRepository):
+    def __init__(self, fail_at: int = -1):
+        super().__init__(pool=None, topic_name='test_topic')
+        self.inserting = 0
+        self.max_inserting = 0
+        self.inserted = 0
+        self.fail_at = fail_at
+
+    async def _insert_encoded_tasks(
+        self,
+        tasks: List[TaskRowIn],
+        encoded_tasks: List[Tuple[bytes, int]],
+    ) -> List[TaskRow]:
+        self.inserting += 1
+        self.max_inserting = max(self.max_inserting, self.inserting)
+        try:
+            await asyncio.sleep(0.01)
+            if self.inserted == self.fail_at:
+                raise ConnectionError()
+            self.inserted += 1
+        finally:
+            self.inserting -= 1
+        return [
+            TaskRow(
+                uuid=str(task.task['id']),
+                status=TaskStatus.QUEUED,
+                progressed_at=0,
+                scheduled_at=task.scheduled_at,
+                priority=task.priority,
+                task=task.task,
+                queue_name=task.queue_name,
+            )
+            for task in tasks
+        ]
+
+
+def _tasks(count: int, payload_size: int = 0):
+    return (
+        TaskRowIn(task={'id': i, 'payload': 'x' * payload_size}, queue_name='queue')
+        for i in range(count)
+    )
+
+
+@pytest.mark.asyncio
+async def test_if_chunked_by_rows_and_bytes():
+    chunks = [
+        tasks
+        async for tasks, _ in _chunk_tasks(
+            _tasks(10), PayloadCodec(), chunk_size=4, chunk_bytes=1024)
+    ]
+    assert [len(tasks) for tasks in chunks] == [4, 4, 2]
+
+    chunks = [
+        encoded_tasks
+        async for _, encoded_tasks in _chunk_tasks(
+            _tasks(10, payload_size=100), PayloadCodec(), chunk_size=100, chunk_bytes=300)
+    ]
+    assert [len(encoded_tasks) for encoded_tasks in chunks] == [2, 2, 2, 2, 2]
+    assert all(sum(len(data) for data, _ in encoded_tasks) <= 300 for encoded_tasks in chunks)
+
+
+@pytest.mark.asyncio
+async def test_if_oversized_task_inserted_alone():
+    chunks = [
+        tasks
+        async for tasks, _ in _chunk_tasks(
+            _tasks(2, payload_size=100), PayloadCodec(), chunk_size=100, chunk_bytes=10)
+    ]
+    assert [len(tasks) for tasks in chunks] == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_if_stream_inserted_with_bounded_concurrency():
+    async def tasks():
+        for task in _tasks(95):
+            yield task
+
+    repository = FakeInsertRepository()
+    task_ids = [
+        task_id
+        async for chunk in repository.insert_tasks_stream(tasks(), chunk_size=10, concurrency=3)
+        for task_id in chunk
+    ]
+    assert sorted(task_ids, key=int) == [str(i) for i in range(95)]
+    assert repository.max_inserting == 3
+
+
+@pytest.mark.asyncio
+async def test_if_stream_raises_after_failed_chunk():
+    repository = FakeInsertRepository(fail_at=2)
+    task_ids = []
+    with pytest.raises(ConnectionError):
+        async for chunk in repository.insert_tasks_stream(
+            _tasks(100), chunk_size=10, concurrency=2,
+        ):
+            task_ids.extend(chunk)
+    assert len(task_ids) == 20
+    assert repository.inserting == 0
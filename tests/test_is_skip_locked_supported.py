@@ -0,0 +1,29 @@
+from jasyncq.util import is_skip_locked_supported
+
+
+def test_if_mysql_8():
+    assert is_skip_locked_supported('8.0.17')
+
+
+def test_if_mysql_8_0_0():
+    assert not is_skip_locked_supported('8.0.0-dmr')
+
+
+def test_if_mysql_5_7():
+    assert not is_skip_locked_supported('5.7.30-log')
+
+
+def test_if_mariadb_10_6():
+    assert is_skip_locked_supported('10.6.12-MariaDB-1:10.6.12+maria~ubu2004')
+
+
+def test_if_mariadb_10_5():
+    assert not is_skip_locked_supported('5.5.5-10.5.9-MariaDB')
+
+
+def test_if_unknown_version():
+    assert not is_skip_locked_supported('unknown')
+
+
+def test_if_mariadb_10_6_with_replication_prefix():
+    assert is_skip_locked_supported('5.5.5-10.6.12-MariaDB')
@@ -0,0 +1,117 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from jasyncq.metrics import PrometheusInstrumentation, Metric, Instrumentation
+from jasyncq.repository.abstract import PoolRole
+from jasyncq.repository.tasks import TaskRepository
+
+
+class FakePool:
+    def acquire(self):
+        return 'acquire'
+
+
+def test_if_histogram_rendered():
+    instrumentation = PrometheusInstrumentation()
+    instrumentation.observe(Metric.CLAIMED_ROWS, 3, 'topic')
+    instrumentation.observe(Metric.CLAIMED_ROWS, 30, 'topic')
+    rendered = instrumentation.render()
+    assert '# TYPE jasyncq_claimed_rows histogram' in rendered
+    assert 'jasyncq_claimed_rows_bucket{topic="topic",le="5"} 1' in rendered
+    assert 'jasyncq_claimed_rows_bucket{topic="topic",le="50"} 2' in rendered
+    assert 'jasyncq_claimed_rows_bucket{topic="topic",le="+Inf"} 2' in rendered
+    assert 'jasyncq_claimed_rows_sum{topic="topic"} 33' in rendered
+    assert 'jasyncq_claimed_rows_count{topic="topic"} 2' in rendered
+
+
+def test_if_written_to_file(tmp_path):
+    instrumentation = PrometheusInstrumentation()
+    instrumentation.observe(Metric.INSERT_SECONDS, 0.01, 'topic')
+    path = tmp_path / 'jasyncq.prom'
+    instrumentation.write_to_file(str(path))
+    assert path.read_text() == instrumentation.render()
+
+
+@pytest.mark.asyncio
+async def test_if_served_over_http():
+    instrumentation = PrometheusInstrumentation()
+    instrumentation.observe(Metric.DELETE_BATCH_SIZE, 10, 'topic')
+    await instrumentation.serve(port=0)
+    port = instrumentation._server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        response = (await reader.read()).decode()
+        writer.close()
+    finally:
+        await instrumentation.close()
+    assert response.startswith('HTTP/1.1 200 OK')
+    assert response.endswith(instrumentation.render())
+
+
+def test_if_pool_acquired_directly_when_disabled():
+    repository = TaskRepository(pool=FakePool(), topic_name='topic')
+    assert repository.instrumentation.enabled is False
+    assert repository._acquire() == 'acquire'
+    repository = TaskRepository(
+        pool=FakePool(), topic_name='topic', instrumentation=PrometheusInstrumentation())
+    assert repository._acquire() != 'acquire'
+
+
+@pytest.mark.asyncio
+async def test_if_pool_acquire_observed():
+    class FakeAcquiringPool:
+        @asynccontextmanager
+        async def acquire(self):
+            yield 'conn'
+
+    instrumentation = PrometheusInstrumentation()
+    repository = TaskRepository(
+        pool=FakeAcquiringPool(), topic_name='topic', instrumentation=instrumentation)
+    async with repository._acquire() as conn:
+        assert conn == 'conn'
+    assert 'jasyncq_pool_acquire_seconds_count{topic="topic"} 1' in instrumentation.render()
+
+
+@pytest.mark.asyncio
+async def test_if_pinned_connection_acquire_observed_once():
+    class FakePinnedPool:
+        async def acquire(self):
+            return 'conn'
+
+        def release(self, conn):
+            pass
+
+    instrumentation = PrometheusInstrumentation()
+    repository = TaskRepository(
+        pool=FakePinnedPool(), topic_name='topic', instrumentation=instrumentation)
+    async with repository.pin_claim_connection():
+        for _ in range(3):
+            async with repository._acquire(PoolRole.CLAIM) as conn:
+                assert conn == 'conn'
+    assert 'jasyncq_pool_acquire_seconds_count{topic="topic"} 1' in instrumentation.render()
+
+
+def test_if_only_lag_of_first_claim_observed():
+    class RecordingInstrumentation(Instrumentation):
+        enabled = True
+
+        def __init__(self):
+            self.observed = []
+
+        def observe(self, metric: Metric, value: float, topic: str):
+            self.observed.append((metric, value, topic))
+
+    instrumentation = RecordingInstrumentation()
+    repository = TaskRepository(pool=None, topic_name='topic', instrumentation=instrumentation)
+    repository._observe_claim([
+        (b'\x00' * 16, 2, 0, 90, 0, b'{}', 'queue', None, 0),  # QUEUED
+        (b'\x00' * 16, 3, 95, 80, 0, b'{}', 'queue', None, 0),  # WORK_IN_PROGRESS
+    ], elapsed=0.5, current_epoch=100)
+    assert instrumentation.observed == [
+        (Metric.CLAIM_SECONDS, 0.5, 'topic'),
+        (Metric.CLAIMED_ROWS, 2, 'topic'),
+        (Metric.TASK_LAG_SECONDS, 10, 'topic'),
+    ]
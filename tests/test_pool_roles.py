@@ -0,0 +1,89 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from jasyncq.repository.abstract import PoolRole
+from jasyncq.repository.tasks import TaskRepository
+
+
+class FakeConnection:
+    def __init__(self, name: str):
+        self.name = name
+
+
+class FakePool:
+    # NOTE: acquire() of aiomysql pool is both awaitable and async context manager
+    def __init__(self, name: str):
+        self.name = name
+        self.acquired = 0
+        self.released: List[FakeConnection] = []
+
+    async def _acquire(self) -> FakeConnection:
+        self.acquired += 1
+        return FakeConnection(f'{self.name}-{self.acquired}')
+
+    def acquire(self):
+        pool = self
+
+        class _Acquire:
+            def __await__(self):
+                return pool._acquire().__await__()
+
+            async def __aenter__(self):
+                self.conn = await pool._acquire()
+                return self.conn
+
+            async def __aexit__(self, *_):
+                pool.release(self.conn)
+
+        return _Acquire()
+
+    def release(self, conn: FakeConnection):
+        self.released.append(conn)
+
+
+@pytest.mark.asyncio
+async def test_if_connections_acquired_from_pool_of_role():
+    pool, claim_pool, read_pool = FakePool('write'), FakePool('claim'), FakePool('read')
+    repository = TaskRepository(pool=pool, claim_pool=claim_pool, read_pool=read_pool)
+    for role, name in [
+        (PoolRole.WRITE, 'write'), (PoolRole.CLAIM, 'claim'), (PoolRole.READ, 'read'),
+    ]:
+        async with repository._acquire(role) as conn:
+            assert conn.name == f'{name}-1'
+
+    # NOTE: Pools of roles fall back to (write) pool
+    repository = TaskRepository(pool=pool)
+    async with repository._acquire(PoolRole.READ) as conn:
+        assert conn.name == 'write-2'
+
+
+@pytest.mark.asyncio
+async def test_if_claims_use_pinned_connection():
+    pool, claim_pool = FakePool('write'), FakePool('claim')
+    repository = TaskRepository(pool=pool, claim_pool=claim_pool)
+    async with repository.pin_claim_connection():
+        async with repository._acquire(PoolRole.CLAIM) as first:
+            pass
+
+        async def claim_in_task():
+            async with repository._acquire(PoolRole.CLAIM) as conn:
+                return conn
+
+        assert await asyncio.ensure_future(claim_in_task()) is first
+        async with repository._acquire(PoolRole.WRITE) as conn:
+            assert conn.name == 'write-1'
+        assert claim_pool.acquired == 1 and claim_pool.released == []
+
+        # NOTE: Connection failed in use is released and replaced on next use
+        with pytest.raises(ValueError):
+            async with repository._acquire(PoolRole.CLAIM):
+                raise ValueError()
+        assert claim_pool.released == [first]
+        async with repository._acquire(PoolRole.CLAIM) as conn:
+            assert conn.name == 'claim-2'
+    assert claim_pool.released == [first, conn]
+
+    async with repository._acquire(PoolRole.CLAIM) as conn:
+        assert conn.name == 'claim-3'
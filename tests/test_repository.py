@@ -1,13 +1,19 @@
 import asyncio
 import json
+import time
 from typing import Tuple, Any, Dict
+from uuid import UUID, uuid4
 
 import aiomysql
 import pytest
 from aiomysql import Pool, Connection, Cursor
+from jasyncq.repository.model.stats import StatsMode
 from jasyncq.repository.model.task import TaskRowIn, TaskRow, TaskStatus
 
-from jasyncq.repository.tasks import TaskRepository
+from jasyncq.repository.schema import count_table_name
+from jasyncq.repository.sharded import ShardedTaskRepository
+from jasyncq.repository.tasks import TaskRepository, ClaimMode, FetchFilter
+from jasyncq.util import let_if
 
 from tests.util import random_string_lower
 
@@ -63,19 +69,19 @@ async def test_insert_tasks():
         inserted_tasks_by_uuid[inserted_task.uuid] = inserted_task
 
     columns = ['uuid', 'status', 'progressed_at', 'scheduled_at',
-               'is_urgent', 'task', 'queue_name', 'depend_on']
+               'priority', 'task', 'queue_name', 'depend_on']
     fetching_query = f'SELECT {",".join(columns)} FROM jasyncq_{test_topic_name}'
     task_rows = await _query(pool, fetching_query)
 
     for task_row in task_rows:
-        uuid = task_row[0]
+        uuid = str(UUID(bytes=task_row[0]))
         status = task_row[1]
         progressed_at = task_row[2]
         scheduled_at = task_row[3]
-        is_urgent = task_row[4]
+        priority = task_row[4]
         task = task_row[5]
         queue_name = task_row[6]
-        depend_on = task_row[7]
+        depend_on = let_if(task_row[7], lambda value: str(UUID(bytes=value)))
 
         assert uuid in inserted_tasks_by_uuid
         assert inserted_tasks_by_uuid[uuid].status == status
@@ -83,7 +89,7 @@ async def test_insert_tasks():
         assert inserted_tasks_by_uuid[uuid].progressed_at == progressed_at
         assert inserted_tasks_by_uuid[uuid].progressed_at == 0
         assert inserted_tasks_by_uuid[uuid].scheduled_at == scheduled_at
-        assert inserted_tasks_by_uuid[uuid].is_urgent == is_urgent
+        assert inserted_tasks_by_uuid[uuid].priority == priority
         assert inserted_tasks_by_uuid[uuid].task == json.loads(task)
         assert inserted_tasks_by_uuid[uuid].queue_name == queue_name
         assert inserted_tasks_by_uuid[uuid].depend_on == depend_on
@@ -130,7 +136,7 @@ async def test_if_fetch_scheduled_tasks_updating_status_to_WIP_with_fetching():
     task_rows = await _query(pool, fetching_query)
 
     for task_row in task_rows:
-        uuid = task_row[0]
+        uuid = str(UUID(bytes=task_row[0]))
         status = task_row[1]
         progressed_at = task_row[2]
         assert uuid in inserted_tasks_by_uuid
@@ -187,7 +193,7 @@ async def test_if_pending_tasks_updating_fetches_progressed_at_waiting_time_over
     task_rows = await _query(pool, fetching_query)
 
     for task_row in task_rows:
-        uuid = task_row[0]
+        uuid = str(UUID(bytes=task_row[0]))
         status = task_row[1]
         progressed_at = task_row[2]
         assert uuid in scheduled_tasks_by_uuid
@@ -261,3 +267,506 @@ async def test_if_pending_tasks_fetches_tasks_with_dependency_with_ignore_option
     # Fetch tasks without dependency at once
     assert len(scheduled_tasks) == 2
     assert {genesis_task.uuid, dependent_task.uuid} == set([task.uuid for task in scheduled_tasks])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('autocommit', [False, True])
+async def test_if_concurrent_skip_locked_claims_do_not_overlap(autocommit: bool):
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=autocommit,
+    )
+    test_topic_name = random_string_lower()
+    repository = TaskRepository(
+        pool=pool, topic_name=test_topic_name, claim_mode=ClaimMode.SKIP_LOCKED)
+    await repository.initialize()
+
+    queue_name = random_string_lower()
+    inserted_tasks = await repository.insert_tasks([
+        TaskRowIn(task={'id': i}, queue_name=queue_name)
+        for i in range(50)
+    ])
+    claimed_tasks_by_worker = await asyncio.gather(*[
+        repository.fetch_scheduled_tasks(0, 10, queue_name, ignore_dependency=True)
+        for _ in range(5)
+    ])
+    claimed_uuids = [task.uuid for tasks in claimed_tasks_by_worker for task in tasks]
+    # Each task is handed to exactly one worker
+    assert len(claimed_uuids) == len(set(claimed_uuids))
+    assert set(claimed_uuids) <= {task.uuid for task in inserted_tasks}
+
+
+@pytest.mark.asyncio
+async def test_if_failed_lock_tables_claim_unlocks_and_rolls_back(monkeypatch):
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+        maxsize=1,
+    )
+    test_topic_name = random_string_lower()
+    repository = TaskRepository(
+        pool=pool, topic_name=test_topic_name, claim_mode=ClaimMode.LOCK_TABLES)
+    await repository.initialize()
+
+    queue_name = random_string_lower()
+    await repository.insert_tasks([TaskRowIn(task={}, queue_name=queue_name)])
+
+    def _check_claimed(updated, uuids):
+        raise RuntimeError('Claim failed')
+
+    monkeypatch.setattr('jasyncq.repository.tasks._check_claimed', _check_claimed)
+    with pytest.raises(RuntimeError):
+        await repository.fetch_scheduled_tasks(0, 10, queue_name, ignore_dependency=True)
+    monkeypatch.undo()
+
+    # Same (only) connection is not left locked, and update of failed claim is not committed
+    tasks = await asyncio.wait_for(
+        repository.fetch_scheduled_tasks(0, 10, queue_name, ignore_dependency=True), timeout=5)
+    assert len(tasks) == 1
+
+
+@pytest.mark.asyncio
+async def test_if_initialize_migrates_unversioned_table():
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+    )
+    test_topic_name = random_string_lower()
+    await _query(
+        pool,
+        f'CREATE TABLE jasyncq_{test_topic_name} ('
+        '  uuid VARCHAR(36) NOT NULL,'
+        '  status TINYINT NOT NULL,'
+        '  progressed_at BIGINT NOT NULL,'
+        '  scheduled_at BIGINT NOT NULL,'
+        '  is_urgent BOOL NOT NULL DEFAULT false,'
+        '  task TEXT NOT NULL,'
+        '  queue_name VARCHAR(255) NOT NULL,'
+        '  depend_on VARCHAR(36) DEFAULT NULL,'
+        'INDEX idx__uuid (uuid),'
+        'INDEX idx__status (status),'
+        'INDEX idx__progressed_at (progressed_at),'
+        'INDEX idx__scheduled_at (scheduled_at),'
+        'INDEX idx__is_urgent (is_urgent),'
+        'INDEX idx__queue_name (queue_name),'
+        'INDEX idx__depend_on (depend_on)'
+        ');',
+    )
+    queue_name = random_string_lower()
+    await _query(
+        pool,
+        f'INSERT INTO jasyncq_{test_topic_name} '
+        f"VALUES ('7f1cbd3a-8f0b-4f0e-9a77-0d4c1e0c8e11', 2, 0, 0, true, '{{}}', "
+        f"'{queue_name}', NULL)",
+    )
+    repository = TaskRepository(pool=pool, topic_name=test_topic_name)
+    await repository.initialize()
+    await repository.initialize()  # Migrating twice should be no-op
+
+    rows = await _query(pool, f'SHOW INDEX FROM jasyncq_{test_topic_name}')
+    index_names = {row[2] for row in rows}
+    assert index_names == {'PRIMARY', 'idx__claim', 'idx__pending'}
+
+    scheduled_tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert len(scheduled_tasks) == 1
+    assert scheduled_tasks[0].is_urgent
+
+
+@pytest.mark.asyncio
+async def test_if_task_ids_are_time_ordered():
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+    )
+    test_topic_name = random_string_lower()
+    repository = TaskRepository(pool=pool, topic_name=test_topic_name)
+    await repository.initialize()
+
+    queue_name = random_string_lower()
+    first_tasks = await repository.insert_tasks([TaskRowIn(task={'id': 1}, queue_name=queue_name)])
+    await asyncio.sleep(0.01)
+    second_tasks = await repository.insert_tasks([TaskRowIn(task={'id': 2}, queue_name=queue_name)])
+
+    task_rows = await _query(pool, f'SELECT uuid FROM jasyncq_{test_topic_name} ORDER BY uuid')
+    assert [str(UUID(bytes=task_row[0])) for task_row in task_rows] == [
+        first_tasks[0].uuid, second_tasks[0].uuid,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_if_insert_tasks_bumps_queue_version():
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+    )
+    test_topic_name = random_string_lower()
+    repository = TaskRepository(pool=pool, topic_name=test_topic_name)
+    await repository.initialize()
+
+    queue_name = random_string_lower()
+    other_queue_name = random_string_lower()
+    versions = await repository.fetch_queue_versions([queue_name, other_queue_name])
+    assert versions == {queue_name: 0, other_queue_name: 0}
+
+    await repository.insert_tasks([TaskRowIn(task={'id': 1}, queue_name=queue_name)])
+    await repository.insert_tasks([TaskRowIn(task={'id': 2}, queue_name=queue_name)])
+    versions = await repository.fetch_queue_versions([queue_name, other_queue_name])
+    assert versions == {queue_name: 2, other_queue_name: 0}
+
+
+@pytest.mark.asyncio
+async def test_if_fetch_tasks_claims_pending_and_scheduled_tasks_at_once():
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+    )
+    test_topic_name = random_string_lower()
+    repository = TaskRepository(pool=pool, topic_name=test_topic_name)
+    await repository.initialize()
+
+    queue_name = random_string_lower()
+    await repository.insert_tasks([
+        TaskRowIn(task={'id': i}, queue_name=queue_name)
+        for i in range(4)
+    ])
+    wip_tasks = await repository.fetch_scheduled_tasks(0, 2, queue_name)
+
+    await asyncio.sleep(1)  # TODO(pjongy): Mock time in repository
+    tasks = await repository.fetch_tasks(3, queue_name, check_term_seconds=1)
+    assert len(tasks) == 3
+    # Pending tasks take precedence over scheduled tasks
+    assert {task.uuid for task in tasks[:2]} == {task.uuid for task in wip_tasks}
+    assert all(task.status == TaskStatus.WORK_IN_PROGRESS for task in tasks[:2])
+    assert tasks[2].status == TaskStatus.QUEUED
+
+    tasks = await repository.fetch_tasks(3, queue_name, check_term_seconds=60)
+    assert len(tasks) == 1
+
+
+@pytest.mark.asyncio
+async def test_if_task_with_several_parents_fetched_after_all_parents_completed():
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+    )
+    test_topic_name = random_string_lower()
+    repository = TaskRepository(pool=pool, topic_name=test_topic_name)
+    await repository.initialize()
+
+    queue_name = random_string_lower()
+    parents = await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name),
+        TaskRowIn(task={'id': 2}, queue_name=queue_name),
+    ])
+    children = await repository.insert_tasks([
+        TaskRowIn(
+            task={'id': 3},
+            queue_name=queue_name,
+            dependencies=[parent.uuid for parent in parents],
+        ),
+    ])
+    assert children[0].status == TaskStatus.DEFERRED
+
+    scheduled_tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert {task.uuid for task in scheduled_tasks} == {parent.uuid for parent in parents}
+
+    await repository.delete_tasks([parents[0].uuid])
+    # Not fetched because one of parents is not completed yet
+    assert await repository.fetch_scheduled_tasks(0, 10, queue_name) == []
+
+    await repository.delete_tasks([parents[1].uuid])
+    scheduled_tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert [task.uuid for task in scheduled_tasks] == [children[0].uuid]
+
+
+@pytest.mark.asyncio
+async def test_if_task_depending_on_completed_task_is_queued():
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+    )
+    test_topic_name = random_string_lower()
+    repository = TaskRepository(pool=pool, topic_name=test_topic_name)
+    await repository.initialize()
+
+    queue_name = random_string_lower()
+    parents = await repository.insert_tasks([TaskRowIn(task={'id': 1}, queue_name=queue_name)])
+    await repository.delete_tasks([parents[0].uuid])
+    children = await repository.insert_tasks([
+        TaskRowIn(task={'id': 2}, queue_name=queue_name, depend_on=parents[0].uuid),
+    ])
+    assert children[0].status == TaskStatus.QUEUED
+
+
+@pytest.mark.asyncio
+async def test_if_tasks_stream_inserted_by_chunk():
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+    )
+    test_topic_name = random_string_lower()
+    repository = TaskRepository(pool=pool, topic_name=test_topic_name)
+    await repository.initialize()
+
+    queue_name = random_string_lower()
+    tasks = (TaskRowIn(task={'id': i}, queue_name=queue_name) for i in range(25))
+    chunks = [
+        task_ids
+        async for task_ids in repository.insert_tasks_stream(tasks, chunk_size=10, concurrency=2)
+    ]
+    assert sorted(len(task_ids) for task_ids in chunks) == [5, 10, 10]
+
+    scheduled_tasks = await repository.fetch_scheduled_tasks(0, 100, queue_name)
+    assert {task.uuid for task in scheduled_tasks} == {
+        task_id for task_ids in chunks for task_id in task_ids
+    }
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('claim_mode', [ClaimMode.LOCK_TABLES, ClaimMode.SKIP_LOCKED])
+async def test_if_tasks_fetched_from_queues_by_weights(claim_mode: ClaimMode):
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+    )
+    test_topic_name = random_string_lower()
+    repository = TaskRepository(pool=pool, topic_name=test_topic_name, claim_mode=claim_mode)
+    await repository.initialize()
+
+    hot_queue_name = random_string_lower()
+    cold_queue_name = random_string_lower()
+    await repository.insert_tasks([
+        *[TaskRowIn(task={'id': i}, queue_name=hot_queue_name) for i in range(20)],
+        *[TaskRowIn(task={'id': i}, queue_name=cold_queue_name) for i in range(2)],
+    ])
+
+    tasks = await repository.fetch_tasks_from_queues(
+        {hot_queue_name: 3, cold_queue_name: 1}, limit=8, check_term_seconds=30)
+    assert len([task for task in tasks if task.queue_name == hot_queue_name]) == 6
+    assert len([task for task in tasks if task.queue_name == cold_queue_name]) == 2
+    assert all(task.status == TaskStatus.QUEUED for task in tasks)
+
+    tasks = await repository.fetch_tasks_from_queues(
+        {hot_queue_name: 3, cold_queue_name: 1}, limit=8, check_term_seconds=30)
+    # Share of cold queue is not redistributed within a claim
+    assert len(tasks) == 6
+
+
+@pytest.mark.asyncio
+async def test_if_tasks_fetched_by_priority_and_fifo():
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+    )
+    test_topic_name = random_string_lower()
+    repository = TaskRepository(pool=pool, topic_name=test_topic_name)
+    await repository.initialize()
+
+    queue_name = random_string_lower()
+    inserted_tasks = await repository.insert_tasks([
+        TaskRowIn(task={'id': 1}, queue_name=queue_name),
+        TaskRowIn(task={'id': 2}, queue_name=queue_name, priority=5),
+        TaskRowIn(task={'id': 3}, queue_name=queue_name, is_urgent=True),
+        TaskRowIn(task={'id': 4}, queue_name=queue_name),
+        TaskRowIn(task={'id': 5}, queue_name=queue_name, priority=5),
+    ])
+    assert [task.priority for task in inserted_tasks] == [0, 5, 1, 0, 5]
+
+    scheduled_tasks = await repository.fetch_scheduled_tasks(0, 10, queue_name)
+    assert [task.task['id'] for task in scheduled_tasks] == [2, 5, 3, 1, 4]
+
+
+@pytest.mark.asyncio
+async def test_if_claim_reads_index_in_order():
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+    )
+    test_topic_name = random_string_lower()
+    repository = TaskRepository(pool=pool, topic_name=test_topic_name)
+    await repository.initialize()
+
+    # NOTE: Claim of several statuses is UNION ALL of part per status, each read in order
+    for fetch_filter, index_name in [
+        (FetchFilter.SCHEDULED, 'idx__claim'),
+        (FetchFilter.PENDING, 'idx__pending'),
+    ]:
+        for ignore_dependency in [False, True]:
+            async with pool.acquire() as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cur:
+                    await cur.execute('EXPLAIN ' + repository._claim_statement(
+                        fetch_filter, ignore_dependency,
+                    ).replace('%s', '0'))
+                    rows = await cur.fetchall()
+            parts = repository._claim_statuses(fetch_filter, ignore_dependency)
+            keys = [row['key'] for row in rows if row['select_type'] != 'UNION RESULT']
+            assert keys == [index_name] * len(parts)
+            assert 'filesort' not in str(rows)
+
+
+@pytest.mark.asyncio
+async def test_if_pending_claim_reads_pending_index():
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+    )
+    test_topic_name = random_string_lower()
+    repository = TaskRepository(pool=pool, topic_name=test_topic_name)
+    await repository.initialize()
+
+    # NOTE: Unexpired in-flight tasks are skipped within idx__pending (see schema.py)
+    for ignore_dependency in [False, True]:
+        async with pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute('EXPLAIN ' + repository._claim_statement(
+                    FetchFilter.PENDING, ignore_dependency,
+                ).replace('%s', '0'))
+                rows = await cur.fetchall()
+        assert [row['key'] for row in rows] == ['idx__pending']
+        assert 'filesort' not in (rows[0]['Extra'] or '')
+
+
+@pytest.mark.asyncio
+async def test_if_sharded_over_tables():
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+    )
+    test_topic_name = random_string_lower()
+    repository = ShardedTaskRepository.for_tables(pool, test_topic_name, shard_count=2)
+    await repository.initialize()
+    rows = await _query(pool, 'SHOW TABLES')
+    tables = [row[0] for row in rows]
+    assert f'jasyncq_{test_topic_name}__0' in tables
+    assert f'jasyncq_{test_topic_name}__1' in tables
+
+    queue_name = random_string_lower()
+    [parent, *_] = await repository.insert_tasks([
+        TaskRowIn(task={'id': i}, queue_name=queue_name) for i in range(4)
+    ])
+    [child] = await repository.insert_tasks([
+        TaskRowIn(task={'id': 4}, queue_name=queue_name, depend_on=parent.uuid),
+    ])
+    assert child.status == TaskStatus.DEFERRED
+
+    tasks = await repository.fetch_tasks(10, queue_name, check_term_seconds=30)
+    assert sorted(task.task['id'] for task in tasks) == [0, 1, 2, 3]
+    await repository.delete_tasks([task.uuid for task in tasks])
+    tasks = await repository.fetch_tasks(10, queue_name, check_term_seconds=30)
+    assert [task.uuid for task in tasks] == [child.uuid]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('claim_mode', [ClaimMode.LOCK_TABLES, ClaimMode.SKIP_LOCKED])
+async def test_if_queue_counters_follow_tasks(claim_mode: ClaimMode):
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+    )
+    repository = TaskRepository(
+        pool=pool, topic_name=random_string_lower(), claim_mode=claim_mode, count_tasks=True)
+    await repository.initialize()
+    queue_name = random_string_lower()
+
+    async def counts():
+        exact, approximate = [
+            (await repository.fetch_queue_stats([queue_name], mode))[queue_name]
+            for mode in (StatsMode.EXACT, StatsMode.APPROXIMATE)
+        ]
+        exact = exact.waiting, exact.in_progress, exact.dead_letter
+        assert (approximate.waiting, approximate.in_progress, approximate.dead_letter) == exact
+        return exact
+
+    [parent, *_] = await repository.insert_tasks([
+        TaskRowIn(task={'id': i}, queue_name=queue_name, max_attempts=1) for i in range(3)
+    ])
+    await repository.insert_tasks([
+        TaskRowIn(task={'id': 3}, queue_name=queue_name, depend_on=parent.uuid, dedup_key='a'),
+        TaskRowIn(task={'id': 4}, queue_name=queue_name, dedup_key='a'),
+    ])
+    assert await counts() == (4, 0, 0)
+    tasks = await repository.fetch_scheduled_tasks(0, 3, queue_name)
+    assert await counts() == (1, 3, 0)
+    await repository.fail_tasks([tasks[0].uuid], base_delay_seconds=0, max_delay_seconds=0)
+    await repository.delete_tasks([tasks[1].uuid])
+    assert await counts() == (1, 1, 1)
+    # NOTE: Crashed on last attempt, so it is dead-lettered when reclaimed
+    assert await repository.fetch_pending_tasks(0, 10, -1, queue_name) == []
+    assert await counts() == (1, 0, 2)
+
+    await _query(pool, f'DELETE FROM {count_table_name(repository.table_name)}')
+    assert (await repository.fetch_queue_stats([queue_name], StatsMode.APPROXIMATE))[
+        queue_name].waiting == 0
+    await repository.recount_queues([queue_name])
+    assert await counts() == (1, 0, 2)
+
+
+@pytest.mark.asyncio
+async def test_if_approximate_stats_counted_exactly_without_counters(caplog):
+    pool: Pool = await aiomysql.create_pool(
+        host='127.0.0.1',
+        port=3306,
+        user='root',
+        db='test',
+        autocommit=False,
+    )
+    # NOTE: Lag of UUIDv4 task is counted from its scheduled_at
+    repository = TaskRepository(
+        pool=pool, topic_name=random_string_lower(), task_id_factory=uuid4)
+    await repository.initialize()
+    queue_names = [random_string_lower() for _ in range(3)]
+    await repository.insert_tasks([
+        TaskRowIn(task={'id': i}, queue_name=queue_name, scheduled_at=int(time.time()) - 60)
+        for i, queue_name in enumerate(queue_names[:2])
+    ])
+
+    stats = await repository.fetch_queue_stats(queue_names, StatsMode.APPROXIMATE)
+    assert [stats[queue_name].waiting for queue_name in queue_names] == [1, 1, 0]
+    assert 'counted exactly without count_tasks' in caplog.text
+    assert [round(stats[queue_name].lag_seconds, -1) for queue_name in queue_names] == [
+        60, 60, 0]
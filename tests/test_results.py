@@ -0,0 +1,79 @@
+import asyncio
+import uuid
+from typing import List, Dict, Any
+
+import pytest
+
+from jasyncq import results
+from jasyncq.dispatcher.model.task import TaskIn
+from jasyncq.dispatcher.tasks import TasksDispatcher
+from jasyncq.repository.memory import MemoryTaskRepository
+
+from tests.util import random_string_lower
+
+
+class FakeResults:
+    def __init__(self):
+        self.results: Dict[str, Any] = {}
+        self.calls: List[List[str]] = []
+
+    async def fetch(self, task_ids: List[str]) -> Dict[str, Any]:
+        self.calls.append(sorted(task_ids))
+        return {task_id: self.results[task_id] for task_id in task_ids if task_id in self.results}
+
+
+@pytest.mark.asyncio
+async def test_if_outstanding_results_polled_together():
+    fake = FakeResults()
+    table_name = random_string_lower()
+    waiting = [
+        asyncio.ensure_future(results.wait(table_name, [task_id], fake.fetch, 1, 0.02))
+        for task_id in ['a', 'b']
+    ]
+    await asyncio.sleep(0.01)
+    fake.results.update({'a': 1, 'b': {'ok': True}})
+    assert await asyncio.gather(*waiting) == [{'a': 1}, {'b': {'ok': True}}]
+    assert fake.calls[0] == ['a', 'b']
+    assert all(call == ['a', 'b'] for call in fake.calls)
+
+
+@pytest.mark.asyncio
+async def test_if_notified_in_process():
+    fake = FakeResults()
+    table_name = random_string_lower()
+    waiting = asyncio.ensure_future(results.wait(table_name, ['a', 'b'], fake.fetch, 1, 10))
+    await asyncio.sleep(0.01)
+    results.notify(table_name, {'a': None, 'b': 2})
+    assert await waiting == {'a': None, 'b': 2}
+    assert len(fake.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_if_not_completed_results_omitted():
+    fake = FakeResults()
+    fake.results['a'] = 1
+    table_name = random_string_lower()
+    assert await results.wait(table_name, ['a', 'b'], fake.fetch, 0.05, 0.01) == {'a': 1}
+    await asyncio.sleep(0.03)
+    calls = len(fake.calls)
+    await asyncio.sleep(0.03)
+    assert len(fake.calls) == calls  # NOTE: Polling stops without waiters
+
+
+@pytest.mark.asyncio
+async def test_if_dispatcher_awaits_results_of_completed_tasks():
+    repository = MemoryTaskRepository(topic_name=random_string_lower())
+    dispatcher = TasksDispatcher(repository)
+    producer = TasksDispatcher(repository)
+    first, second = await producer.apply_tasks([TaskIn(task={}), TaskIn(task={})])
+
+    waiting = asyncio.ensure_future(
+        producer.await_results([first.uuid, second.uuid, uuid.uuid4()], timeout=0.1))
+    await asyncio.sleep(0.01)
+    await dispatcher.complete_tasks(
+        [str(first.uuid), str(second.uuid)],
+        results={str(first.uuid): {'value': 1}, str(second.uuid): [2]},
+    )
+    assert await waiting == {first.uuid: {'value': 1}, second.uuid: [2]}
+    # NOTE: Stored for later callers
+    assert await producer.await_results([first.uuid], timeout=0.1) == {first.uuid: {'value': 1}}
@@ -0,0 +1,27 @@
+from jasyncq.repository.schema import (
+    SCHEMA_VERSION, migration_queries, parse_schema_version, schema_comment,
+)
+
+
+def test_if_table_comment_empty():
+    assert parse_schema_version('') == 1
+
+
+def test_if_table_comment_versioned():
+    assert parse_schema_version(schema_comment(SCHEMA_VERSION)) == SCHEMA_VERSION
+
+
+def test_if_table_not_exists():
+    queries = migration_queries('jasyncq_test', None)
+    assert all(query.startswith('CREATE TABLE IF NOT EXISTS jasyncq_test') for query in queries)
+    assert schema_comment(SCHEMA_VERSION) in queries[-1]
+
+
+def test_if_table_up_to_date():
+    assert migration_queries('jasyncq_test', SCHEMA_VERSION) == []
+
+
+def test_if_table_outdated():
+    queries = migration_queries('jasyncq_test', 1)
+    assert queries
+    assert schema_comment(SCHEMA_VERSION) in queries[-1]
@@ -0,0 +1,200 @@
+import asyncio
+from uuid import UUID
+
+import pytest
+
+from jasyncq.dispatcher.model.task import TaskIn
+from jasyncq.dispatcher.tasks import TasksDispatcher
+from jasyncq.repository.memory import MemoryTaskRepository
+from jasyncq.repository.model.task import TaskRowIn, TaskStatus
+from jasyncq.repository.sharded import ShardedTaskRepository, ShardClaim, shard_of
+from jasyncq.repository.sqlite import SQLiteTaskRepository
+
+from tests.util import random_string_lower
+
+
+def _repository(shard_count: int = 3, **kwargs) -> ShardedTaskRepository:
+    topic_name = random_string_lower()
+    return ShardedTaskRepository(
+        shards=[
+            MemoryTaskRepository(topic_name=f'{topic_name}__{index}')
+            for index in range(shard_count)
+        ],
+        topic_name=topic_name,
+        **kwargs,
+    )
+
+
+@pytest.mark.asyncio
+async def test_if_tasks_spread_over_shards():
+    repository = _repository()
+    tasks = await repository.insert_tasks([
+        TaskRowIn(task={'id': i}, queue_name='QUEUE') for i in range(9)
+    ])
+    assert [task.task['id'] for task in tasks] == list(range(9))
+    assert sorted(shard_of(task.uuid) for task in tasks) == [0, 0, 0, 1, 1, 1, 2, 2, 2]
+    for index, shard in enumerate(repository.shards):
+        claimed = await shard.fetch_scheduled_tasks(0, 10, 'QUEUE')
+        assert {shard_of(task.uuid) for task in claimed} == {index}
+
+
+@pytest.mark.asyncio
+async def test_if_given_shards_not_changed():
+    shards = [MemoryTaskRepository(topic_name=random_string_lower()) for _ in range(3)]
+    task_id_factories = [shard.task_id_factory for shard in shards]
+    repository = ShardedTaskRepository(shards=shards)
+    rewrapped = ShardedTaskRepository(shards=list(reversed(repository.shards)))
+    assert [shard.task_id_factory for shard in shards] == task_id_factories
+
+    tasks = await rewrapped.insert_tasks([
+        TaskRowIn(task={'id': i}, queue_name='QUEUE') for i in range(3)
+    ])
+    assert sorted(shard_of(task.uuid) for task in tasks) == [0, 1, 2]
+    assert all(UUID(task.uuid).version == 7 for task in tasks)
+
+
+@pytest.mark.asyncio
+async def test_if_tasks_routed_by_key():
+    repository = _repository(routing_key=lambda task: task.task['user'])
+    tasks = await repository.insert_tasks([
+        TaskRowIn(task={'user': i % 2}, queue_name='QUEUE') for i in range(10)
+    ])
+    assert len({shard_of(task.uuid) for task in tasks if task.task['user'] == 0}) == 1
+    assert len({shard_of(task.uuid) for task in tasks if task.task['user'] == 1}) == 1
+
+
+@pytest.mark.asyncio
+async def test_if_duplicates_routed_to_same_shard():
+    repository = _repository(max_claim_shards=3)
+    tasks = await repository.insert_tasks([
+        TaskRowIn(task={}, queue_name='QUEUE', dedup_key=str(i % 2)) for i in range(6)
+    ])
+    assert len({task.uuid for task in tasks}) == 2
+    assert len(await repository.fetch_scheduled_tasks(0, 10, 'QUEUE')) == 2
+
+    with pytest.raises(ValueError):
+        await repository.insert_tasks([
+            TaskRowIn(task={}, queue_name='QUEUE', dedup_key='0', depend_on=tasks[0].uuid),
+        ])
+
+
+@pytest.mark.asyncio
+async def test_if_child_routed_to_shard_of_parent():
+    repository = _repository(max_claim_shards=3)
+    parents = await repository.insert_tasks([
+        TaskRowIn(task={}, queue_name='QUEUE') for _ in range(3)
+    ])
+    children = await repository.insert_tasks([
+        TaskRowIn(task={}, queue_name='QUEUE', depend_on=parent.uuid) for parent in parents
+    ])
+    assert [shard_of(child.uuid) for child in children] == [
+        shard_of(parent.uuid) for parent in parents]
+    assert all(child.status == TaskStatus.DEFERRED for child in children)
+    with pytest.raises(ValueError):
+        await repository.insert_tasks([
+            TaskRowIn(task={}, queue_name='QUEUE', dependencies=[parents[0].uuid, parents[1].uuid]),
+        ])
+
+    await repository.delete_tasks([parent.uuid for parent in parents])
+    tasks = await repository.fetch_scheduled_tasks(0, 10, 'QUEUE')
+    assert {task.uuid for task in tasks} == {child.uuid for child in children}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('shard_claim', list(ShardClaim))
+async def test_if_claimed_from_all_shards(shard_claim):
+    repository = _repository(shard_claim=shard_claim, max_claim_shards=3)
+    await repository.insert_tasks([TaskRowIn(task={}, queue_name='QUEUE') for _ in range(9)])
+
+    tasks = await repository.fetch_tasks(6, 'QUEUE', check_term_seconds=30)
+    assert len(tasks) == 6
+    if shard_claim == ShardClaim.PARALLEL:
+        assert sorted(shard_of(task.uuid) for task in tasks) == [0, 0, 1, 1, 2, 2]
+    tasks += await repository.fetch_tasks(6, 'QUEUE', check_term_seconds=30)
+    assert len({task.uuid for task in tasks}) == 9
+
+    await repository.extend_leases([task.uuid for task in tasks], lease_seconds=-60)
+    tasks = await repository.fetch_tasks_from_queues(
+        {'QUEUE': 1}, limit=20, check_term_seconds=30)
+    assert len(tasks) == 9
+
+
+@pytest.mark.asyncio
+async def test_if_rotation_claim_probes_limited_shards():
+    repository = _repository(shard_count=5)
+    claimed_shards = []
+    for index, shard in enumerate(repository.shards):
+        fetch_tasks = shard.fetch_tasks
+
+        async def _fetch_tasks(*args, index=index, fetch_tasks=fetch_tasks, **kwargs):
+            claimed_shards.append(index)
+            return await fetch_tasks(*args, **kwargs)
+
+        shard.fetch_tasks = _fetch_tasks
+
+    for _ in range(3):
+        assert await repository.fetch_tasks(10, 'QUEUE', check_term_seconds=30) == []
+    assert claimed_shards == [0, 1, 2, 3, 4, 0]
+
+    await repository.shards[4].insert_tasks([TaskRowIn(task={}, queue_name='QUEUE')])
+    tasks = []
+    for _ in range(3):
+        tasks += await repository.fetch_tasks(10, 'QUEUE', check_term_seconds=30)
+    assert len(tasks) == 1
+    with pytest.raises(ValueError):
+        _repository(max_claim_shards=0)
+
+
+@pytest.mark.asyncio
+async def test_if_dispatcher_woken_up_by_sharded_topic():
+    repository = _repository()
+    dispatcher = TasksDispatcher(repository=repository)
+    snapshot = await dispatcher.snapshot_queues(['QUEUE'])
+    waiting = asyncio.ensure_future(dispatcher.wait_for_tasks(['QUEUE'], snapshot, timeout=1))
+    await asyncio.sleep(0.01)
+    await dispatcher.apply_tasks([TaskIn(task={}, queue_name='QUEUE')])
+    assert await waiting
+    assert await repository.fetch_queue_versions(['QUEUE']) == {'QUEUE': 1}
+
+
+@pytest.mark.asyncio
+async def test_if_dispatcher_woken_up_by_released_children():
+    repository = _repository()
+    dispatcher = TasksDispatcher(repository=repository)
+    [parent] = await repository.insert_tasks([TaskRowIn(task={}, queue_name='QUEUE')])
+    await repository.insert_tasks([
+        TaskRowIn(task={}, queue_name='CHILD', depend_on=parent.uuid),
+    ])
+    snapshot = await dispatcher.snapshot_queues(['CHILD'])
+    waiting = asyncio.ensure_future(dispatcher.wait_for_tasks(
+        ['CHILD'], snapshot, timeout=1, check_interval_seconds=1))
+    await asyncio.sleep(0.01)
+    await repository.delete_tasks([parent.uuid])
+    assert await asyncio.wait_for(waiting, timeout=0.1)
+
+
+@pytest.mark.asyncio
+async def test_if_sharded_over_sqlite_databases(tmp_path):
+    topic_name = random_string_lower()
+    repository = ShardedTaskRepository(
+        shards=[
+            SQLiteTaskRepository(path=str(tmp_path / f'shard_{index}.db'), topic_name=topic_name)
+            for index in range(2)
+        ],
+        topic_name=topic_name,
+        shard_claim=ShardClaim.PARALLEL,
+    )
+    await repository.initialize()
+    [parent] = await repository.insert_tasks([TaskRowIn(task={}, queue_name='QUEUE')])
+    await repository.insert_tasks([
+        TaskRowIn(task={}, queue_name='QUEUE', depend_on=parent.uuid),
+        TaskRowIn(task={}, queue_name='QUEUE'),
+    ])
+
+    tasks = await repository.fetch_tasks(10, 'QUEUE', check_term_seconds=30)
+    assert len(tasks) == 2
+    await repository.delete_tasks([task.uuid for task in tasks])
+    tasks = await repository.fetch_tasks(10, 'QUEUE', check_term_seconds=30)
+    assert [shard_of(task.uuid) for task in tasks] == [shard_of(parent.uuid)]
+    for shard in repository.shards:
+        await shard.close()
@@ -0,0 +1,73 @@
+import asyncio
+import uuid
+from typing import List, Dict
+
+import pytest
+
+from jasyncq import stats
+from jasyncq.repository.abstract import _lag_seconds
+from jasyncq.repository.model.stats import QueueStats, StatsMode
+from jasyncq.util import uuid7
+
+from tests.util import random_string_lower
+
+
+class FakeStats:
+    def __init__(self):
+        self.calls: List[List[str]] = []
+
+    async def fetch(self, queue_names: List[str]) -> Dict[str, QueueStats]:
+        self.calls.append(queue_names)
+        await asyncio.sleep(0.01)
+        return {
+            queue_name: QueueStats(queue_name=queue_name, waiting=len(self.calls))
+            for queue_name in queue_names
+        }
+
+
+@pytest.mark.asyncio
+async def test_if_concurrent_readers_share_one_fetch():
+    fake = FakeStats()
+    table_name = random_string_lower()
+    results = await asyncio.gather(*[
+        stats.fetch(table_name, ['a', 'b'], StatsMode.EXACT, fake.fetch, 60),
+        stats.fetch(table_name, ['b'], StatsMode.EXACT, fake.fetch, 60),
+    ])
+    assert fake.calls == [['a', 'b']]
+    assert results[1]['b'].waiting == 1
+
+    # NOTE: Only queues not cached yet are fetched
+    result = await stats.fetch(table_name, ['a', 'c'], StatsMode.EXACT, fake.fetch, 60)
+    assert fake.calls == [['a', 'b'], ['c']]
+    assert (result['a'].waiting, result['c'].waiting) == (1, 2)
+
+
+@pytest.mark.asyncio
+async def test_if_stale_stats_fetched_again():
+    fake = FakeStats()
+    table_name = random_string_lower()
+    await stats.fetch(table_name, ['a'], StatsMode.APPROXIMATE, fake.fetch, 0.01)
+    await stats.fetch(table_name, ['a'], StatsMode.EXACT, fake.fetch, 0.01)
+    await asyncio.sleep(0.02)
+    result = await stats.fetch(table_name, ['a'], StatsMode.APPROXIMATE, fake.fetch, 0.01)
+    assert len(fake.calls) == 3
+    assert result['a'].waiting == 3
+
+
+@pytest.mark.asyncio
+async def test_if_stale_stats_evicted():
+    fake = FakeStats()
+    table_name = random_string_lower()
+    key = (table_name, StatsMode.EXACT)
+    await stats.fetch(table_name, ['a', 'b'], StatsMode.EXACT, fake.fetch, 0.01)
+    await asyncio.sleep(0.02)
+    await stats.fetch(table_name, ['c'], StatsMode.EXACT, fake.fetch, 0.01)
+    assert set(stats._cache[key]) == {'c'}
+
+
+def test_lag_seconds():
+    assert _lag_seconds(100, uuid.uuid4().bytes, 130) == 30
+    assert _lag_seconds(0, uuid.uuid4().bytes, 130) == 0
+    assert _lag_seconds(200, uuid.uuid4().bytes, 130) == 0
+    task_id = uuid7()
+    assert _lag_seconds(0, task_id.bytes, (task_id.int >> 80) / 1000 + 5) == pytest.approx(5)
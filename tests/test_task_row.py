@@ -0,0 +1,51 @@
+import json
+from uuid import UUID
+
+from jasyncq.dispatcher.tasks import _task_out
+from jasyncq.repository.model.task import TaskStatus, TaskRow
+from jasyncq.repository.tasks import TaskRepository
+from jasyncq.util import uuid7
+
+
+def test_if_raw_row_converted_to_task_row():
+    repository = TaskRepository(pool=None, topic_name='test_topic')
+    task_id, parent_id = uuid7(), uuid7()
+    task_row = repository._task_row((
+        task_id.bytes, int(TaskStatus.QUEUED), 0, 10, 1, json.dumps({'id': 1}).encode(),
+        'queue', parent_id.bytes, 0, 2, 3, 'key',
+    ))
+    assert task_row == TaskRow(
+        uuid=str(task_id),
+        status=TaskStatus.QUEUED,
+        progressed_at=0,
+        scheduled_at=10,
+        priority=1,
+        task={'id': 1},
+        queue_name='queue',
+        depend_on=str(parent_id),
+        attempts=2,
+        max_attempts=3,
+        dedup_key='key',
+    )
+    assert task_row.status is TaskStatus.QUEUED
+
+
+def test_if_task_row_converted_to_task_out():
+    task_id = uuid7()
+    task_out = _task_out(TaskRow(
+        uuid=str(task_id),
+        status=TaskStatus.QUEUED,
+        progressed_at=0,
+        scheduled_at=10,
+        priority=0,
+        task={'id': 1},
+        queue_name='queue',
+    ))
+    assert task_out.uuid == task_id
+    assert isinstance(task_out.uuid, UUID)
+    assert task_out.depend_on is None
+    assert task_out.dict() == {
+        'uuid': task_id, 'scheduled_at': 10, 'task': {'id': 1}, 'queue_name': 'queue',
+        'depend_on': None, 'priority': 0, 'attempts': 0, 'max_attempts': 0,
+        'dedup_key': None,
+    }
@@ -0,0 +1,32 @@
+import time
+import uuid
+
+from jasyncq.util import uuid7, uuid7_epoch
+
+
+def test_if_version_7():
+    assert uuid7().version == 7
+
+
+def test_if_time_ordered():
+    earlier = uuid7()
+    time.sleep(0.002)
+    later = uuid7()
+    assert earlier.bytes < later.bytes
+
+
+def test_if_unique():
+    assert len({uuid7() for _ in range(1000)}) == 1000
+
+
+def test_if_creation_time_read_from_uuid7():
+    before = time.time()
+    created_at = uuid7_epoch(uuid7().bytes)
+    assert before - 0.001 <= created_at <= time.time()
+    assert uuid7_epoch(uuid.uuid4().bytes) is None
+
+
+def test_if_monotonic_within_millisecond():
+    task_ids = [uuid7() for _ in range(10000)]
+    assert [task_id.bytes for task_id in task_ids] == sorted(task_id.bytes for task_id in task_ids)
+    assert all(task_id.version == 7 and task_id.variant == uuid.RFC_4122 for task_id in task_ids)
@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+from jasyncq import wakeup
+
+
+@pytest.mark.asyncio
+async def test_if_notified_while_waiting():
+    since = wakeup.version('test_topic', ['A'])
+    waiting = asyncio.ensure_future(wakeup.wait('test_topic', ['A', 'B'], since, timeout=1))
+    await asyncio.sleep(0.01)
+    wakeup.notify('test_topic', ['B'])
+    assert await waiting
+
+
+@pytest.mark.asyncio
+async def test_if_notified_before_waiting():
+    since = wakeup.version('test_topic', ['C'])
+    wakeup.notify('test_topic', ['C'])
+    assert await wakeup.wait('test_topic', ['C'], since, timeout=0.01)
+
+
+@pytest.mark.asyncio
+async def test_if_other_queue_notified():
+    since = wakeup.version('test_topic', ['D'])
+    wakeup.notify('test_topic', ['E'])
+    wakeup.notify('other_topic', ['D'])
+    assert not await wakeup.wait('test_topic', ['D'], since, timeout=0.01)
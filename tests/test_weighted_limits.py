@@ -0,0 +1,21 @@
+import pytest
+
+from jasyncq.repository.tasks import _weighted_limits
+
+
+def test_if_limit_shared_by_weights():
+    assert _weighted_limits({'a': 3, 'b': 1}, 8, 0) == {'a': 6, 'b': 2}
+    assert sum(_weighted_limits({'a': 2, 'b': 1, 'c': 1}, 10, 0).values()) == 10
+
+
+def test_if_small_queues_not_starved():
+    claimed = {'a': 0, 'b': 0, 'c': 0, 'd': 0}
+    for rotation in range(4):
+        for queue_name, limit in _weighted_limits(dict.fromkeys(claimed, 1), 1, rotation).items():
+            claimed[queue_name] += limit
+    assert claimed == {'a': 1, 'b': 1, 'c': 1, 'd': 1}
+
+
+def test_if_non_positive_weight_rejected():
+    with pytest.raises(ValueError):
+        _weighted_limits({'a': 1, 'b': 0}, 10, 0)
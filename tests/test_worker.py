@@ -0,0 +1,341 @@
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from typing import List, Dict
+
+import pytest
+
+from jasyncq.dispatcher.model.task import TaskOut, TaskIn
+from jasyncq.dispatcher.tasks import TasksDispatcher
+from jasyncq.dispatcher.worker import Worker
+from jasyncq.repository.memory import MemoryTaskRepository
+
+
+class FakeDispatcher:
+    def __init__(self, tasks: List[TaskOut]):
+        self.queued = list(tasks)
+        self.completed = []
+        self.claimed_count = 0
+        self.heartbeats = []
+        self.failed = []
+        self.pinned = False
+        self.pinned_claims = 0
+        self.completion_failures = 0
+
+    @asynccontextmanager
+    async def pin_claim_connection(self):
+        self.pinned = True
+        try:
+            yield
+        finally:
+            self.pinned = False
+
+    async def fetch_tasks_from_queues(
+        self,
+        queue_weights: Dict[str, int],
+        limit: int,
+        **kwargs,
+    ) -> List[TaskOut]:
+        self.claimed_count += 1
+        self.pinned_claims += self.pinned
+        fetched = [task for task in self.queued if task.queue_name in queue_weights][:limit]
+        for task in fetched:
+            self.queued.remove(task)
+        return fetched
+
+    async def complete_tasks(self, task_ids: List[str]):
+        if self.completion_failures:
+            self.completion_failures -= 1
+            raise ConnectionError()
+        self.completed.extend(task_ids)
+
+    async def heartbeat_tasks(self, task_ids: List[str], lease_seconds: int):
+        self.heartbeats.append((sorted(task_ids), lease_seconds))
+
+    async def fail_tasks(
+        self,
+        task_ids: List[str],
+        base_delay_seconds: int,
+        max_delay_seconds: int,
+    ):
+        self.failed.append((task_ids, base_delay_seconds, max_delay_seconds))
+
+    async def snapshot_queues(self, queue_names: List[str]):
+        return {}, len(self.queued)
+
+    async def wait_for_tasks(
+        self,
+        queue_names: List[str],
+        snapshot,
+        timeout: float,
+        **kwargs,
+    ) -> bool:
+        for _ in range(int(timeout / 0.01)):
+            if len(self.queued) != snapshot[1]:
+                return True
+            await asyncio.sleep(0.01)
+        return False
+
+
+def _task(queue_name: str) -> TaskOut:
+    return TaskOut(uuid=uuid.uuid4(), scheduled_at=0, task={}, queue_name=queue_name)
+
+
+@pytest.mark.asyncio
+async def test_if_worker_runs_and_completes_tasks_of_each_queue():
+    tasks = [_task('A') for _ in range(5)] + [_task('B') for _ in range(5)]
+    dispatcher = FakeDispatcher(tasks)
+    handled = []
+
+    async def handle(task: TaskOut):
+        handled.append(task.uuid)
+
+    worker = Worker(dispatcher, handlers={'A': handle, 'B': handle}, min_idle_seconds=0.01)
+    running = asyncio.ensure_future(worker.run(handle_signals=False))
+    await asyncio.sleep(0.1)
+    worker.stop()
+    await running
+
+    assert set(handled) == {task.uuid for task in tasks}
+    assert set(dispatcher.completed) == {str(task.uuid) for task in tasks}
+
+
+@pytest.mark.asyncio
+async def test_if_worker_caps_in_flight_tasks():
+    dispatcher = FakeDispatcher([_task('A') for _ in range(20)])
+    in_flight = 0
+    max_in_flight = 0
+
+    async def handle(task: TaskOut):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+    worker = Worker(dispatcher, handlers={'A': handle}, concurrency=3, min_idle_seconds=0.01)
+    running = asyncio.ensure_future(worker.run(handle_signals=False))
+    await asyncio.sleep(0.2)
+    worker.stop()
+    await running
+
+    assert max_in_flight == 3
+    assert len(dispatcher.completed) == 20
+
+
+@pytest.mark.asyncio
+async def test_if_failed_task_is_not_completed():
+    task = _task('A')
+    dispatcher = FakeDispatcher([task])
+
+    async def handle(_: TaskOut):
+        raise ValueError()
+
+    worker = Worker(
+        dispatcher,
+        handlers={'A': handle},
+        min_idle_seconds=0.01,
+        retry_base_seconds=5,
+        retry_max_seconds=60,
+    )
+    running = asyncio.ensure_future(worker.run(handle_signals=False))
+    await asyncio.sleep(0.05)
+    worker.stop()
+    await running
+
+    assert dispatcher.completed == []
+    assert dispatcher.failed == [([str(task.uuid)], 5, 60)]
+
+
+@pytest.mark.asyncio
+async def test_if_stop_waits_running_tasks():
+    dispatcher = FakeDispatcher([_task('A')])
+    started = asyncio.Event()
+
+    async def handle(_: TaskOut):
+        started.set()
+        await asyncio.sleep(0.05)
+
+    worker = Worker(dispatcher, handlers={'A': handle}, min_idle_seconds=0.01)
+    running = asyncio.ensure_future(worker.run(handle_signals=False))
+    await started.wait()
+    worker.stop()
+    await running
+
+    assert len(dispatcher.completed) == 1
+
+
+@pytest.mark.asyncio
+async def test_if_idle_worker_backs_off():
+    dispatcher = FakeDispatcher([])
+
+    async def handle(_: TaskOut):
+        pass
+
+    worker = Worker(
+        dispatcher, handlers={'A': handle}, min_idle_seconds=0.01, max_idle_seconds=0.08)
+    running = asyncio.ensure_future(worker.run(handle_signals=False))
+    await asyncio.sleep(0.5)
+    worker.stop()
+    await running
+
+    # Without backoff, it would be claimed about 50 times
+    assert dispatcher.claimed_count < 15
+
+
+class CountingRepository(MemoryTaskRepository):
+    def __init__(self):
+        super().__init__()
+        self.queries = 0
+
+    async def fetch_tasks_from_queues(self, *args, **kwargs):
+        self.queries += 1
+        return await super().fetch_tasks_from_queues(*args, **kwargs)
+
+    async def fetch_queue_versions(self, queue_names: List[str]) -> Dict[str, int]:
+        self.queries += 1
+        return await super().fetch_queue_versions(queue_names)
+
+
+@pytest.mark.asyncio
+async def test_if_idle_worker_queries_once_per_idle_period():
+    repository = CountingRepository()
+
+    async def handle(_: TaskOut):
+        pass
+
+    worker = Worker(
+        TasksDispatcher(repository),
+        handlers={'A': handle},
+        min_idle_seconds=0.01,
+        max_idle_seconds=0.2,
+        wakeup_check_seconds=0.01,
+    )
+    running = asyncio.ensure_future(worker.run(handle_signals=False))
+    await asyncio.sleep(0.5)  # Backed off to max idle
+    queries = repository.queries
+    await asyncio.sleep(1)
+    worker.stop()
+    await running
+
+    # NOTE: One claim and one version check per 0.2s, checking every 0.01s would be 100 queries
+    assert repository.queries - queries <= 12
+
+
+@pytest.mark.asyncio
+async def test_if_idle_worker_wakes_up_by_applied_tasks():
+    dispatcher = FakeDispatcher([])
+    handled = asyncio.Event()
+
+    async def handle(_: TaskOut):
+        handled.set()
+
+    worker = Worker(dispatcher, handlers={'A': handle}, min_idle_seconds=0.01, max_idle_seconds=10)
+    running = asyncio.ensure_future(worker.run(handle_signals=False))
+    await asyncio.sleep(0.3)  # Backed off long enough
+    dispatcher.queued.append(_task('A'))
+    await asyncio.wait_for(handled.wait(), timeout=1)
+    worker.stop()
+    await running
+
+
+@pytest.mark.asyncio
+async def test_if_leases_of_running_tasks_extended():
+    tasks = [_task('A') for _ in range(2)]
+    dispatcher = FakeDispatcher(tasks)
+    finishing = asyncio.Event()
+
+    async def handle(_: TaskOut):
+        await finishing.wait()
+
+    worker = Worker(
+        dispatcher,
+        handlers={'A': handle},
+        min_idle_seconds=0.01,
+        lease_seconds=10,
+        heartbeat_seconds=0.02,
+    )
+    assert worker.check_term_seconds == 0
+    running = asyncio.ensure_future(worker.run(handle_signals=False))
+    await asyncio.sleep(0.1)
+    finishing.set()
+    await asyncio.sleep(0.1)
+    heartbeat_count = len(dispatcher.heartbeats)
+    await asyncio.sleep(0.1)
+    worker.stop()
+    await running
+
+    assert dispatcher.heartbeats[0] == (sorted(str(task.uuid) for task in tasks), 10)
+    # NOTE: Completed tasks are not extended anymore
+    assert len(dispatcher.heartbeats) == heartbeat_count
+
+
+@pytest.mark.asyncio
+async def test_if_check_term_ignored_with_lease():
+    repository = MemoryTaskRepository()
+    dispatcher = TasksDispatcher(repository=repository)
+    await dispatcher.apply_tasks([TaskIn(task={}, queue_name='A')])
+    tasks = await dispatcher.fetch_tasks('A', 10, lease_seconds=60)
+    await repository.extend_leases([str(task.uuid) for task in tasks], lease_seconds=0)
+
+    assert await dispatcher.fetch_pending_tasks('A', 10) == []
+    assert len(await dispatcher.fetch_pending_tasks('A', 10, lease_seconds=60)) == 1
+    with pytest.warns(DeprecationWarning):
+        worker = Worker(dispatcher, handlers={}, check_term_seconds=30, lease_seconds=60)
+    assert worker.check_term_seconds == 0
+
+
+@pytest.mark.asyncio
+async def test_if_leases_extended_until_completions_flushed():
+    task = _task('A')
+    dispatcher = FakeDispatcher([task])
+    dispatcher.completion_failures = 1
+
+    async def handle(_: TaskOut):
+        pass
+
+    worker = Worker(
+        dispatcher,
+        handlers={'A': handle},
+        min_idle_seconds=0.01,
+        lease_seconds=10,
+        heartbeat_seconds=0.02,
+        ack_delay_seconds=0.05,
+    )
+    running = asyncio.ensure_future(worker.run(handle_signals=False))
+    # NOTE: First flush fails at 0.05s and is retried at 0.15s
+    await asyncio.sleep(0.12)
+    assert dispatcher.completed == []
+    assert dispatcher.heartbeats[-1] == ([str(task.uuid)], 10)
+    await asyncio.sleep(0.1)
+    assert dispatcher.completed == [str(task.uuid)]
+    heartbeat_count = len(dispatcher.heartbeats)
+    await asyncio.sleep(0.1)
+    worker.stop()
+    await running
+
+    assert len(dispatcher.heartbeats) == heartbeat_count
+
+
+@pytest.mark.asyncio
+async def test_if_worker_claims_with_pinned_connection():
+    dispatcher = FakeDispatcher([_task('A') for _ in range(5)])
+
+    async def handle(_: TaskOut):
+        pass
+
+    worker = Worker(
+        dispatcher,
+        handlers={'A': handle},
+        batch_size=2,
+        min_idle_seconds=0.01,
+        pin_claim_connection=True,
+    )
+    running = asyncio.ensure_future(worker.run(handle_signals=False))
+    await asyncio.sleep(0.1)
+    worker.stop()
+    await running
+
+    assert len(dispatcher.completed) == 5
+    assert dispatcher.pinned_claims == dispatcher.claimed_count >= 3
+    assert dispatcher.pinned is False